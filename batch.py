@@ -0,0 +1,150 @@
+import sys
+import os
+import csv
+import json
+import re
+import argparse
+import traceback
+from multiprocessing import Pool
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS
+from exporter import WRITERS, export_diagram
+from geocache import GeometryCache, default_root
+
+BOOL_KEYS = ('fianchi_r_active', 'testate_r_active', 'platform_active')
+SHAPE_KEYS = ('fianchi_shape', 'testate_shape')
+ID_KEYS = ('id', 'name')
+
+# Manager del processo worker: design consecutivi simili sfruttano la build incrementale
+_manager = None
+# Esportazione nel worker: (cartella, formato) o None
+_export = None
+# Cache su disco della geometria (condivisa tra i processi), o None
+_cache = None
+
+def init_worker(export, cache_dir=None):
+    global _export, _cache
+    _export = export
+    _cache = GeometryCache(cache_dir) if cache_dir else None
+
+def export_name(design_id):
+    return re.sub(r'[^\w.-]+', '_', str(design_id)) or 'design'
+
+def design_id(index, row):
+    return next((row[k] for k in ID_KEYS if row.get(k) not in (None, '')), index)
+
+def batch_jobs(designs):
+    """(indice, riga, nome del file di fustella) per design; nome None se un design precedente
+    ha gia' preso lo stesso nome (id ripetuto), cosi' nessun file ne sovrascrive un altro."""
+    taken = set()
+    for index, row in enumerate(designs):
+        name = export_name(design_id(index, row))
+        key = name.lower() # Anche su file system che non distinguono le maiuscole
+        yield index, row, None if key in taken else name
+        taken.add(key)
+
+def parse_bool(v):
+    if isinstance(v, str): return v.strip().lower() in ('1', 'true', 'yes', 'si', 'sì', 'y', 'x')
+    return bool(v)
+
+def parse_params(row):
+    """Parametri completi per BoxManager.build da una riga CSV/JSONL (chiavi mancanti = default)."""
+    p = dict(DEFAULT_PARAMS)
+    for k, v in row.items():
+        if k in ID_KEYS or v is None or v == '': continue
+        if k in BOOL_KEYS: p[k] = parse_bool(v)
+        elif k in SHAPE_KEYS:
+            v = str(v).strip().lower()
+            if v not in ('ferro', 'rect'): raise ValueError(f"{k}: forma sconosciuta '{v}'")
+            p[k] = v
+        elif k in DEFAULT_PARAMS: p[k] = float(v)
+        else: raise ValueError(f"parametro sconosciuto '{k}'")
+    return p
+
+def read_designs(path):
+    """Righe di parametri da CSV o JSONL (uno oggetto JSON per riga); '-' legge JSONL da stdin."""
+    if path == '-':
+        for line in sys.stdin:
+            if line.strip(): yield json.loads(line)
+        return
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.lower().endswith('.csv'):
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip(): yield json.loads(line)
+
+def diagram_record(polys, cuts, creases, glues):
+    """Risultato serializzabile di get_2d_diagram."""
+    return {
+        'polys': [{'id': q['id'], 'type': q['type'], 'coords': q['coords']} for q in polys],
+        'cut_lines': cuts,
+        'creases': creases,
+        'glue_lines': [{'segment': seg, 'nozzle': idx} for seg, idx in glues],
+    }
+
+def run_design(job):
+    """Eseguito nel worker: (indice, riga, nome del file) -> record JSON-serializzabile."""
+    global _manager
+    index, row, name = job
+    rec = {'index': index, 'id': design_id(index, row)}
+    try:
+        if _export and name is None: raise ValueError(f"id ripetuto '{rec['id']}': la fustella sovrascriverebbe quella di un altro design")
+        p = parse_params(row)
+        if _manager is None: _manager = BoxManager()
+        rec['params'] = p
+        if _cache: diagram = _cache.fetch(p, _manager).diagram # Se presente, niente build
+        else:
+            _manager.build(p)
+            diagram = _manager.get_2d_diagram(p)
+        rec.update(diagram_record(*diagram))
+        if _export:
+            folder, fmt = _export
+            rec['file'] = os.path.join(folder, f"{name}.{fmt}")
+            export_diagram(rec['file'], diagram, fmt)
+    except Exception as e:
+        _manager = None # Stato incerto: il prossimo design riparte da zero
+        rec['error'] = f"{type(e).__name__}: {e}"
+    return rec
+
+def run_batch(designs, out, jobs=None, chunksize=4, on_result=None, export=None, cache_dir=None):
+    """Genera i diagrammi su un pool di processi e scrive un record JSONL per design appena pronto.
+    export = (cartella, 'dxf'|'svg') scrive anche un file di fustella per design (id ripetuti: errore);
+    cache_dir = cartella della cache geometrica su disco (None: senza cache)."""
+    n_ok = n_err = 0
+    if export: os.makedirs(export[0], exist_ok=True)
+    with Pool(jobs, init_worker, (export, cache_dir)) as pool:
+        for rec in pool.imap_unordered(run_design, batch_jobs(designs), chunksize):
+            out.write(json.dumps(rec) + '\n')
+            out.flush()
+            if 'error' in rec: n_err += 1
+            else: n_ok += 1
+            if on_result: on_result(rec)
+    return n_ok, n_err
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generazione fustelle in batch (senza GUI).")
+    ap.add_argument('input', help="file .csv o .jsonl con un set di parametri per riga ('-' = JSONL da stdin)")
+    ap.add_argument('-o', '--output', default='-', help="file JSONL dei risultati ('-' = stdout)")
+    ap.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="processi worker (default: numero di core)")
+    ap.add_argument('--chunksize', type=int, default=4, help="design per invio al worker")
+    ap.add_argument('--export-dir', help="cartella in cui scrivere un file di fustella per design")
+    ap.add_argument('--format', choices=sorted(WRITERS), default='dxf', help="formato dei file esportati (default: dxf)")
+    ap.add_argument('--cache-dir', help="cartella della cache geometrica (default: $BOXCREATOR_CACHE o la cache utente)")
+    ap.add_argument('--no-cache', action='store_true', help="ricalcola tutto senza leggere ne' scrivere la cache")
+    args = ap.parse_args(argv)
+    cache_dir = None if args.no_cache else (args.cache_dir or default_root())
+    
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        n_ok, n_err = run_batch(read_designs(args.input), out, args.jobs, args.chunksize,
+                                 export=(args.export_dir, args.format) if args.export_dir else None, cache_dir=cache_dir)
+    except Exception:
+        traceback.print_exc(); return 2
+    finally:
+        if out is not sys.stdout: out.close()
+    print(f"{n_ok} design generati, {n_err} errori", file=sys.stderr)
+    return 1 if n_err else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
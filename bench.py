@@ -0,0 +1,310 @@
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import subprocess
+
+# Preset rappresentativi: scatola rettangolare, ferro di cavallo completo, platform con fascia divisa
+PRESETS = {
+    'rect': {'fianchi_shape': 'rect', 'fianchi_r_active': False, 'testate_shape': 'rect',
+             'testate_r_active': False, 'platform_active': False},
+    'ferro': {'fianchi_shape': 'ferro', 'fianchi_r_active': True, 'testate_shape': 'ferro',
+              'testate_r_active': True, 'platform_active': False},
+    'platform': {'fianchi_shape': 'ferro', 'fianchi_r_active': True, 'testate_shape': 'ferro',
+                 'testate_r_active': True, 'platform_active': True},
+}
+PCTS = (50, 90, 99)
+STARTUP_RUNS = 5 # Avvii a freddo misurati (interpreti nuovi)
+
+# Avvio a freddo in un interprete nuovo: nucleo senza GUI (come un worker batch) e finestra fino alla prima build
+STARTUP_CORE = '''
+import batch, sweep, nesting, geocache, exporter, contacts
+'''
+STARTUP_APP = '''
+import os, time
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PySide6.QtWidgets import QApplication
+app = QApplication([])
+import main
+w = main.PackagingApp(); w.show()
+while w.box_params is None: app.processEvents(); time.sleep(0.001)
+'''
+STARTUP_REPORT = '''
+import sys, json
+try: # VmHWM e' del processo; ru_maxrss su Linux eredita il picco del genitore attraverso fork/exec
+    with open('/proc/self/status') as f: kb = int(next(l for l in f if l.startswith('VmHWM')).split()[1]) * 1024
+except OSError:
+    import resource
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+print(json.dumps({'rss_mib': round(kb / 1024 / 1024, 1),
+                  'qt_gl': sorted({m.split('.')[0] for m in sys.modules} & {'PySide6', 'OpenGL'})}))
+sys.stdout.flush(); os._exit(0)
+'''
+
+def preset_params(name):
+    from geometry_oop import DEFAULT_PARAMS
+    return dict(DEFAULT_PARAMS, **PRESETS[name])
+
+def percentiles(samples):
+    s = sorted(samples); n = len(s)
+    res = {f"p{q}": s[min(n-1, int(q/100*n))] for q in PCTS}
+    res.update(min=s[0], max=s[-1], mean=sum(s)/n)
+    return res
+
+def measure(fn, repeat, warmup=3, alloc_repeat=20, setup=None):
+    """Latenze (ms) su repeat chiamate, poi memoria con tracemalloc su un passaggio separato
+    (tracemalloc rallenta: i tempi non lo includono)."""
+    for _ in range(warmup):
+        if setup: setup()
+        fn()
+    gc.collect(); gc.disable()
+    times = []
+    try:
+        for _ in range(repeat):
+            if setup: setup()
+            t = time.perf_counter_ns(); fn(); times.append((time.perf_counter_ns() - t) / 1e6)
+    finally: gc.enable()
+
+    peaks, kept = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(min(repeat, alloc_repeat)):
+            if setup: setup()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn()
+            cur, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base); kept.append(cur - base)
+    finally: tracemalloc.stop()
+    res = {'n': repeat, 'ms': percentiles(times)}
+    res['alloc_peak_kib'] = round(sorted(peaks)[len(peaks)//2] / 1024, 2) # Picco transitorio per chiamata (mediana)
+    res['alloc_kept_kib'] = round(sorted(kept)[len(kept)//2] / 1024, 2)   # Memoria ancora allocata dopo la chiamata
+    return res
+
+def bench_geometry(name, repeat):
+    """Operazioni di BoxManager e round_poly su un preset."""
+    import geometry_oop as g
+    p = preset_params(name)
+    m = g.BoxManager(); m.build(p)
+    out = {}
+    out['build_full'] = measure(lambda: g.BoxManager().build(p), repeat)
+
+    # Modifica di un solo parametro (F): ricostruzione incrementale
+    alt = [dict(p, F=p['F']), dict(p, F=p['F'] + 1)]
+    it = iter(range(1 << 62))
+    out['build_edit_F'] = measure(lambda: m.build(alt[next(it) & 1]), repeat)
+    m.build(p)
+
+    out['get_mesh'] = measure(m.get_mesh, repeat)
+    def drop_diagram(): m._diagram = None
+    out['get_2d_diagram'] = measure(lambda: m.get_2d_diagram(p), repeat, setup=drop_diagram)
+    # Misure di produzione in forma chiusa (senza la cache per build) e il diagramma completo piu' misure
+    def drop_metrics(): m._metrics = None
+    out['metrics'] = measure(lambda: m.metrics(p), repeat, setup=drop_metrics)
+    out['diagram_metrics'] = measure(lambda: g.diagram_metrics(m.get_2d_diagram(p)), repeat, setup=drop_diagram)
+
+    # Cache su disco in una cartella temporanea: scrittura di una voce, lettura (mmap) e diagramma ricostruito
+    import tempfile, geocache
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = geocache.GeometryCache(tmp)
+        out['geocache_put'] = measure(lambda: cache.put(p, m), repeat)
+        out['geocache_hit'] = measure(lambda: cache.get(p).diagram, repeat)
+
+    frames = g.fold_all_schedule()[0]
+    fi = iter(range(1 << 62))
+    out['set_angles'] = measure(lambda: m.set_angles(frames[next(fi) % len(frames)]), repeat)
+    out['pose_cache_build'] = measure(lambda: g.PoseCache(m, frames), repeat)
+    poses = g.PoseCache(m, frames)
+    out['pose_apply'] = measure(lambda: poses.apply(next(fi) % len(frames)), repeat)
+    m.set_angles({})
+
+    outlines = [n.outline for n in m.index.nodes]
+    out['round_poly_cold'] = measure(lambda: g.round_polys(outlines), repeat, setup=g._round_cache.clear)
+    out['round_poly_warm'] = measure(lambda: [g.round_poly(o) for o in outlines], repeat)
+    out['round_poly_cold']['polys'] = out['round_poly_warm']['polys'] = len(outlines)
+    return out
+
+def egl_context(w, h):
+    """Contesto OpenGL Mesa senza display (EGL surfaceless) con un FBO w x h. Da chiamare prima di importare OpenGL."""
+    import ctypes
+    os.environ['PYOPENGL_PLATFORM'] = 'egl'
+    from OpenGL import EGL
+    from OpenGL import GL
+    get_dpy = EGL.eglGetProcAddress(b'eglGetPlatformDisplayEXT')
+    proto = ctypes.CFUNCTYPE(EGL.EGLDisplay, ctypes.c_uint, ctypes.c_void_p, ctypes.c_void_p)
+    dpy = proto(get_dpy)(0x31DD, None, None) # EGL_PLATFORM_SURFACELESS_MESA
+    if not EGL.eglInitialize(dpy, None, None): raise RuntimeError("EGL non disponibile")
+    cfg, n = EGL.EGLConfig(), EGL.EGLint()
+    attrs = (EGL.EGLint * 9)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                             EGL.EGL_DEPTH_SIZE, 24, EGL.EGL_RED_SIZE, 8, EGL.EGL_NONE)
+    EGL.eglChooseConfig(dpy, attrs, ctypes.pointer(cfg), 1, ctypes.pointer(n))
+    EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+    ctx = EGL.eglCreateContext(dpy, cfg, EGL.EGL_NO_CONTEXT, None)
+    if not ctx or not EGL.eglMakeCurrent(dpy, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, ctx):
+        raise RuntimeError("contesto EGL non creato")
+    fbo = GL.glGenFramebuffers(1); GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, fbo)
+    rb = GL.glGenRenderbuffers(2)
+    for buf, fmt, att in ((rb[0], GL.GL_RGBA8, GL.GL_COLOR_ATTACHMENT0), (rb[1], GL.GL_DEPTH_COMPONENT24, GL.GL_DEPTH_ATTACHMENT)):
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, buf); GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, fmt, w, h)
+        GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, att, GL.GL_RENDERBUFFER, buf)
+    GL.glViewport(0, 0, w, h)
+    return GL.glGetString(GL.GL_RENDERER).decode()
+
+def make_app(p):
+    """PackagingApp senza display (piattaforma Qt offscreen) con la geometria di p gia' applicata."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    import main
+    w = main.PackagingApp()
+    w.executor.submit(lambda: None).result(); app.processEvents() # Scarica la build iniziale
+    w.job_seq += 1; w.compute_geometry(p, w.job_seq)
+    w.ensure_tree() # Dopo un colpo della cache l'albero si costruisce qui
+    return app, w
+
+def bench_app(name, repeat, render):
+    """update_frame/record_traces e FPS del programma completo di anim_all."""
+    p = preset_params(name)
+    app, w = make_app(p)
+    v = w.ensure_viewer() # La vista 3D si crea solo alla prima apertura della scheda
+    if render:
+        from OpenGL.GL import glFinish
+        v.update = lambda *a: None # Niente repaint Qt: paintGL si chiama a mano sul FBO EGL
+        v.initializeGL(); v.resizeGL(*render)
+    out = {}
+
+    # record_traces in una posa in cui i lembi vengono spinti dai fianchi
+    w.scrub(w.all_pushing.index(True) + 20)
+    out['record_traces'] = measure(w.record_traces, repeat, setup=w.reset_traces)
+    g = w.anim_vars['frame']
+    out['record_traces_sweep'] = measure(lambda: w.record_traces(g, (w.all_frames[g-1], w.all_frames[g])), repeat, setup=w.reset_traces)
+
+    # Tela 2D: preparazione dei layer e repaint su un'immagine 1200 x 800, adattata e ingrandita
+    from PySide6.QtGui import QImage
+    c = w.canvas_2d; c.resize(1200, 800)
+    img = QImage(1200, 800, QImage.Format_ARGB32_Premultiplied)
+    diagram = w.box_manager.get_2d_diagram(p)
+    out['canvas_set_data'] = measure(lambda: c.set_data(*diagram, p['L'], p['W'], 0, 0, 0), repeat)
+    out['canvas_paint'] = measure(lambda: c.render(img), repeat)
+    c.zoom = 8.0 # Dettaglio: solo le celle visibili
+    out['canvas_paint_zoom8'] = measure(lambda: c.render(img), repeat)
+    c.reset_view()
+
+    def run_anim():
+        w.anim_all(); w.timer.stop()
+        times = []
+        while w.anim_vars['active']:
+            t = time.perf_counter_ns()
+            w.update_frame()
+            if render: v.paintGL(); glFinish()
+            times.append((time.perf_counter_ns() - t) / 1e6)
+        return times
+
+    run_anim() # Riscaldamento (cache di hinge/pannelli)
+    frames, total = [], 0.0
+    for _ in range(max(1, repeat // 100)):
+        t = time.perf_counter(); ft = run_anim(); total += time.perf_counter() - t
+        frames += ft
+    out['update_frame+paintGL' if render else 'update_frame'] = {'n': len(frames), 'ms': percentiles(frames)}
+    out['anim_all'] = {'frames': len(frames), 'fps': round(len(frames) / total, 1), 'render': bool(render)}
+
+    if render:
+        # Solo la vista 3D durante la piega: vertex shader (uniform degli angoli) o matrici e cerniere dalla CPU
+        fi = iter(range(1 << 62))
+        def fold_paint():
+            v.update_angles(w.all_frames[next(fi) % len(w.all_frames)]); v.paintGL(); glFinish()
+        for gpu in (True, False):
+            v.set_gpu_fold(gpu); v.upload_scene()
+            out['paint_fold_gpu' if gpu else 'paint_fold_cpu'] = measure(fold_paint, repeat)
+        v.set_gpu_fold(True)
+    w.close()
+    return out
+
+def bench_startup(app):
+    """Tempo di avvio (processo intero) e RSS di picco del nucleo geometrico e, se app, della finestra."""
+    out = {}
+    cases = [('start_core', STARTUP_CORE)] + ([('start_app', STARTUP_APP)] if app else [])
+    here = os.path.dirname(os.path.abspath(__file__))
+    for op, code in cases:
+        times, info = [], {}
+        for _ in range(STARTUP_RUNS):
+            t = time.perf_counter()
+            r = subprocess.run([sys.executable, '-c', 'import os\n' + code + STARTUP_REPORT], capture_output=True, text=True, cwd=here)
+            times.append((time.perf_counter() - t) * 1000)
+            if r.returncode: raise RuntimeError(f"{op}: {r.stderr.strip()}")
+            info = json.loads(r.stdout.strip().splitlines()[-1])
+        out[op] = {'n': len(times), 'ms': percentiles(times), **info}
+    return out
+
+def peak_rss_mib():
+    try: import resource
+    except ImportError: return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def meta():
+    import numpy
+    try: rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError: rev = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git': rev, 'python': platform.python_version(),
+            'numpy': numpy.__version__, 'machine': platform.machine(), 'system': platform.system(),
+            'cpu_count': os.cpu_count()}
+
+def compare(old, new):
+    """Tabella p50 nuovo/vecchio per le operazioni in comune."""
+    rows = []
+    for preset, ops in new['results'].items():
+        for op, r in ops.items():
+            o = old.get('results', {}).get(preset, {}).get(op)
+            if not o or 'ms' not in r or 'ms' not in o: continue
+            a, b = o['ms']['p50'], r['ms']['p50']
+            rows.append(f"{preset:10s} {op:21s} {a:10.3f} {b:10.3f} {b/a if a else float('nan'):7.2f}x")
+    return '\n'.join([f"{'preset':10s} {'op':21s} {'old p50':>10s} {'new p50':>10s} {'ratio':>8s}"] + rows)
+
+def report(res):
+    lines = [f"{'preset':10s} {'op':21s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'peak KiB':>9s}"]
+    for preset, ops in res['results'].items():
+        for op, r in ops.items():
+            if 'ms' not in r:
+                lines.append(f"{preset:10s} {op:21s} {r['fps']:9.1f} fps ({r['frames']} frame, render={r['render']})"); continue
+            ms = r['ms']
+            lines.append(f"{preset:10s} {op:21s} {ms['p50']:9.3f} {ms['p90']:9.3f} {ms['p99']:9.3f} "
+                         f"{r.get('alloc_peak_kib', ''):>9}" + (f"  RSS {r['rss_mib']} MiB {'+'.join(r['qt_gl'])}" if 'rss_mib' in r else ''))
+    lines.append(f"peak RSS: {res['peak_rss_mib']} MiB")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark dei percorsi critici di geometria e rendering (senza display).")
+    ap.add_argument('-o', '--output', help="file JSON dei risultati")
+    ap.add_argument('-n', '--repeat', type=int, default=200, help="chiamate misurate per operazione")
+    ap.add_argument('-p', '--preset', action='append', choices=sorted(PRESETS), help="preset (default: tutti)")
+    ap.add_argument('--no-app', action='store_true', help="salta PackagingApp (update_frame, record_traces, anim_all)")
+    ap.add_argument('--render', action='store_true', help="include paintGL nei frame di anim_all (EGL surfaceless, Mesa)")
+    ap.add_argument('--compare', help="JSON di una esecuzione precedente da confrontare")
+    args = ap.parse_args(argv)
+
+    size = None
+    res = {'meta': meta(), 'results': {}}
+    if args.render and not args.no_app:
+        size = (640, 480)
+        res['meta']['renderer'] = egl_context(*size)
+    for name in args.preset or list(PRESETS):
+        r = res['results'][name] = bench_geometry(name, args.repeat)
+        if not args.no_app: r.update(bench_app(name, args.repeat, size))
+    res['results']['startup'] = bench_startup(not args.no_app)
+    res['peak_rss_mib'] = peak_rss_mib()
+
+    print(report(res))
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f: print('\n' + compare(json.load(f), res))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f: json.dump(res, f, indent=1)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
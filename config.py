@@ -1,5 +1,4 @@
-from PySide6.QtGui import QColor
-
+# Solo dati: importabile dal nucleo geometrico e dall'esportatore senza Qt
 THEME = {
     "bg_ui": "#121212",
     "bg_panel": "#3C3F41",
@@ -0,0 +1,120 @@
+import math
+import numpy as np
+
+TRACE_Z_TOL = 10.0  # Distanza massima della punta da una delle due facce del pannello (mm)
+TRACE_Y_OVER = 10.0 # Tolleranza oltre il bordo di piega del pannello (mm)
+TRACE_MIN_STEP = 2.0 # Distanza minima tra due punti consecutivi di una traccia (mm)
+SWEEP_MAX_STEPS = 64 # Sotto-passi massimi della modalita' continua per fotogramma
+
+class TraceEngine:
+    """Contatti punta-lembo / fianco per le tracce di sfregamento.
+    I fianchi hanno un AABB in coordinate mondo della regione di contatto, aggiornato solo quando
+    cambia il loro angolo; le punte si confrontano con gli AABB in blocco e il test esatto
+    (coordinate locali del pannello) si fa solo sulle coppie candidate."""
+
+    def __init__(self, manager):
+        self.manager, self.revision = manager, manager.revision
+        # Stessa selezione di sempre: per nome (l'ultimo nodo vince), lembi per etichetta, fianchi anche per nome
+        parts = {name: nodes[-1] for name, nodes in manager.index.by_name.items()}
+        self.parts = parts
+        self.lembi = [n for n in parts.values() if n.label == 'lembi']
+        self.fianchi = [n for n in parts.values() if n.label == 'fianchi' or n.name.startswith('Fianco')]
+
+        # Punte dei lembi in coordinate locali: (M, 2, 4) omogenee
+        self.tips = np.array([[(l.width/2, -l.height, 0, 1), (-l.width/2, -l.height, 0, 1)] for l in self.lembi]).reshape(-1, 2, 4)
+        # Regione di contatto di ogni fianco in locale: x, y, z min/max
+        self.region = np.array([((-f.width/2, -f.height, -f.thickness - TRACE_Z_TOL), (f.width/2, TRACE_Y_OVER, TRACE_Z_TOL))
+                                for f in self.fianchi]).reshape(-1, 2, 3)
+        self.tips_t = self.tips.transpose(0, 2, 1).copy() # (M, 4, 2) per il prodotto in blocco
+        self.dims = np.array([(f.width/2, f.height, f.thickness) for f in self.fianchi]).reshape(-1, 3)
+        self.corners = np.array([[(x, y, z, 1) for x in r[:, 0] for y in r[:, 1] for z in r[:, 2]] for r in self.region]).reshape(-1, 8, 4)
+        self.frames = np.zeros((len(self.fianchi), 4, 4))
+        self.boxes = np.zeros((len(self.fianchi), 2, 3))
+        self.frame_angles = [None] * len(self.fianchi)
+        self.chains = {}
+
+    def valid(self, manager):
+        return manager is self.manager and manager.revision == self.revision
+
+    def update_boxes(self):
+        """Riferimento e AABB mondo dei fianchi il cui angolo e' cambiato."""
+        for k, f in enumerate(self.fianchi):
+            if self.frame_angles[k] == f.fold_angle: continue
+            self.frame_angles[k] = f.fold_angle
+            # Riferimento del pannello usato da sempre per le tracce: la sua matrice di piega rispetto al padre
+            # (per i fianchi, agganciati al fondo, coincide con quella mondo)
+            self.frames[k] = f._local_matrix(f.fold_angle)
+            w = self.corners[k] @ self.frames[k].T
+            self.boxes[k, 0] = w[:, :3].min(axis=0); self.boxes[k, 1] = w[:, :3].max(axis=0)
+
+    def tip_positions(self):
+        """Punte dei lembi in coordinate mondo nella posa corrente: (M, 2, 3)."""
+        if not self.lembi: return np.zeros((0, 2, 3))
+        worlds = np.array([l.world_matrix()[:3] for l in self.lembi])
+        return np.matmul(worlds, self.tips_t).transpose(0, 2, 1)
+
+    def contacts(self, tips_world=None, frames=None, boxes=None):
+        """Contatti nella posa corrente (o per punte/riferimenti dati): [((fianco, lembo, punta), p_locale)],
+        nell'ordine lembo, punta, fianco."""
+        if tips_world is None:
+            self.update_boxes()
+            tips_world, frames, boxes = self.tip_positions(), self.frames, self.boxes
+        if not len(tips_world) or not len(frames): return []
+        # Fase larga: punte contro AABB
+        pts = tips_world.reshape(-1, 1, 3)
+        pi, k = np.nonzero(((pts >= boxes[:, 0]) & (pts <= boxes[:, 1])).all(axis=2))
+        if not len(pi): return []
+        # Fase stretta sulle sole coppie candidate: R^T (p - t) nel riferimento del pannello
+        m = frames[k]
+        loc = np.einsum('ni,nij->nj', pts[pi, 0] - m[:, :3, 3], m[:, :3, :3])
+        x, y, z = loc.T
+        hw, h, T = self.dims[k].T
+        ok = (np.abs(z) < TRACE_Z_TOL) | (np.abs(z + T) < TRACE_Z_TOL)
+        ok &= (-hw <= x) & (x <= hw) & (-h <= y) & (y <= TRACE_Y_OVER)
+        return [((self.fianchi[kk].name, self.lembi[p >> 1].name, p & 1), tuple(l))
+                for p, kk, l in zip(pi[ok].tolist(), k[ok].tolist(), loc[ok].tolist())]
+
+    def chain(self, n):
+        """Nodi dalla radice a n (per ricostruire le matrici a angoli intermedi)."""
+        c = self.chains.get(n)
+        if c is None:
+            c, p = [], n
+            while p is not None: c.append(p); p = p.parent
+            c = self.chains[n] = c[::-1]
+        return c
+
+    def chain_matrices(self, n, angles, local_only=False):
+        """Matrici (S, 4, 4) di n per S pose date come dizionari di angoli."""
+        def local(node):
+            g = node.role
+            a = [ang.get(g, 0) for ang in angles] if g else [node.fold_angle] * len(angles)
+            return node._local_matrices(a)
+        if local_only: return local(n)
+        m = None
+        for node in self.chain(n):
+            l = local(node)
+            m = l if m is None else m @ l
+        return m
+
+    def sweep(self, a0, a1):
+        """Modalita' continua: contatti lungo il moto da angoli a0 ad a1, in ordine di tempo.
+        Gli angoli sono interpolati in sotto-passi tali che una punta si sposti al massimo di TRACE_MIN_STEP,
+        cosi' anche fotogrammi radi non perdono contatti."""
+        if not self.lembi or not self.fianchi: return []
+        keys = set(a0) | set(a1)
+        ends = [a0, a1]
+        lw = np.array([self.chain_matrices(l, ends) for l in self.lembi]) # (M, 2, 4, 4)
+        tips = np.einsum('msij,mtj->smti', lw, self.tips)[..., :3]
+        steps = min(SWEEP_MAX_STEPS, max(1, math.ceil(float(np.abs(tips[1] - tips[0]).max()) / TRACE_MIN_STEP)))
+
+        ts = np.arange(1, steps + 1) / steps
+        poses = [{k: a0.get(k, 0) + (a1.get(k, 0) - a0.get(k, 0)) * t for k in keys} for t in ts.tolist()]
+        lw = np.array([self.chain_matrices(l, poses) for l in self.lembi])
+        tips = np.einsum('msij,mtj->smti', lw, self.tips)[..., :3]
+        fw = np.array([self.chain_matrices(f, poses, local_only=True) for f in self.fianchi]) # (K, S, 4, 4)
+        wc = np.einsum('ksij,kcj->skci', fw, self.corners)[..., :3]
+        boxes = np.stack([wc.min(axis=2), wc.max(axis=2)], axis=2) # (S, K, 2, 3)
+
+        out = []
+        for s in range(steps): out += self.contacts(tips[s], fw[:, s], boxes[s])
+        return out
@@ -0,0 +1,195 @@
+import sys
+import json
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+
+from config import THEME
+
+# Layer di esportazione: nome -> (colore SVG, colore ACI DXF, tipo linea DXF); colori SVG da THEME
+LAYER_STYLE = {
+    'CUT': (THEME['line_cut'], 7, 'CONTINUOUS'),
+    'CREASE': (THEME['line_crease'], 3, 'DASHED'),
+}
+GLUE_COLORS = [(THEME[f'line_glue_{i+1}'], aci) for i, aci in enumerate((4, 6, 2, 3))]
+NUM_FMT = '.4f'
+
+def glue_layer(idx):
+    """Un layer per ugello: GLUE_1, GLUE_2, ... (come line_glue_N in THEME)."""
+    return f"GLUE_{idx+1}"
+
+def layer_style(name):
+    if name in LAYER_STYLE: return LAYER_STYLE[name]
+    svg, aci = GLUE_COLORS[(int(name.rsplit('_', 1)[1]) - 1) % len(GLUE_COLORS)]
+    return svg, aci, 'CONTINUOUS'
+
+def diagram_layers(polys, cut_lines, creases, glue_lines):
+    """Segmenti di get_2d_diagram raggruppati per layer, nell'ordine di disegno."""
+    yield 'CUT', cut_lines
+    yield 'CREASE', creases
+    for seg, idx in glue_lines: yield glue_layer(idx), (seg,)
+
+class DielineWriter(ABC):
+    """Base degli esportatori: le entita' vanno su file temporanei (memoria costante),
+    l'intestazione che dipende da layer ed estensione si scrive alla chiusura.
+    Le sottoclassi definiscono segment (testo di un segmento) e, se servono, intestazione e chiusura."""
+    ext = ''
+
+    def __init__(self, target):
+        self.own = isinstance(target, str)
+        self.out = open(target, 'w', encoding='utf-8', newline='\n') if self.own else target
+        self.spools = {}
+        self.bbox = [float('inf'), float('inf'), float('-inf'), float('-inf')]
+        self.count = 0
+
+    def __enter__(self): return self
+    def __exit__(self, exc_type, *a):
+        if exc_type is None: self.close()
+        else: self.discard()
+
+    def spool(self, layer):
+        f = self.spools.get(layer)
+        if f is None: f = self.spools[layer] = tempfile.TemporaryFile('w+', encoding='utf-8')
+        return f
+
+    def add_segments(self, layer, segments, offset=(0.0, 0.0)):
+        ox, oy = offset
+        f = self.spool(layer); b = self.bbox
+        for (x1, y1), (x2, y2) in segments:
+            x1 += ox; y1 += oy; x2 += ox; y2 += oy
+            if x1 < b[0]: b[0] = x1
+            if x2 < b[0]: b[0] = x2
+            if y1 < b[1]: b[1] = y1
+            if y2 < b[1]: b[1] = y2
+            if x1 > b[2]: b[2] = x1
+            if x2 > b[2]: b[2] = x2
+            if y1 > b[3]: b[3] = y1
+            if y2 > b[3]: b[3] = y2
+            f.write(self.segment(layer, x1, y1, x2, y2))
+            self.count += 1
+
+    def add_diagram(self, diagram, offset=(0.0, 0.0)):
+        """Accoda l'uscita di BoxManager.get_2d_diagram, traslata di offset (mm)."""
+        for layer, segs in diagram_layers(*diagram): self.add_segments(layer, segs, offset)
+
+    def layers(self):
+        # CUT, CREASE, poi ugelli in ordine numerico
+        return sorted(self.spools, key=lambda n: (n not in LAYER_STYLE, n != 'CUT', len(n), n))
+
+    def close(self):
+        if self.out is None: return
+        if self.count == 0: self.bbox = [0.0, 0.0, 0.0, 0.0]
+        self.write_head()
+        for name in self.layers():
+            f = self.spools[name]; f.seek(0)
+            self.write_layer(name, f)
+        self.write_tail()
+        self.out.flush()
+        self.discard()
+
+    def discard(self):
+        for f in self.spools.values(): f.close()
+        self.spools = {}
+        if self.own and self.out: self.out.close()
+        self.out = None
+
+    @abstractmethod
+    def segment(self, layer, x1, y1, x2, y2):
+        """Testo di un segmento (gia' traslato) per il file del layer."""
+    def write_head(self): pass
+    def write_layer(self, name, f): shutil.copyfileobj(f, self.out)
+    def write_tail(self): pass
+
+class DxfWriter(DielineWriter):
+    """DXF R12 (AC1009), LINE per segmento. Y verso l'alto: le coordinate del diagramma sono ribaltate.
+    R12 non ha $INSUNITS (arriva con R2000): un'unita' del disegno e' un millimetro per convenzione,
+    segnalata solo da $MEASUREMENT = 1 (metrico); chi importa deve scegliere i mm."""
+    ext = 'dxf'
+
+    def segment(self, layer, x1, y1, x2, y2):
+        return (f"0\nLINE\n8\n{layer}\n10\n{x1:{NUM_FMT}}\n20\n{-y1:{NUM_FMT}}\n30\n0.0\n"
+                f"11\n{x2:{NUM_FMT}}\n21\n{-y2:{NUM_FMT}}\n31\n0.0\n")
+
+    def write_head(self):
+        x0, y0, x1, y1 = self.bbox
+        w = self.out.write
+        w("0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n")
+        w("9\n$MEASUREMENT\n70\n1\n") # 1 = metrico (unita' = mm per convenzione)
+        w(f"9\n$EXTMIN\n10\n{x0:{NUM_FMT}}\n20\n{-y1:{NUM_FMT}}\n30\n0.0\n")
+        w(f"9\n$EXTMAX\n10\n{x1:{NUM_FMT}}\n20\n{-y0:{NUM_FMT}}\n30\n0.0\n")
+        w("0\nENDSEC\n0\nSECTION\n2\nTABLES\n")
+        w("0\nTABLE\n2\nLTYPE\n70\n2\n")
+        w("0\nLTYPE\n2\nCONTINUOUS\n70\n0\n3\nSolid line\n72\n65\n73\n0\n40\n0.0\n")
+        w("0\nLTYPE\n2\nDASHED\n70\n0\n3\n__ __ __\n72\n65\n73\n2\n40\n9.0\n49\n6.0\n49\n-3.0\n")
+        w("0\nENDTAB\n")
+        names = self.layers()
+        w(f"0\nTABLE\n2\nLAYER\n70\n{len(names)}\n")
+        for name in names:
+            _, aci, ltype = layer_style(name)
+            w(f"0\nLAYER\n2\n{name}\n70\n0\n62\n{aci}\n6\n{ltype}\n")
+        w("0\nENDTAB\n0\nENDSEC\n0\nSECTION\n2\nENTITIES\n")
+
+    def write_tail(self): self.out.write("0\nENDSEC\n0\nEOF\n")
+
+class SvgWriter(DielineWriter):
+    """SVG con un <g> per layer (layer Inkscape), unita' utente = mm."""
+    ext = 'svg'
+    margin = 10.0
+
+    def segment(self, layer, x1, y1, x2, y2):
+        return f'<line x1="{x1:{NUM_FMT}}" y1="{y1:{NUM_FMT}}" x2="{x2:{NUM_FMT}}" y2="{y2:{NUM_FMT}}"/>\n'
+
+    def write_head(self):
+        m = self.margin
+        x0, y0, x1, y1 = self.bbox
+        w, h = x1 - x0 + 2*m, y1 - y0 + 2*m
+        self.out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                       '<svg xmlns="http://www.w3.org/2000/svg" '
+                       'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+                       f'width="{w:{NUM_FMT}}mm" height="{h:{NUM_FMT}}mm" '
+                       f'viewBox="{x0-m:{NUM_FMT}} {y0-m:{NUM_FMT}} {w:{NUM_FMT}} {h:{NUM_FMT}}">\n')
+
+    def write_layer(self, name, f):
+        col, _, ltype = layer_style(name)
+        dash = ' stroke-dasharray="6,3"' if ltype == 'DASHED' else ''
+        self.out.write(f'<g id="{name}" inkscape:groupmode="layer" inkscape:label="{name}" '
+                       f'fill="none" stroke="{col}" stroke-width="0.5"{dash}>\n')
+        shutil.copyfileobj(f, self.out)
+        self.out.write('</g>\n')
+
+    def write_tail(self): self.out.write('</svg>\n')
+
+WRITERS = {'dxf': DxfWriter, 'svg': SvgWriter}
+
+def writer_for(target, fmt=None):
+    """Esportatore per formato esplicito o per estensione del file."""
+    if fmt is None:
+        if not isinstance(target, str): raise ValueError("formato richiesto per esportare su stream")
+        fmt = target.rsplit('.', 1)[-1]
+    fmt = fmt.lower()
+    if fmt not in WRITERS: raise ValueError(f"formato di esportazione sconosciuto '{fmt}'")
+    return WRITERS[fmt](target)
+
+def export_diagram(target, diagram, fmt=None, offset=(0.0, 0.0)):
+    """Scrive un diagramma (polys, cut_lines, creases, glue_lines) su file o stream di testo."""
+    with writer_for(target, fmt) as w: w.add_diagram(diagram, offset)
+
+def main(argv=None):
+    import argparse
+    from geometry_oop import BoxManager, DEFAULT_PARAMS
+    ap = argparse.ArgumentParser(description="Esporta la fustella in DXF/SVG (senza GUI).")
+    ap.add_argument('output', help="file .dxf o .svg ('-' = stdout, richiede --format)")
+    ap.add_argument('-p', '--params', help="file JSON con i parametri (le chiavi mancanti prendono i default)")
+    ap.add_argument('-f', '--format', choices=sorted(WRITERS), help="formato (default: estensione del file)")
+    args = ap.parse_args(argv)
+
+    p = dict(DEFAULT_PARAMS)
+    if args.params:
+        from batch import parse_params
+        with open(args.params, encoding='utf-8') as f: p = parse_params(json.load(f))
+    m = BoxManager(); m.build(p)
+    export_diagram(sys.stdout if args.output == '-' else args.output, m.get_2d_diagram(p), args.format)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+
+import numpy as np
+
+import geometry_oop
+from geometry_oop import Mesh, Metrics
+
+MAGIC = b'BXC1'
+FORMAT_VERSION = 4
+ALIGN = 64 # Allineamento dei blocchi nel file: gli array mappati restano allineati
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+EVICT_FRACTION = 0.9 # Dopo lo sfratto la cache scende a questa frazione del limite
+ENTRY_EXT = '.bxc'
+
+_code_version = None
+
+def code_version():
+    """Versione del codice geometrico: hash del sorgente di geometry_oop (cambia a ogni modifica)."""
+    global _code_version
+    if _code_version is None:
+        with open(geometry_oop.__file__, 'rb') as f: src = f.read()
+        _code_version = hashlib.sha256(src).hexdigest()[:16]
+    return _code_version
+
+def default_root():
+    """Cartella della cache: $BOXCREATOR_CACHE, altrimenti la cache utente del sistema."""
+    root = os.environ.get('BOXCREATOR_CACHE')
+    if root: return root
+    if sys.platform == 'win32': base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin': base = os.path.expanduser('~/Library/Caches')
+    else: base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'boxcreator', 'geometry')
+
+def canonical_params(p):
+    """Parametri in forma canonica: chiavi ordinate, numeri come float (400 e 400.0 coincidono)."""
+    out = {}
+    for k in sorted(p):
+        v = p[k]
+        if isinstance(v, (bool, np.bool_)): v = bool(v)
+        elif isinstance(v, (int, float, np.integer, np.floating)): v = float(v)
+        else: v = str(v)
+        out[str(k)] = v
+    return out
+
+def params_key(p):
+    blob = json.dumps([FORMAT_VERSION, code_version(), canonical_params(p)], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+# --- Formato del file ---
+# MAGIC, lunghezza dell'intestazione (uint32), intestazione JSON, poi i blocchi grezzi degli array
+# allineati ad ALIGN. L'intestazione riporta dtype, forma e offset di ogni array e i metadati.
+
+def _align(n): return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def pack(arrays, meta):
+    arrays = {k: np.ascontiguousarray(a) for k, a in arrays.items()}
+    table, offset = {}, 0
+    for k, a in arrays.items():
+        table[k] = [a.dtype.str, list(a.shape), offset]
+        offset = _align(offset + a.nbytes)
+    header = json.dumps({'arrays': table, 'meta': meta}, separators=(',', ':')).encode('utf-8')
+    start = _align(8 + len(header))
+    buf = bytearray(start + offset)
+    buf[:8] = MAGIC + struct.pack('<I', len(header))
+    buf[8:8 + len(header)] = header
+    for k, a in arrays.items():
+        o = start + table[k][2]
+        buf[o:o + a.nbytes] = a.tobytes()
+    return bytes(buf)
+
+def unpack(buf):
+    """(array, metadati) da un buffer (anche mmap): gli array sono viste in sola lettura, senza copie."""
+    if bytes(buf[:4]) != MAGIC: raise ValueError("file di cache non valido")
+    n, = struct.unpack('<I', buf[4:8])
+    header = json.loads(bytes(buf[8:8 + n]))
+    start = _align(8 + n)
+    arrays = {}
+    for k, (dtype, shape, offset) in header['arrays'].items():
+        dt = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        if start + offset + count * dt.itemsize > len(buf): raise ValueError("file di cache troncato")
+        arrays[k] = np.frombuffer(buf, dt, count, start + offset).reshape(shape)
+    return arrays, header['meta']
+
+# --- Contenuto di una voce ---
+
+def encode(manager, p, mesh=False):
+    """Array e metadati di un manager costruito con p: poligoni, pieghe, colla e misure di produzione;
+    con mesh=True anche la mesh 3D di base (scatola aperta)."""
+    polys, _, creases, glues = manager.get_2d_diagram(p)
+    sizes = np.array([len(q['coords']) for q in polys], dtype=np.int32)
+    coords = np.array([c for q in polys for c in q['coords']], dtype=np.float64).reshape(-1, 2)
+    arrays = {
+        'poly_sizes': sizes, 'poly_coords': coords,
+        'creases': np.array(creases, dtype=np.float64).reshape(-1, 2, 2),
+        'glue': np.array([seg for seg, _ in glues], dtype=np.float64).reshape(-1, 2, 2),
+        'glue_nozzle': np.array([idx for _, idx in glues], dtype=np.int8),
+    }
+    meta = {'params': canonical_params(p), 'code': code_version(),
+            'ids': [q['id'] for q in polys], 'types': [q['type'] for q in polys],
+            'glue_clamped': bool(manager.glue_clamped),
+            'metrics': manager.metrics(p)._asdict()}
+    if mesh:
+        angles = manager.angles
+        manager.set_angles({})
+        try: m = manager.get_mesh()
+        finally: manager.set_angles(angles)
+        arrays.update(vertices=m.vertices, normals=m.normals, indices=m.indices, face_type=m.face_type, face_panel=m.face_panel)
+        meta['panels'] = [n.name for n in m.panels]
+    return arrays, meta
+
+class CachedGeometry:
+    """Geometria letta dalla cache. Gli array sono mappati dal file; diagram ricostruisce le liste
+    nello stesso formato di BoxManager.get_2d_diagram, mesh e' la mesh 3D a scatola aperta
+    (panels: nomi dei pannelli; None se la voce e' stata scritta senza), metrics le misure di produzione (BoxManager.metrics)."""
+
+    def __init__(self, arrays, meta):
+        self.arrays, self.meta = arrays, meta
+        self.glue_clamped = meta['glue_clamped']
+        self._diagram = None
+
+    @property
+    def diagram(self):
+        if self._diagram is None:
+            a = self.arrays
+            bounds = np.concatenate([[0], np.cumsum(a['poly_sizes'])]).tolist()
+            coords = [tuple(c) for c in a['poly_coords'].tolist()]
+            polys, cuts = [], []
+            for i, (qid, qtype) in enumerate(zip(self.meta['ids'], self.meta['types'])):
+                pts = coords[bounds[i]:bounds[i+1]]
+                polys.append({'coords': pts, 'type': qtype, 'id': qid})
+                cuts += [[pts[j], pts[(j + 1) % len(pts)]] for j in range(len(pts))]
+            creases = [[tuple(s), tuple(e)] for s, e in a['creases'].tolist()]
+            glues = [([tuple(s), tuple(e)], n) for (s, e), n in zip(a['glue'].tolist(), a['glue_nozzle'].tolist())]
+            self._diagram = (polys, cuts, creases, glues)
+        return self._diagram
+
+    @property
+    def metrics(self):
+        m = dict(self.meta['metrics'])
+        m['glue_lengths'] = tuple(m['glue_lengths'])
+        return Metrics(**m)
+
+    @property
+    def mesh(self):
+        a = self.arrays
+        if 'vertices' not in a: return None
+        return Mesh(a['vertices'], a['normals'], a['indices'], a['face_type'], a['face_panel'], self.meta['panels'])
+
+class GeometryCache:
+    """Cache su disco della geometria, indirizzata dall'hash canonico dei parametri e della versione
+    del codice. Una voce = un file, scritto in un temporaneo e pubblicato con os.replace: processi
+    concorrenti vedono il file intero o nessun file, e scritture doppie producono lo stesso contenuto.
+    LRU sul tempo di modifica (aggiornato a ogni lettura), con sfratto quando si supera max_bytes.
+
+    Chi la usa: batch e sweep (fetch) leggono solo diagramma e misure, e con un colpo non costruiscono
+    nulla. La GUI la legge finche' non ha un albero dei nodi (avvio, primo caricamento): con un colpo
+    mostra diagramma e mesh di base senza build, e l'albero si costruisce solo quando serve (vista 3D,
+    animazione, esportazione); per questo le sue voci portano anche la mesh (put con mesh=True)."""
+
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root or default_root()
+        self.max_bytes = max_bytes
+        self.hits = self.misses = 0
+        self._written = None # Byte scritti da questo processo dall'ultimo controllo della dimensione
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key + ENTRY_EXT)
+
+    def get(self, p):
+        """CachedGeometry per i parametri p, o None."""
+        path = self.path(params_key(p))
+        try:
+            with open(path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            entry = CachedGeometry(*unpack(buf))
+        except FileNotFoundError:
+            self.misses += 1; return None
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            self._remove(path) # Voce illeggibile: verra' riscritta
+            return None
+        try: os.utime(path) # Usata di recente
+        except OSError: pass
+        self.hits += 1
+        return entry
+
+    def put(self, p, manager, mesh=False):
+        """Salva la geometria del manager, gia' costruito con p (con mesh=True anche la mesh 3D di base);
+        restituisce il contenuto scritto."""
+        data = pack(*encode(manager, p, mesh))
+        self.store(params_key(p), data)
+        return data
+
+    def store(self, key, data):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f: f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            self._remove(tmp); raise
+        if self._written is None: self._written = self.max_bytes # Primo salvataggio: controlla subito
+        self._written += len(data)
+        # Il totale si ricalcola dal disco (altri processi scrivono nella stessa cartella) ogni ~1/8 del limite
+        if self._written >= self.max_bytes // 8: self.evict()
+
+    def fetch(self, p, manager):
+        """Geometria per p: dalla cache, altrimenti build con manager e salvataggio (senza mesh 3D)."""
+        entry = self.get(p)
+        if entry is not None: return entry
+        manager.build(p)
+        data = pack(*encode(manager, p))
+        try: self.store(params_key(p), data)
+        except OSError: pass # Cache non scrivibile: si lavora comunque
+        return CachedGeometry(*unpack(data))
+
+    def entries(self):
+        """[(mtime, dimensione, percorso)] delle voci presenti."""
+        out = []
+        try: dirs = list(os.scandir(self.root))
+        except FileNotFoundError: return out
+        for d in dirs:
+            if not d.is_dir(): continue
+            for e in os.scandir(d.path):
+                if not e.name.endswith(ENTRY_EXT): continue
+                try: st = e.stat()
+                except FileNotFoundError: continue
+                out.append((st.st_mtime, st.st_size, e.path))
+        return out
+
+    def size(self):
+        return sum(s for _, s, _ in self.entries())
+
+    def evict(self):
+        """Elimina le voci usate meno di recente finche' la cache supera il limite."""
+        self._written = 0
+        entries = self.entries()
+        total = sum(s for _, s, _ in entries)
+        if total <= self.max_bytes: return 0
+        removed = 0
+        for _, s, path in sorted(entries):
+            if total <= self.max_bytes * EVICT_FRACTION: break
+            self._remove(path) # Un lettore che l'ha gia' mappata continua a vederla (POSIX)
+            total -= s; removed += 1
+        return removed
+
+    def clear(self):
+        for _, _, path in self.entries(): self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try: os.remove(path)
+        except OSError: pass # Gia' rimossa da un altro processo, o ancora aperta (Windows)
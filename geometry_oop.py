@@ -1,51 +1,282 @@
 import math
+import copy
+import functools
+import itertools
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
 
 # --- Utility per Arrotondare gli Angoli ---
+ROUND_CACHE_SIZE = 4096 # Poligoni arrotondati tenuti in cache (LRU)
+_round_cache = OrderedDict()
+_round_lock = threading.Lock()
+
 def round_poly(points, radius=2.0, steps=3):
     """Arrotonda gli angoli di un poligono usando curve di Bezier."""
-    if len(points) < 3: return points
-    new_points = []
+    return round_polys([points], radius, steps)[0]
+
+def round_polys(polys, radius=2.0, steps=3):
+    """Arrotonda in blocco piu' poligoni. I contorni gia' visti (a meno di 1e-6 mm) escono dalla cache LRU."""
+    sizes = [len(p) for p in polys]
+    flat = np.array([xy for p in polys for xy in p], dtype=float).reshape(-1, 2)
+    quant = np.round(flat, 6)
+    bounds = np.cumsum([0] + sizes).tolist()
+    keys = [(quant[b0:b1].tobytes(), radius, steps) for b0, b1 in zip(bounds, bounds[1:])]
+    
+    out = [None] * len(polys)
+    misses = {}
+    with _round_lock:
+        for i, key in enumerate(keys):
+            hit = _round_cache.get(key)
+            if hit is not None:
+                _round_cache.move_to_end(key); out[i] = hit
+            else: misses.setdefault(key, []).append(i)
+    if misses:
+        todo = [idxs[0] for idxs in misses.values()]
+        results = _round_batch([flat[bounds[i]:bounds[i+1]] for i in todo], radius, steps)
+        with _round_lock:
+            for (key, idxs), res in zip(misses.items(), results):
+                _round_cache[key] = res
+                for i in idxs: out[i] = res
+            while len(_round_cache) > ROUND_CACHE_SIZE: _round_cache.popitem(last=False)
+    return [list(res) for res in out]
+
+def _round_batch(polys, radius, steps):
+    """Calcolo vettoriale su tutti i vertici di tutti i poligoni insieme (array piatto + indici prev/next)."""
+    res = [tuple(map(tuple, p.tolist())) for p in polys]
+    valid = [i for i, p in enumerate(polys) if len(p) >= 3]
+    if not valid: return res
+    
+    sizes = np.array([len(polys[i]) for i in valid])
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    pc = np.concatenate([polys[i] for i in valid])
+    start = np.repeat(offsets, sizes)
+    n = np.repeat(sizes, sizes)
+    local = np.arange(len(pc)) - start
+    pp = pc[start + (local - 1) % n]
+    pn = pc[start + (local + 1) % n]
+    
+    v1, v2 = pp - pc, pn - pc
+    d1 = np.hypot(v1[:, 0], v1[:, 1])[:, None]
+    d2 = np.hypot(v2[:, 0], v2[:, 1])[:, None]
+    r = np.minimum(radius, np.minimum(d1/2, d2/2))
+    sharp = r[:, 0] < 0.1 # Lati troppo corti (o nulli): il vertice resta vivo
+    d1[sharp], d2[sharp] = 1.0, 1.0
+    p_start = pc + v1/d1 * r
+    p_end = pc + v2/d2 * r
+    
+    t = (np.arange(1, steps + 1) / steps)[None, :, None]
+    inv = 1.0 - t
+    curve = (inv**2 * p_start[:, None]) + (2 * inv * t * pc[:, None]) + (t**2 * p_end[:, None])
+    blocks = np.concatenate((p_start[:, None], curve), axis=1)
+    blocks[sharp, 0] = pc[sharp]
+    counts = np.where(sharp, 1, steps + 1)
+    flat = blocks[np.arange(steps + 1)[None, :] < counts[:, None]].tolist()
+    
+    ends = np.cumsum(np.add.reduceat(counts, offsets)).tolist()
+    begin = 0
+    for i, end in zip(valid, ends):
+        res[i] = tuple(map(tuple, flat[begin:end])); begin = end
+    return res
+
+# Identificativi univoci delle forme generate (validi anche tra copie dell'albero)
+_shape_ids = itertools.count(1)
+
+# --- Triangolazione dei Contorni (Ear Clipping) ---
+def triangulate(points, eps=1e-9):
+    """Triangola un poligono semplice. Restituisce terne di indici su points, con lo stesso verso del contorno.
+    Un contorno che si interseca (scasso piu' largo del pannello) si copre comunque, vedi _ear_clip."""
     n = len(points)
+    if n < 3: return []
+    area2 = sum(points[i-1][0]*points[i][1] - points[i][0]*points[i-1][1] for i in range(n))
+    return _ear_clip(points, 1.0 if area2 >= 0 else -1.0, eps, True)
+
+def _ear_clip(points, sgn, eps, flip):
+    """Ear clipping nel verso sgn. Senza orecchi liberi il contorno non e' semplice: un resto percorso al
+    contrario (o tutto concavo) si triangola nel verso opposto, se flip o se qui si e' gia' tagliato qualcosa;
+    altrimenti si taglia l'orecchio convesso piu' piccolo anche se un vertice concavo cade dentro."""
+    n = len(points)
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    
+    def cross(a, b, c):
+        return sgn * ((xs[b]-xs[a])*(ys[c]-ys[b]) - (ys[b]-ys[a])*(xs[c]-xs[b]))
+    
+    prev = [(i-1) % n for i in range(n)]
+    nxt = [(i+1) % n for i in range(n)]
+    # Solo i vertici concavi possono cadere dentro un orecchio
+    reflex = {i for i in range(n) if cross(prev[i], i, nxt[i]) < -eps}
+    
+    tris = []
+    remaining, i, fails, force = n, 0, 0, False
+    while remaining > 3:
+        if fails >= remaining:
+            rest = [i]
+            while nxt[rest[-1]] != i: rest.append(nxt[rest[-1]])
+            rest_area2 = sgn * sum(xs[rest[k-1]]*ys[rest[k]] - xs[rest[k]]*ys[rest[k-1]] for k in range(len(rest)))
+            convex = [(cross(prev[k], k, nxt[k]), k) for k in rest if cross(prev[k], k, nxt[k]) > eps]
+            if (flip or remaining < n) and (rest_area2 < -eps or not convex):
+                sub = _ear_clip([points[k] for k in rest], -sgn, eps, False)
+                return tris + [(rest[c], rest[b], rest[a]) for a, b, c in sub] # Girati come il contorno
+            if not convex: break
+            i, force, fails = min(convex)[1], True, 0
+        a, c = prev[i], nxt[i]
+        cr = cross(a, i, c)
+        if cr < -eps: 
+            i = nxt[i]; fails += 1; continue
+        if cr > eps and reflex and not force:
+            blocked = False
+            for j in reflex:
+                if j != a and j != c and cross(a, i, j) > eps and cross(i, c, j) > eps and cross(c, a, j) > eps:
+                    blocked = True; break
+            if blocked:
+                i = nxt[i]; fails += 1; continue
+        if cr > eps: tris.append((a, i, c))
+        # Vertici allineati o duplicati (es. raccordi a raggio pieno) si eliminano senza triangolo
+        nxt[a], prev[c] = c, a
+        reflex.discard(i)
+        for v in (a, c):
+            if cross(prev[v], v, nxt[v]) < -eps: reflex.add(v)
+            else: reflex.discard(v)
+        remaining -= 1; fails = 0; force = False; i = c
     
-    def dist(p1, p2): return math.hypot(p1[0]-p2[0], p1[1]-p2[1])
+    if remaining == 3:
+        tri = (prev[i], i, nxt[i])
+        cr = cross(*tri)
+        if cr > eps: tris.append(tri)
+        elif cr < -eps: tris.append(tri[::-1])
+    return tris
 
-    for i in range(n):
-        p_prev = points[i-1]
-        p_curr = points[i]
-        p_next = points[(i+1)%n]
-        
-        l1 = dist(p_curr, p_prev)
-        l2 = dist(p_curr, p_next)
-        
-        r = min(radius, l1/2, l2/2)
-        
-        if r < 0.1:
-            new_points.append(p_curr)
-            continue
-            
-        v1_x, v1_y = p_prev[0]-p_curr[0], p_prev[1]-p_curr[1]
-        v2_x, v2_y = p_next[0]-p_curr[0], p_next[1]-p_curr[1]
-        d1 = math.hypot(v1_x, v1_y)
-        d2 = math.hypot(v2_x, v2_y)
-        
-        if d1 == 0 or d2 == 0:
-            new_points.append(p_curr); continue
+@functools.lru_cache(maxsize=None)
+def _hinge_steps(n):
+    """Frazioni dell'angolo di piega per i passi della cerniera: i/n, i = 0..n."""
+    return np.arange(n + 1) / n
 
-        n1 = (v1_x/d1, v1_y/d1)
-        n2 = (v2_x/d2, v2_y/d2)
-        
-        p_start = (p_curr[0] + n1[0]*r, p_curr[1] + n1[1]*r)
-        p_end   = (p_curr[0] + n2[0]*r, p_curr[1] + n2[1]*r)
-        
-        new_points.append(p_start)
-        for s in range(1, steps + 1):
-            t = s / steps
-            inv = 1.0 - t
-            bx = (inv**2 * p_start[0]) + (2 * inv * t * p_curr[0]) + (t**2 * p_end[0])
-            by = (inv**2 * p_start[1]) + (2 * inv * t * p_curr[1]) + (t**2 * p_end[1])
-            new_points.append((bx, by))
-            
-    return new_points
+@functools.lru_cache(maxsize=ROUND_CACHE_SIZE)
+def _triangulate_cached(points):
+    return triangulate(points)
+
+def hinge_strips(nodes, segments=None):
+    """Strisce di cerniera di piu' nodi (non radice) in un solo passaggio: (N, segments+1, 2, 3) in mondo.
+    I due punti di cerniera (+-w/2, 0, -T) si ruotano nel riferimento del pivot per i passi precalcolati
+    dell'angolo di piega, poi si portano in mondo una sola volta con la matrice del padre in cache."""
+    n = segments or BoxComponent.hinge_segments
+    if not nodes: return np.zeros((0, n + 1, 2, 3))
+    a = np.array([(c.fold_angle * c.fold_multiplier, c.pre_rot_z, c.width / 2, c.thickness, c.fold_axis == 'x') for c in nodes])
+    rf = np.radians(a[:, :1]) * _hinge_steps(n)
+    cf, sf = np.cos(rf)[..., None], np.sin(rf)[..., None]                  # (N, S, 1)
+    rp = np.radians(a[:, 1])
+    side = np.array((1.0, -1.0))
+    qx = (a[:, 2] * np.cos(rp))[:, None, None] * side                     # R_z(pre_rot_z) dei punti: (N, 1, 2)
+    qy = (a[:, 2] * np.sin(rp))[:, None, None] * side
+    qz = -a[:, 3][:, None, None]
+    on_x = a[:, 4][:, None, None] > 0
+    
+    pts = np.empty((len(nodes), n + 1, 2, 3))
+    pts[..., 0] = np.where(on_x, qx, cf*qx + sf*qz)
+    pts[..., 1] = np.where(on_x, cf*qy - sf*qz, qy)
+    pts[..., 2] = np.where(on_x, sf*qy + cf*qz, cf*qz - sf*qx)
+    pm = np.array([c.parent.world_matrix() for c in nodes])
+    rot = pm[:, :3, :3]
+    origin = np.einsum('nij,nj->ni', rot, np.array([c.pivot_3d for c in nodes], dtype=float)) + pm[:, :3, 3]
+    return np.einsum('nij,nspj->nspi', rot, pts) + origin[:, None, None]
+
+# --- MESH A STRUTTURA DI ARRAY ---
+FACE_FRONT, FACE_BACK, FACE_SIDE, FACE_HINGE = range(4) # Tipi di faccia (Mesh.face_type)
+FACE_TYPE_NAMES = ('front', 'back', 'side', 'hinge')
+COL_CARDBOARD, COL_WHITE, COL_SIDE = range(3) # Colori (Mesh.face_color): cartone, bianco, bordo
+FACE_TYPE_COLOR = np.array((COL_CARDBOARD, COL_WHITE, COL_SIDE, COL_WHITE), dtype=np.int8)
+SMOOTH_ANGLE = 45.0 # Normali lisce dei lati: tra lati che girano di meno (angoli arrotondati), spigoli vivi oltre
+
+class Mesh:
+    """Mesh a triangoli indicizzati: vertices/normals float32 (V, 3), indices uint32 (T, 3)
+    e, per triangolo, face_panel (indice in panels), face_type e face_color (interi)."""
+    __slots__ = ('vertices', 'normals', 'indices', 'face_panel', 'face_type', 'face_color', 'panels')
+
+    def __init__(self, vertices, normals, indices, face_type, face_panel=None, panels=()):
+        self.vertices, self.normals, self.indices = vertices, normals, indices
+        self.face_type = face_type
+        self.face_color = FACE_TYPE_COLOR[face_type]
+        self.face_panel = np.zeros(len(indices), dtype=np.int32) if face_panel is None else face_panel
+        self.panels = list(panels)
+
+    def __len__(self): return len(self.indices)
+
+    @classmethod
+    def concat(cls, meshes):
+        """Unisce le mesh: indici e face_panel spostati, panels concatenati."""
+        meshes = list(meshes)
+        if not meshes: return cls(np.zeros((0, 3), np.float32), np.zeros((0, 3), np.float32), np.zeros((0, 3), np.uint32), np.zeros(0, np.int8))
+        vbase = np.cumsum([0] + [len(m.vertices) for m in meshes[:-1]]).astype(np.uint32)
+        pbase = np.cumsum([0] + [len(m.panels) for m in meshes[:-1]]).astype(np.int32)
+        return cls(np.concatenate([m.vertices for m in meshes]), np.concatenate([m.normals for m in meshes]),
+                   np.concatenate([m.indices + b for m, b in zip(meshes, vbase)]),
+                   np.concatenate([m.face_type for m in meshes]),
+                   np.concatenate([m.face_panel + b for m, b in zip(meshes, pbase)]),
+                   [p for m in meshes for p in m.panels])
+
+def _unit_normals(a, b, c):
+    """Normali (cross (b-a, c-a)) normalizzate; (0, 0, 1) se degeneri."""
+    nrm = np.cross(b - a, c - a)
+    l = np.linalg.norm(nrm, axis=-1, keepdims=True)
+    return np.where(l > 0, nrm / np.where(l > 0, l, 1), np.array((0, 0, 1), dtype=nrm.dtype))
+
+def hinge_mesh(nodes, segments=None):
+    """Strisce di cerniera dei nodi come Mesh in mondo (due triangoli per segmento, face_panel = indice del nodo)."""
+    strips = hinge_strips(nodes, segments).astype(np.float32)
+    N, S = strips.shape[0], strips.shape[1] - 1
+    # Quad (sinistra, sinistra+1, destra+1, destra) per segmento, vertici propri per la normale piatta
+    q = np.stack([strips[:, :-1, 0], strips[:, 1:, 0], strips[:, 1:, 1], strips[:, :-1, 1]], axis=2).reshape(-1, 4, 3)
+    nrm = _unit_normals(q[:, 0], q[:, 1], q[:, 2]).astype(np.float32)
+    k = np.arange(len(q), dtype=np.uint32)[:, None] * 4
+    idx = (k[:, None] + np.array(((0, 1, 2), (0, 2, 3)), dtype=np.uint32)).reshape(-1, 3)
+    return Mesh(q.reshape(-1, 3), np.repeat(nrm, 4, axis=0), idx, np.full(len(idx), FACE_HINGE, np.int8),
+                np.repeat(np.arange(N, dtype=np.int32), 2 * S), nodes)
+
+# --- PIEGA SULLA GPU ---
+# Il vertex shader di Viewer3D riceve la scena aperta una volta sola; per piegarla gli bastano questa
+# tabella della gerarchia e gli angoli dei gruppi di piega
+
+def fold_table(nodes):
+    """Gerarchia dei nodi (padri prima dei figli) in tre array float32 (N, 4):
+    (pivot_3d, indice del padre o -1), (cos e sin di pre_rot_z, 1 se la piega e' attorno a x, fold_multiplier),
+    (indice del gruppo in FOLD_ROLES o -1 se non si piega per gruppo, angolo fisso, 0, 0)."""
+    pos = {n: i for i, n in enumerate(nodes)}
+    pivot, frame, fold = (np.zeros((len(nodes), 4), np.float32) for _ in range(3))
+    for i, n in enumerate(nodes):
+        rp = math.radians(n.pre_rot_z)
+        pivot[i] = (*n.pivot_3d, pos.get(n.parent, -1))
+        frame[i] = (math.cos(rp), math.sin(rp), n.fold_axis == 'x', n.fold_multiplier)
+        fold[i, :2] = (FOLD_ROLES.index(n.role), 0) if n.role in FOLD_ROLES else (-1, n.fold_angle)
+    return pivot, frame, fold
+
+def hinge_local(nodes, segments=None):
+    """Strisce di cerniera dei nodi non radice nel riferimento locale del nodo, da piegare sulla GPU:
+    vertici e normali (V, 3), indici (T, 3) e per vertice (indice del nodo in nodes, frazione dell'angolo).
+    Al passo i il punto di cerniera (+-w/2, 0, -T) si piega di i/segments dell'angolo del nodo (come in
+    hinge_strips); la normale e' radiale rispetto all'asse di piega, (0, 0, -1) prima della piega."""
+    n = segments or BoxComponent.hinge_segments
+    ids = [i for i, c in enumerate(nodes) if c.parent]
+    if not ids: return np.zeros((0, 3), np.float32), np.zeros((0, 3), np.float32), np.zeros((0, 3), np.uint32), np.zeros((0, 2), np.float32)
+    a = np.array([(nodes[i].width / 2, nodes[i].thickness) for i in ids], dtype=np.float32)
+    verts = np.zeros((len(ids), n + 1, 2, 3), np.float32)
+    verts[..., 0] = a[:, :1, None] * np.array((1.0, -1.0), np.float32)
+    verts[..., 2] = -a[:, 1:, None]
+    normals = np.zeros_like(verts); normals[..., 2] = -1
+    panel_fold = np.empty((len(ids), n + 1, 2, 2), np.float32)
+    panel_fold[..., 0] = np.array(ids, np.float32)[:, None, None]
+    panel_fold[..., 1] = _hinge_steps(n)[None, :, None]
+    # Quad (sinistra i, sinistra i+1, destra i+1, destra i) per segmento, come in hinge_mesh
+    k = (np.arange(len(ids))[:, None] * (n + 1) + np.arange(n)).ravel().astype(np.uint32)[:, None] * 2
+    idx = (k[:, None] + np.array(((0, 2, 3), (0, 3, 1)), dtype=np.uint32)).reshape(-1, 3)
+    return verts.reshape(-1, 3), normals.reshape(-1, 3), idx, panel_fold.reshape(-1, 2)
+
+FOLD_ROLES = ('fianchi', 'testate', 'lembi', 'fasce', 'ext', 'reinf') # Gruppi di piega (chiavi di angles)
+
+def fold_role(name, label):
+    """Gruppo di piega di un nodo dal nome e dall'etichetta (None = non si piega)."""
+    if "Reinf" in name: return 'reinf'
+    return label if label in FOLD_ROLES else None
 
 class BoxComponent:
     def __init__(self, name, width, height, thickness, parent=None, attachment='top', label='', custom_offset=0):
@@ -56,7 +287,15 @@ class BoxComponent:
         self.parent = parent
         self.children = []
         self.label = label 
-        self.polygon = [] 
+        self.role = fold_role(name, label) # Fissato alla creazione: niente confronti di stringhe per fotogramma
+        self.depth = parent.depth + 1 if parent else 0
+        self.attachment = attachment
+        self.revision = 0 # Id univoco della forma corrente, cambia a ogni rigenerazione (per le cache a valle)
+        self._world = None # Matrice mondo 4x4 in cache (None = da ricalcolare)
+        self._layout = None # Layout 2D in cache: ((pos, rot) padre, (pos, rot) proprio, dati, cordonature)
+        self._mesh = None # ((revision, smooth), Mesh) locale in cache
+        self._stats = None # (chiave, misure) di shape_stats in cache
+        self.outline = [] 
         
         self.fold_angle = 0.0
         self.fold_axis = 'x'
@@ -72,6 +311,20 @@ class BoxComponent:
 
     def add_child(self, child, edge):
         self.children.append(child)
+        self.attach(child, edge)
+        child.generate_shape()
+
+    def clone(self, parent=None):
+        """Copia del sottoalbero: forme, triangoli e cache sono condivisi (mai modificati sul posto)."""
+        c = copy.copy(self)
+        c.parent = parent
+        c.children = [ch.clone(c) for ch in self.children]
+        return c
+
+    def attach(self, child, edge):
+        """Posiziona il figlio sul bordo indicato (pivot 3D e posizione nel layout 2D)."""
+        child.attachment = edge
+        child.touch()
         gw, gh = self.width, self.height
         
         if self.name == "Fondo":
@@ -118,74 +371,158 @@ class BoxComponent:
                 hl = getattr(self, 'h_low_val', self.height*0.6)
                 child.pivot_3d = (0, -hl, 0); child.pre_rot_z = 0; child.fold_axis = 'x'; child.fold_multiplier = -1
                 child.layout_pos = (0, -hl); child.layout_rot = 0
-        
-        child.generate_shape()
 
     def generate_shape(self):
         w, h = self.width, self.height
         pts = [(w/2, 0), (w/2, -h), (-w/2, -h), (-w/2, 0)]
-        self.polygon = round_poly(pts, 2.0)
+        self.outline = pts
+
+    corner_radius = 2.0 # Raggio di raccordo degli angoli (mm)
+    hinge_segments = 6 # Segmenti della striscia di cerniera tra padre e figlio
+
+    @property
+    def outline(self): return self._outline
+
+    @outline.setter
+    def outline(self, pts):
+        # Contorno a spigoli vivi: l'arrotondamento si fa al primo accesso a polygon,
+        # oppure in blocco per tutti i nodi nuovi alla fine di BoxManager.build
+        self._outline = pts
+        self._polygon = None
+        self.revision = next(_shape_ids)
+        self.touch()
+
+    @property
+    def polygon(self):
+        if self._polygon is None: self.set_rounded(round_poly(self._outline, self.corner_radius))
+        return self._polygon
 
-    def _make_transform(self, parent_tm, angle_override=None):
-        angle = self.fold_angle if angle_override is None else angle_override
+    @property
+    def triangles(self):
+        if self._polygon is None: self.polygon
+        return self._triangles
+
+    def set_rounded(self, pts):
+        """Assegna il contorno arrotondato; la triangolazione si ricalcola solo qui."""
+        self._polygon = pts
+        self._triangles = _triangulate_cached(tuple(pts))
+
+    def touch(self):
+        """Forma o aggancio cambiati: scarta matrici mondo e layout 2D in cache del sottoalbero."""
+        stack = [self]
+        while stack:
+            n = stack.pop()
+            n._world = None; n._layout = None
+            stack.extend(n.children)
+
+    @property
+    def fold_angle(self): return self._fold_angle
+
+    @fold_angle.setter
+    def fold_angle(self, value):
+        if getattr(self, '_fold_angle', None) == value: return
+        self._fold_angle = value
+        self.invalidate_transform()
+
+    def invalidate_transform(self):
+        """Scarta la matrice mondo in cache di questo nodo e dei discendenti."""
+        # Un figlio in cache implica il padre in cache: se il nodo e' gia' sporco lo e' anche il sottoalbero
+        if self._world is None: return
+        self._world = None
+        for c in self.children: c.invalidate_transform()
+
+    def _local_matrix(self, angle):
+        """Matrice 4x4 locale->padre: pre-rotazione Z, piega attorno a fold_axis, traslazione al pivot."""
         rf = math.radians(angle * self.fold_multiplier)
         cf, sf = math.cos(rf), math.sin(rf)
         rp = math.radians(self.pre_rot_z)
         cp, sp = math.cos(rp), math.sin(rp)
         
-        def local_tm(v):
-            x, y, z = v
-            rx, ry = x*cp - y*sp, x*sp + y*cp
-            rz = z
-            if self.fold_axis == 'x': yf, zf, xf = ry*cf - rz*sf, ry*sf + rz*cf, rx
-            else: xf, zf, yf = rx*cf + rz*sf, -rx*sf + rz*cf, ry
-            return (xf + self.pivot_3d[0], yf + self.pivot_3d[1], zf + self.pivot_3d[2])
-            
-        if parent_tm is None: return lambda v: local_tm(v)
-        return lambda v: parent_tm(local_tm(v))
-
-    def get_world_transform_3d(self, parent_tm=None):
-        return self._make_transform(parent_tm, angle_override=None)
-
-    def get_mesh_3d(self, parent_tm=None):
-        tm = self.get_world_transform_3d(parent_tm)
-        faces = []
-        vt = [tm((x,y,0)) for x,y in self.polygon]
-        vb = [tm((x,y,-self.thickness)) for x,y in self.polygon]
-        faces.append({'verts': vt, 'type': 'front', 'name': self.name, 'col': 'cardboard'})     
-        faces.append({'verts': vb, 'type': 'back', 'name': self.name, 'col': 'white'}) 
-        n = len(self.polygon)
-        for i in range(n):
-            faces.append({'verts': [vt[i], vt[(i+1)%n], vb[(i+1)%n], vb[i]], 'type': 'side', 'name': self.name})
-        if self.parent:
-            faces.extend(self._get_hinge_mesh(parent_tm))
-        for c in self.children:
-            faces.extend(c.get_mesh_3d(tm))
-        return faces
-
-    def _get_hinge_mesh(self, parent_tm):
-        faces = []
-        w_child = self.width
-        p_left_child = (w_child/2, 0, -self.thickness)
-        p_right_child = (-w_child/2, 0, -self.thickness)
-        steps = 6 
-        current_angle = self.fold_angle
-        prev_v_left = None
-        prev_v_right = None
-        for i in range(steps + 1):
-            t = i / steps
-            interp_angle = current_angle * t
-            tm_step = self._make_transform(parent_tm, angle_override=interp_angle)
-            curr_v_left = tm_step(p_left_child)
-            curr_v_right = tm_step(p_right_child)
-            if prev_v_left is not None:
-                faces.append({
-                    'verts': [prev_v_left, curr_v_left, curr_v_right, prev_v_right],
-                    'type': 'hinge', 'name': f"{self.name}_hinge", 'col': 'white'
-                })
-            prev_v_left = curr_v_left
-            prev_v_right = curr_v_right
-        return faces
+        px, py, pz = self.pivot_3d
+        # Prodotto R_fold @ R_z(pre_rot_z) scritto in forma chiusa
+        if self.fold_axis == 'x':
+            return np.array(((cp, -sp, 0, px), (cf*sp, cf*cp, -sf, py), (sf*sp, sf*cp, cf, pz), (0, 0, 0, 1)))
+        return np.array(((cf*cp, -cf*sp, sf, px), (sp, cp, 0, py), (-sf*cp, sf*sp, cf, pz), (0, 0, 0, 1)))
+
+    def _local_matrices(self, angles):
+        """_local_matrix per un vettore di angoli: (F,) -> (F, 4, 4)."""
+        rf = np.radians(np.asarray(angles, dtype=float) * self.fold_multiplier)
+        cf, sf = np.cos(rf), np.sin(rf)
+        rp = math.radians(self.pre_rot_z)
+        cp, sp = math.cos(rp), math.sin(rp)
+        
+        m = np.zeros((len(rf), 4, 4))
+        m[:, :3, 3] = self.pivot_3d; m[:, 3, 3] = 1
+        if self.fold_axis == 'x':
+            m[:, 0, 0], m[:, 0, 1] = cp, -sp
+            m[:, 1, 0], m[:, 1, 1], m[:, 1, 2] = cf*sp, cf*cp, -sf
+            m[:, 2, 0], m[:, 2, 1], m[:, 2, 2] = sf*sp, sf*cp, cf
+        else:
+            m[:, 0, 0], m[:, 0, 1], m[:, 0, 2] = cf*cp, -cf*sp, sf
+            m[:, 1, 0], m[:, 1, 1] = sp, cp
+            m[:, 2, 0], m[:, 2, 1], m[:, 2, 2] = -sf*cp, sf*sp, cf
+        return m
+
+    def world_matrix(self):
+        """Matrice 4x4 locale->mondo, ricalcolata solo se cambia fold_angle del nodo o di un antenato."""
+        if self._world is None:
+            m = self._local_matrix(self.fold_angle)
+            self._world = self.parent.world_matrix() @ m if self.parent else m
+        return self._world
+
+    def to_world(self, points):
+        """Trasforma in blocco punti locali (N,3) in coordinate mondo."""
+        m = self.world_matrix()
+        return np.asarray(points, dtype=float) @ m[:3, :3].T + m[:3, 3]
+
+    def to_local(self, points):
+        """Inversa di to_world (trasformazione rigida: R^T (p - t))."""
+        m = self.world_matrix()
+        return (np.asarray(points, dtype=float) - m[:3, 3]) @ m[:3, :3]
+
+    def local_mesh(self, smooth=False):
+        """Mesh del pannello in coordinate locali: fronte (z=0), retro (z=-spessore) e un quad per lato.
+        smooth: normali per vertice sui lati che girano meno di SMOOTH_ANGLE (raccordi degli angoli).
+        Normali calcolate qui una volta sola; in cache finche' non cambia la forma (revision)."""
+        key = (self.revision, smooth)
+        if self._mesh is not None and self._mesh[0] == key: return self._mesh[1]
+        poly = np.asarray(self.polygon, dtype=np.float32).reshape(-1, 2)
+        tris = np.asarray(self.triangles, dtype=np.uint32).reshape(-1, 3)
+        n = len(poly)
+        top = np.zeros((n, 3), np.float32); top[:, :2] = poly
+        bot = top.copy(); bot[:, 2] = -self.thickness
+        j = (np.arange(n) + 1) % n
+        quads = np.stack([top, top[j], bot[j], bot], axis=1) # Lati: vertici propri per la normale piatta
+        
+        # Normale di fronte e retro dai primi tre vertici, come per i lati
+        if n >= 3: nt, nb = _unit_normals(top[0], top[1], top[2]), _unit_normals(bot[0], bot[1], bot[2])
+        else: nt = nb = np.array((0, 0, 1), np.float32)
+        ns = _unit_normals(quads[:, 0], quads[:, 1], quads[:, 2])
+        if smooth and n >= 3:
+            # Normale del vertice: media delle due facce pesata sulla lunghezza dei lati, cosi' nel punto di
+            # tangenza tra lato dritto e raccordo prevale il lato dritto (come sulla curva vera)
+            prev = (np.arange(n) - 1) % n
+            lens = np.linalg.norm(top[j] - top, axis=1)[:, None]
+            vn = ns[prev] * lens[prev] + ns * lens
+            l = np.linalg.norm(vn, axis=1, keepdims=True)
+            vn = np.where(l > 0, vn / np.where(l > 0, l, 1), ns)
+            soft = ((ns[prev] * ns).sum(axis=1) > math.cos(math.radians(SMOOTH_ANGLE)))[:, None]
+            a, b = np.where(soft, vn, ns), np.where(soft[j], vn[j], ns) # Estremi i e i+1 del lato i
+            sides_n = np.stack([a, b, b, a], axis=1).reshape(-1, 3)
+        else: sides_n = np.repeat(ns, 4, axis=0)
+        normals = np.concatenate([np.broadcast_to(nt, (n, 3)), np.broadcast_to(nb, (n, 3)), sides_n])
+        
+        k = 2 * n + np.arange(n, dtype=np.uint32)[:, None] * 4
+        sides = (k[:, None] + np.array(((0, 1, 2), (0, 2, 3)), dtype=np.uint32)).reshape(-1, 3)
+        idx = np.concatenate([tris, tris + n, sides]).astype(np.uint32)
+        ftype = np.repeat(np.array((FACE_FRONT, FACE_BACK, FACE_SIDE), np.int8), (len(tris), len(tris), 2 * n))
+        mesh = Mesh(np.concatenate([top, bot, quads.reshape(-1, 3)]), normals.astype(np.float32), idx, ftype, panels=(self,))
+        self._mesh = (key, mesh)
+        return mesh
+
+    def hinge_strip(self, segments=None):
+        """Vertici della striscia di cerniera in mondo: (segments+1, 2, 3), dal pannello del padre a questo."""
+        return hinge_strips([self], segments or self.hinge_segments)[0]
 
     def get_layout_transform_2d(self, parent_pos=(0,0), parent_rot=0):
         rad = math.radians(parent_rot)
@@ -196,19 +533,26 @@ class BoxComponent:
         return (parent_pos[0] + go_x, parent_pos[1] + go_y), parent_rot + self.layout_rot
 
     def get_layout_2d(self, parent_pos=(0,0), parent_rot=0):
-        my_pos, my_rot = self.get_layout_transform_2d(parent_pos, parent_rot)
-        rad = math.radians(my_rot)
-        c, s = math.cos(rad), math.sin(rad)
-        
-        def to_g(pt): return (pt[0]*c - pt[1]*s + my_pos[0], pt[0]*s + pt[1]*c + my_pos[1])
+        cache = self._layout
+        if cache is None or cache[0] != (parent_pos, parent_rot):
+            my_pos, my_rot = self.get_layout_transform_2d(parent_pos, parent_rot)
+            rad = math.radians(my_rot)
+            c, s = math.cos(rad), math.sin(rad)
+            
+            def to_g(pt): return (pt[0]*c - pt[1]*s + my_pos[0], pt[0]*s + pt[1]*c + my_pos[1])
 
-        gp = []
-        for x, y in self.polygon: gp.append(to_g((x,y)))
-        data = [{'coords': gp, 'type': self.label, 'id': self.name}]
+            gp = []
+            for x, y in self.polygon: gp.append(to_g((x,y)))
+            own = {'coords': gp, 'type': self.label, 'id': self.name}
+            
+            own_creases = []
+            w = self.width; p1, p2 = (w/2, 0), (-w/2, 0)
+            if self.parent: own_creases.append([to_g(p1), to_g(p2)])
+            cache = self._layout = ((parent_pos, parent_rot), (my_pos, my_rot), own, own_creases)
         
-        creases = []
-        w = self.width; p1, p2 = (w/2, 0), (-w/2, 0)
-        if self.parent: creases.append([to_g(p1), to_g(p2)])
+        _, (my_pos, my_rot), own, own_creases = cache
+        data = [own]
+        creases = list(own_creases)
         
         for ch in self.children:
             d, cr = ch.get_layout_2d(my_pos, my_rot)
@@ -216,11 +560,35 @@ class BoxComponent:
             
         return data, creases
 
+    def shape_stats(self):
+        """Misure che non dipendono dal piazzamento nel layout: area, perimetro, riquadro locale (lo, hi) e
+        lunghezza dei lati (propri e del padre) che giacciono sulla cordonatura, dove non si taglia."""
+        p = self.parent
+        key = (self.revision, p.revision if p else None, self.layout_pos, self.layout_rot)
+        if self._stats is None or self._stats[0] != key:
+            # Poligoni di poche decine di punti: in puro Python si fa prima che con NumPy
+            pts = self.polygon
+            q = pts[1:] + pts[:1]
+            area = abs(sum(x1*y2 - y1*x2 for (x1, y1), (x2, y2) in zip(pts, q))) / 2
+            perimeter = sum(math.hypot(x2 - x1, y2 - y1) for (x1, y1), (x2, y2) in zip(pts, q))
+            xs, ys = [x for x, _ in pts], [y for _, y in pts]
+            overlap = 0.0
+            if p:
+                # Cordonatura sul lato y = 0 del pannello, vista anche nel riferimento del padre
+                a, b = (self.width/2, 0.0), (-self.width/2, 0.0)
+                rad = math.radians(self.layout_rot)
+                c, s = math.cos(rad), math.sin(rad)
+                (lx, ly) = self.layout_pos
+                def to_parent(x, y): return (x*c - y*s + lx, x*s + y*c + ly)
+                overlap = crease_overlap(pts, a, b) + crease_overlap(p.polygon, to_parent(*a), to_parent(*b))
+            self._stats = (key, (area, perimeter, ([min(xs), min(ys)], [max(xs), max(ys)]), overlap))
+        return self._stats[1]
+
 class Fondo(BoxComponent):
     def generate_shape(self):
         w, h = self.width, self.height
         pts = [(-w/2, -h/2), (w/2, -h/2), (w/2, h/2), (-w/2, h/2)]
-        self.polygon = round_poly(pts, 2.0)
+        self.outline = pts
 
 class Fianco(BoxComponent):
     def __init__(self, name, w, h, t, p, edge, shape='rect', pars={}):
@@ -256,7 +624,7 @@ class Fianco(BoxComponent):
         else: 
             pts = [(w/2, 0), (w/2, -h), (-w/2, -h), (-w/2, 0)]
         
-        self.polygon = round_poly(pts, 2.0)
+        self.outline = pts
 
 class Testata(BoxComponent):
     def __init__(self, name, w, h, t, p, edge, shape='rect', pars={}):
@@ -281,62 +649,434 @@ class Testata(BoxComponent):
         else: 
             pts = [(w/2, 0), (w/2, -h), (-w/2, -h), (-w/2, 0)]
             
-        self.polygon = round_poly(pts, 2.0)
+        self.outline = pts
+
+# --- Motore Linee Colla (Sweep sui Lati) ---
+GLUE_MARGIN = 5.0 # Distanza minima della colla dai bordi del pannello (mm)
+
+def glue_edge_table(polys):
+    """Tabella dei lati dei pannelli incollabili, ordinata per y minima.
+    
+    Si costruisce una volta per diagramma e serve tutte le quote y degli ugelli.
+    Colonne: y minima, y massima, x1, y1, x2, y2, indice del poligono."""
+    owners = [k for k, poly in enumerate(polys)
+              if poly['type'] in ('fianchi', 'testate', 'ext') or 'Reinf' in poly['id']]
+    if not owners: return np.zeros((0, 7))
+    sizes = np.array([len(polys[k]['coords']) for k in owners])
+    p1 = np.array([c for k in owners for c in polys[k]['coords']], dtype=float)
+    start = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    nxt = start + (np.arange(len(p1)) - start + 1) % np.repeat(sizes, sizes)
+    p2 = p1[nxt]
+    
+    # Lati orizzontali (o quasi) non intersecano mai una retta y = cost.
+    keep = np.abs(p2[:, 1] - p1[:, 1]) > 1e-5
+    table = np.column_stack((np.minimum(p1[:, 1], p2[:, 1]), np.maximum(p1[:, 1], p2[:, 1]),
+                             p1, p2, np.repeat(owners, sizes)))[keep]
+    return table[np.argsort(table[:, 0], kind='stable')]
+
+# --- CALCOLO POSIZIONI Y (Priorità Esterno, Cascata) ---
+def glue_positions(limit_inner, limit_fianco, limit_reinf, limit_flap):
+    """Quote y dei 4 ugelli su un lato, dall'esterno verso il fondo, e se il vincolo dei 15 mm dal fondo
+    ha dovuto spostarle."""
+    direction = 1 if limit_inner > limit_fianco else -1
+    candidates = []
+
+    # GRUPPO 1: RADDOPPI/FIANCATA (Priorità 1)
+    l_outer = limit_reinf if limit_reinf is not None else limit_fianco
+    t1 = l_outer + (5 * direction)
+    t2 = t1 + (15 * direction)
+    candidates.append(t1)
+    candidates.append(t2)
+
+    # GRUPPO 2: LEMBI PLATFORM (Priorità 2)
+    if limit_flap is not None:
+        t3 = limit_flap + (5 * direction)
+        t4 = t3 + (15 * direction)
+        candidates.append(t3)
+        candidates.append(t4)
+
+    while len(candidates) < 4:
+         candidates.append(candidates[-1] + (15 * direction))
+
+    # Sort Outer->Inner
+    if direction == 1: candidates.sort()
+    else: candidates.sort(reverse=True)
+
+    # Merge
+    merged = []
+    if candidates:
+        merged.append(candidates[0])
+        for c in candidates[1:]:
+            if abs(c - merged[-1]) > 2.0: merged.append(c)
+
+    final_y = merged[:4]
+    while len(final_y) < 4: final_y.append(final_y[-1] + (15 * direction))
+
+    # Spaziatura 10mm
+    for i in range(1, 4):
+        prev, curr = final_y[i-1], final_y[i]
+        if abs(curr - prev) < 10.0: final_y[i] = prev + (10 * direction)
+
+    # Vincolo Fondo (Min 15mm)
+    limit_safe = limit_inner - (15 * direction)
+    clamped = (final_y[3] - limit_safe) * direction > 0
+    if clamped:
+        final_y[3] = limit_safe
+        if abs(final_y[3] - final_y[2]) < 10.0:
+             final_y[2] = final_y[3] - (10 * direction)
+             if abs(final_y[2] - final_y[1]) < 10.0:
+                  final_y[1] = final_y[2] - (10 * direction)
+
+    return final_y, clamped
+
+def glue_sweep(table, polys, ys, split_half=None):
+    """Segmenti colla per ogni quota in ys (stesso ordine), con margini e divisione sulle spalle dei fianchi ferro.
+    
+    Sono candidati solo i lati con y minima sotto la quota piu' alta (prefisso della tabella ordinata);
+    intersezioni di tutte le quote con tutti i candidati si calcolano in un solo passaggio vettoriale."""
+    out = [[] for _ in ys]
+    if not len(ys): return out
+    cand = table[:np.searchsorted(table[:, 0], max(ys), side='left')]
+    y = np.asarray(ys, dtype=float)[:, None]
+    qi, ei = np.nonzero((cand[:, 0] < y) & (cand[:, 1] >= y))
+    if not len(qi): return out
+    
+    x1, y1, x2, y2 = cand[ei, 2], cand[ei, 3], cand[ei, 4], cand[ei, 5]
+    yq = y[qi, 0]
+    xs = x1 + (yq - y1) / (y2 - y1) * (x2 - x1)
+    owner = cand[ei, 6]
+    order = np.lexsort((xs, owner, qi))
+    xs, owner, qi = xs[order].tolist(), owner[order].astype(int).tolist(), qi[order].tolist()
+    
+    start = 0
+    while start < len(owner):
+        q, k = qi[start], owner[start]
+        end = start
+        while end < len(owner) and owner[end] == k and qi[end] == q: end += 1
+        y_val, segs = ys[q], out[q]
+        split = split_half is not None and polys[k]['type'] == 'fianchi'
+        for j in range(start, end - 1, 2):
+            x_start = xs[j] + GLUE_MARGIN
+            x_end = xs[j+1] - GLUE_MARGIN
+            if x_start >= x_end: continue
+            
+            if split:
+                # Spalla Sinistra: x < -c_half, Spalla Destra: x > c_half (margine anche sullo scasso)
+                seg_L_end = min(x_end, -split_half - GLUE_MARGIN)
+                if x_start < seg_L_end: segs.append([(x_start, y_val), (seg_L_end, y_val)])
+                seg_R_start = max(x_start, split_half + GLUE_MARGIN)
+                if seg_R_start < x_end: segs.append([(seg_R_start, y_val), (x_end, y_val)])
+            else:
+                segs.append([(x_start, y_val), (x_end, y_val)])
+        start = end
+    return out
+
+# --- Metriche di Produzione ---
+GLUE_NOZZLES = 4 # Ugelli colla (indici 0..3 in glue_lines)
+# Misure per il preventivo, in mm e mm^2: riquadro, area di cartone, taglio, cordonatura, colla (totale e
+# per ugello) e se la colla ha dovuto rispettare il vincolo dei 15 mm dal fondo
+Metrics = namedtuple('Metrics', ('bbox_w', 'bbox_h', 'board_area', 'cut_length', 'crease_length',
+                                 'glue_length', 'glue_lengths', 'glue_clamped'))
+EMPTY_METRICS = Metrics(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, (0.0,) * GLUE_NOZZLES, False)
+
+def crease_overlap(pts, a, b, tol=1e-6):
+    """Lunghezza dei lati del poligono chiuso pts [(x, y)] che giacciono sul segmento a-b."""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length = math.hypot(dx, dy)
+    if length < 1e-12: return 0.0
+    ux, uy = dx / length, dy / length
+    # Per punto: sulla retta a-b? e ascissa lungo di essa
+    on, t = [], []
+    for x, y in pts:
+        x -= a[0]; y -= a[1]
+        on.append(abs(x*uy - y*ux) < tol); t.append(x*ux + y*uy)
+    total = 0.0
+    for i in range(len(t)):
+        j = (i + 1) % len(t)
+        if on[i] and on[j]:
+            ov = min(max(t[i], t[j]), length) - max(min(t[i], t[j]), 0)
+            if ov > 0: total += ov
+    return total
+
+def glue_totals(glue_lines):
+    per = [0.0] * GLUE_NOZZLES
+    for (g1, g2), idx in glue_lines: per[idx] += math.hypot(g2[0] - g1[0], g2[1] - g1[1])
+    return sum(per), tuple(per)
+
+def diagram_metrics(diagram, glue_clamped=False):
+    """Metrics di una fustella qualsiasi (uscita di get_2d_diagram), dalle sole coordinate. Il taglio e' il
+    contorno dei pannelli meno i tratti che giacciono sulle cordonature (i lati in comune non si tagliano).
+    Per una build conviene BoxManager.metrics, in forma chiusa e in cache."""
+    polys, cut_lines, creases, glue_lines = diagram
+    if not polys: return EMPTY_METRICS._replace(glue_clamped=glue_clamped)
+    m = {'crease_length': 0.0}
+    sizes = [len(q['coords']) for q in polys]
+    p1 = np.array([c for q in polys for c in q['coords']], dtype=float)
+    start = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    p2 = p1[start + (np.arange(len(p1)) - start + 1) % np.repeat(sizes, sizes)]
+    lo, hi = p1.min(axis=0), p1.max(axis=0)
+    m['bbox_w'], m['bbox_h'] = float(hi[0] - lo[0]), float(hi[1] - lo[1])
+    m['board_area'] = float(abs(np.add.reduceat(p1[:, 0] * p2[:, 1] - p1[:, 1] * p2[:, 0], np.cumsum([0] + sizes[:-1]))).sum() / 2)
+
+    edge = np.hypot(*(p2 - p1).T)
+    cut = float(edge.sum())
+    if len(creases):
+        c = np.asarray(creases, dtype=float).reshape(-1, 2, 2)
+        a, d = c[:, 0], c[:, 1] - c[:, 0]
+        length = np.hypot(d[:, 0], d[:, 1])
+        m['crease_length'] = float(length.sum())
+        ux, uy = d[:, 0] / np.maximum(length, 1e-12), d[:, 1] / np.maximum(length, 1e-12)
+        # Lati collineari con ogni cordonatura (E, C) e loro sovrapposizione lungo di essa
+        x1, y1 = p1[:, 0:1] - a[:, 0], p1[:, 1:2] - a[:, 1]
+        x2, y2 = p2[:, 0:1] - a[:, 0], p2[:, 1:2] - a[:, 1]
+        on = (np.abs(x1*uy - y1*ux) < 1e-6) & (np.abs(x2*uy - y2*ux) < 1e-6)
+        t1, t2 = x1*ux + y1*uy, x2*ux + y2*uy
+        overlap = np.minimum(np.maximum(t1, t2), length) - np.maximum(np.minimum(t1, t2), 0)
+        cut -= float(overlap[on & (overlap > 0)].sum())
+    m['cut_length'] = cut
+    m['glue_length'], m['glue_lengths'] = glue_totals(glue_lines)
+    return Metrics(glue_clamped=glue_clamped, **m)
+
+# Parametri di default (gli stessi valori iniziali del pannello PackagingApp)
+DEFAULT_PARAMS = {
+    'L': 400.0, 'W': 300.0, 'thickness': 5.0,
+    'h_fianchi': 100.0, 'fianchi_shape': 'ferro', 'fianchi_h_low': 60.0, 'fianchi_cutout_w': 220.0,
+    'fianchi_r_active': True, 'fianchi_r_h': 40.0,
+    'h_testate': 100.0, 'testate_shape': 'ferro', 'testate_h_low': 60.0, 'testate_cutout_w': 180.0,
+    'testate_r_active': True, 'testate_r_h': 30.0,
+    'platform_active': True, 'fascia_h': 35.0, 'plat_flap_w': 40.0,
+    'F': 120.0,
+}
+
+# Parametri da cui dipende ciascun gruppo di componenti (ricostruzione incrementale)
+PARAM_DEPS = {
+    'fondo':   ('L', 'W', 'thickness'),
+    'fianchi': ('L', 'thickness', 'h_fianchi', 'fianchi_shape', 'fianchi_cutout_w', 'fianchi_h_low',
+                'fianchi_r_active', 'fianchi_r_h', 'platform_active', 'fascia_h', 'plat_flap_w'),
+    'testate': ('W', 'thickness', 'h_testate', 'testate_shape', 'testate_cutout_w', 'testate_h_low',
+                'testate_r_active', 'testate_r_h'),
+    'lembi':   ('thickness', 'h_testate', 'F'),
+    'fasce':   ('W', 'thickness', 'platform_active', 'fascia_h', 'plat_flap_w'),
+}
+
+class ComponentIndex:
+    """Indici dell'albero in ordine di visita (radice, poi i figli nell'ordine di aggancio): nodi,
+    per nome, per gruppo di piega e per profondita'. Si ricostruiscono in un solo passaggio quando
+    una build cambia l'albero; pose e animazione li leggono senza visitare l'albero."""
+
+    def __init__(self, root=None):
+        self.nodes = []
+        self.by_name = {} # nome -> nodi con quel nome (Ext1, Ext2... si ripetono sotto le due testate)
+        self.by_role = {r: [] for r in FOLD_ROLES}
+        self.by_depth = []
+        stack = [root] if root else []
+        while stack:
+            n = stack.pop()
+            self.nodes.append(n)
+            self.by_name.setdefault(n.name, []).append(n)
+            if n.role: self.by_role[n.role].append(n)
+            if n.depth == len(self.by_depth): self.by_depth.append([])
+            self.by_depth[n.depth].append(n)
+            stack.extend(reversed(n.children))
+
+    def __len__(self): return len(self.nodes)
+
+    def find(self, name):
+        """Nodo con quel nome (l'ultimo in ordine di visita se ripetuto), o None."""
+        nodes = self.by_name.get(name)
+        return nodes[-1] if nodes else None
 
 class BoxManager:
-    def __init__(self): self.root = None
+    def __init__(self):
+        self.root = None
+        self.index = ComponentIndex() # Indici dei nodi dell'albero corrente
+        self.params = None # Parametri dell'ultima build
+        self.angles = {} # Stato di piega corrente, riapplicato ai nodi rigenerati
+        self.revision = 0 # Incrementato a ogni build che modifica l'albero
+        self.dirty = set() # Componenti rigenerati, riagganciati o rimossi dall'ultima build
+        self._diagram = None # (chiave, risultato) dell'ultimo get_2d_diagram
+        self._glue_table = None # (revisione, tabella lati) per le linee colla
+        self.glue_clamped = False # L'ultimo diagramma ha dovuto rispettare il vincolo dei 15 mm dal fondo
+        self._local_mesh = None # (revisione, Mesh locale di tutti i pannelli, vertici per pannello)
+        self._metrics = None # (chiave, Metrics) dell'ultimo metrics
     
     def build(self, p):
+        """Ricostruisce solo i gruppi che dipendono dai parametri cambiati rispetto alla build precedente."""
+        p = dict(p)
+        if self.root is None or self.params is None: groups = set(PARAM_DEPS)
+        else:
+            changed = {k for k in set(p) | set(self.params) if p.get(k) != self.params.get(k)}
+            groups = {g for g, keys in PARAM_DEPS.items() if changed.intersection(keys)}
+        self.dirty = set()
+        if groups:
+            try: self._build_groups(p, groups)
+            except Exception:
+                self.params = None # Albero ricostruito a meta': la prossima build riparte da zero
+                raise
+        self.params = p # Solo a build riuscita: e' il riferimento del confronto incrementale
+        return self.dirty
+
+    def _build_groups(self, p, groups):
+        """Rigenera nell'albero i gruppi indicati con i parametri p."""
         L, W = p['L'], p['W']
         T = p.get('thickness', 5.0)
-        HF, HT, F = p['h_fianchi'], p['h_testate'], p['F']
         
-        WT = W - (2 * T)
-        WF = W 
-        LF = L
-        HL = HT - T 
-
-        self.root = Fondo("Fondo", L, W, T, None, None, 'fondo')
+        if self.root is None or 'fondo' in groups and 'testate' in groups and 'fianchi' in groups:
+            if self.root: self._mark_dirty(self.root)
+            self.root = Fondo("Fondo", L, W, T, None, None, 'fondo')
+            self._build_fianchi(p); self._build_testate(p)
+        else:
+            if 'fondo' in groups:
+                self.root.width, self.root.height, self.root.thickness = L, W, T
+                self.root.generate_shape()
+                for c in self.root.children: self.root.attach(c, c.attachment)
+                self._mark_dirty(self.root)
+            if 'fianchi' in groups: self._build_fianchi(p)
+            if 'testate' in groups: self._build_testate(p)
+            else:
+                for t in self.root.children:
+                    if t.label != 'testate': continue
+                    if 'lembi' in groups: self._build_lembi(t, p)
+                    if 'fasce' in groups: self._build_fasce(t, p)
         
-        # FIANCHI
+        self.index = ComponentIndex(self.root)
+        self.round_pending()
+        self.set_angles(self.angles)
+        self.revision += 1
+
+    def round_pending(self):
+        """Arrotonda in un solo passaggio vettoriale i contorni dei nodi rigenerati."""
+        groups = {}
+        for n in self.index.nodes:
+            if n._polygon is None: groups.setdefault(n.corner_radius, []).append(n)
+        for radius, nodes in groups.items():
+            for n, poly in zip(nodes, round_polys([n.outline for n in nodes], radius)): n.set_rounded(poly)
+
+    def snapshot(self):
+        """Copia indipendente del manager, da consegnare a un altro thread."""
+        s = copy.copy(self)
+        s.root = self.root.clone() if self.root else None
+        s.index = ComponentIndex(s.root)
+        s.params = dict(self.params) if self.params else None
+        s.angles = dict(self.angles)
+        s.dirty = set()
+        return s
+
+    def _mark_dirty(self, node):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            self.dirty.add(n); stack.extend(n.children)
+
+    def _rebuild(self, parent, old, make):
+        """Sostituisce i figli old di parent con quelli creati da make(), nella stessa posizione."""
+        idx = min((parent.children.index(n) for n in old), default=len(parent.children))
+        for n in old:
+            parent.children.remove(n); self._mark_dirty(n)
+        first = len(parent.children)
+        make()
+        new = parent.children[first:]
+        del parent.children[first:]
+        parent.children[idx:idx] = new
+        for n in new: self._mark_dirty(n)
+        return new
+
+    def _build_fianchi(self, p):
+        L, T = p['L'], p.get('thickness', 5.0)
+        HF = p['h_fianchi']
+        LF = L
         pf = {'cutout_w': p.get('fianchi_cutout_w', L/2), 'h_low': p.get('fianchi_h_low', 0),
               'r_active': p.get('fianchi_r_active', False), 'r_h': p.get('fianchi_r_h', 30),
               'plat_active': p.get('platform_active', False), 'fascia_h': p.get('fascia_h', 30), 'plat_flap_w': p.get('plat_flap_w', 40)}
         sf = p['fianchi_shape']
-        Fianco("Fianco_T", LF, HF, T, self.root, 'top', sf, pf)
-        Fianco("Fianco_B", LF, HF, T, self.root, 'bottom', sf, pf)
         
-        # TESTATE
+        def make():
+            Fianco("Fianco_T", LF, HF, T, self.root, 'top', sf, pf)
+            Fianco("Fianco_B", LF, HF, T, self.root, 'bottom', sf, pf)
+        self._rebuild(self.root, [c for c in self.root.children if c.label == 'fianchi'], make)
+
+    def _build_testate(self, p):
+        W, T = p['W'], p.get('thickness', 5.0)
+        HT = p['h_testate']
+        WT = W - (2 * T)
         pt = {'cutout_w': p.get('testate_cutout_w', W/2), 'h_low': p.get('testate_h_low', 0),
               'r_active': p.get('testate_r_active', False), 'r_h': p.get('testate_r_h', 30)}
         st = p['testate_shape']
-        tl = Testata("Testata_L", WT, HT, T, self.root, 'left', st, pt)
-        tr = Testata("Testata_R", WT, HT, T, self.root, 'right', st, pt)
         
-        # LEMBI E PIATTAFORMA
-        for t in [tl, tr]:
-            l1 = BoxComponent(f"{t.name}_L1", HL, F, T, t, 'left', 'lembi'); l1.fold_axis = 'y'
-            l2 = BoxComponent(f"{t.name}_L2", HL, F, T, t, 'right', 'lembi'); l2.fold_axis = 'y'
-            
-            if p.get('platform_active'):
-                fh, ext_w = p.get('fascia_h', 30), p.get('plat_flap_w', 30)
-                if pt['r_active'] and st == 'ferro':
-                    cutout = t.pars['cutout_w']
-                    sh_fascia = (WF - cutout) / 2
-                    offset_val = (sh_fascia - t.shoulder_val) / 2
-                    fl = BoxComponent(f"{t.name}_Fascia_L", sh_fascia, fh, T, t, 'leg_left', 'fasce', custom_offset=offset_val)
-                    BoxComponent("ExtL", fh, ext_w, T, fl, 'left', 'ext') 
-                    fr = BoxComponent(f"{t.name}_Fascia_R", sh_fascia, fh, T, t, 'leg_right', 'fasce', custom_offset=offset_val)
-                    BoxComponent("ExtR", fh, ext_w, T, fr, 'right', 'ext')
-                else:
-                    fascia = BoxComponent(f"{t.name}_Fascia", WF, fh, T, t, 'bottom', 'fasce')
-                    BoxComponent("Ext1", fh, ext_w, T, fascia, 'left', 'ext')
-                    BoxComponent("Ext2", fh, ext_w, T, fascia, 'right', 'ext')
-
-    def get_3d_faces(self): return self.root.get_mesh_3d() if self.root else []
+        def make():
+            Testata("Testata_L", WT, HT, T, self.root, 'left', st, pt)
+            Testata("Testata_R", WT, HT, T, self.root, 'right', st, pt)
+        for t in self._rebuild(self.root, [c for c in self.root.children if c.label == 'testate'], make):
+            self._build_lembi(t, p)
+            self._build_fasce(t, p)
+
+    def _build_lembi(self, t, p):
+        T, F = p.get('thickness', 5.0), p['F']
+        HL = p['h_testate'] - T
+        names = (f"{t.name}_L1", f"{t.name}_L2")
+        
+        def make():
+            l1 = BoxComponent(names[0], HL, F, T, t, 'left', 'lembi'); l1.fold_axis = 'y'
+            l2 = BoxComponent(names[1], HL, F, T, t, 'right', 'lembi'); l2.fold_axis = 'y'
+        self._rebuild(t, [c for c in t.children if c.name in names], make)
+
+    def _build_fasce(self, t, p):
+        T, WF = p.get('thickness', 5.0), p['W']
+        
+        def make():
+            if not p.get('platform_active'): return
+            fh, ext_w = p.get('fascia_h', 30), p.get('plat_flap_w', 30)
+            if t.pars['r_active'] and t.shape == 'ferro':
+                cutout = t.pars['cutout_w']
+                sh_fascia = (WF - cutout) / 2
+                offset_val = (sh_fascia - t.shoulder_val) / 2
+                fl = BoxComponent(f"{t.name}_Fascia_L", sh_fascia, fh, T, t, 'leg_left', 'fasce', custom_offset=offset_val)
+                BoxComponent("ExtL", fh, ext_w, T, fl, 'left', 'ext') 
+                fr = BoxComponent(f"{t.name}_Fascia_R", sh_fascia, fh, T, t, 'leg_right', 'fasce', custom_offset=offset_val)
+                BoxComponent("ExtR", fh, ext_w, T, fr, 'right', 'ext')
+            else:
+                fascia = BoxComponent(f"{t.name}_Fascia", WF, fh, T, t, 'bottom', 'fasce')
+                BoxComponent("Ext1", fh, ext_w, T, fascia, 'left', 'ext')
+                BoxComponent("Ext2", fh, ext_w, T, fascia, 'right', 'ext')
+        self._rebuild(t, [c for c in t.children if c.label == 'fasce'], make)
+
+    def panels(self):
+        """Nodi in ordine di visita (radice, poi i figli nell'ordine di aggancio)."""
+        return list(self.index.nodes)
+
+    def find(self, name):
+        return self.index.find(name)
+
+    def get_mesh(self, hinges=True):
+        """Mesh della scatola in mondo nella posa corrente (pannelli, piu' le cerniere), face_panel indice in panels."""
+        panels = self.panels()
+        local = self._local_mesh
+        if local is None or local[0] != self.revision:
+            meshes = [n.local_mesh() for n in panels]
+            local = self._local_mesh = (self.revision, Mesh.concat(meshes), [len(m.vertices) for m in meshes])
+        _, mesh, counts = local
+        
+        # Una trasformazione rigida per pannello, applicata al suo blocco di vertici
+        verts = np.empty_like(mesh.vertices); norms = np.empty_like(mesh.normals)
+        start = 0
+        for n, count in zip(panels, counts):
+            w = n.world_matrix().astype(np.float32); end = start + count
+            verts[start:end] = mesh.vertices[start:end] @ w[:3, :3].T + w[:3, 3]
+            norms[start:end] = mesh.normals[start:end] @ w[:3, :3].T
+            start = end
+        out = Mesh(verts, norms, mesh.indices, mesh.face_type, mesh.face_panel, panels)
+        if not hinges or len(panels) < 2: return out
+        
+        h = hinge_mesh(panels[1:])
+        return Mesh(np.concatenate([out.vertices, h.vertices]), np.concatenate([out.normals, h.normals]),
+                    np.concatenate([out.indices, h.indices + np.uint32(len(out.vertices))]),
+                    np.concatenate([out.face_type, h.face_type]),
+                    np.concatenate([out.face_panel, h.face_panel + 1]), panels) # Cerniera -> indice del suo pannello
     
     def get_2d_diagram(self, p=None):
         if not self.root: return [], [], [], []
+        key = (self.revision, tuple(sorted(p.items())) if p else None)
+        if self._diagram and self._diagram[0] == key: return self._diagram[1]
         
         polys, creases = self.root.get_layout_2d()
         cut_lines = []
@@ -344,7 +1084,13 @@ class BoxManager:
             pts = poly['coords']
             for i in range(len(pts)): cut_lines.append([pts[i], pts[(i+1)%len(pts)]])
             
-        glue_lines = []
+        glue_lines, self.glue_clamped = self.glue_lines(polys, p)
+        self._diagram = (key, (polys, cut_lines, creases, glue_lines))
+        return polys, cut_lines, creases, glue_lines
+
+    def glue_lines(self, polys, p):
+        """Linee colla [(segmento, ugello)] sul layout polys e se il vincolo dei 15 mm le ha spostate."""
+        glue_lines, clamped = [], False
         if p:
             L, W = p['L'], p['W']
             HF = p['h_fianchi'] 
@@ -356,115 +1102,6 @@ class BoxManager:
             h_low = p.get('fianchi_h_low', 60)
             f_cutout = p.get('fianchi_cutout_w', 0)
             
-            # --- FUNZIONE GENERAZIONE SEGMENTI (CLIP & SPLIT) ---
-            def generate_valid_segments(y_val, all_polys):
-                valid_segments = []
-                for poly in all_polys:
-                    ptype = poly['type']
-                    pid = poly['id']
-                    
-                    # 1. Filtro Aree Ammesse
-                    is_valid = False
-                    if ptype == 'fianchi': is_valid = True
-                    elif ptype == 'testate': is_valid = True
-                    elif ptype == 'ext': is_valid = True
-                    elif 'Reinf' in pid: is_valid = True
-                    
-                    if not is_valid: continue
-                    
-                    # 2. Intersezione Geometrica Linea-Poligono
-                    pts = poly['coords']
-                    intersections = []
-                    for i in range(len(pts)):
-                        p1, p2 = pts[i], pts[(i+1)%len(pts)]
-                        if (p1[1] < y_val <= p2[1]) or (p2[1] < y_val <= p1[1]):
-                            if abs(p2[1] - p1[1]) > 1e-5:
-                                t = (y_val - p1[1]) / (p2[1] - p1[1])
-                                x_int = p1[0] + t * (p2[0] - p1[0])
-                                intersections.append(x_int)
-                    
-                    intersections.sort()
-                    
-                    # 3. Creazione Segmenti con Margine 5mm
-                    for k in range(0, len(intersections)-1, 2):
-                        x_start = intersections[k] + 5.0
-                        x_end = intersections[k+1] - 5.0
-                        
-                        if x_start >= x_end: continue
-                        
-                        # 4. SPLIT SU FIANCATE FERRO DI CAVALLO (Separazione Spalle)
-                        if ptype == 'fianchi' and p.get('fianchi_shape') == 'ferro':
-                            # La zona centrale "vuota" è [-cutout/2, +cutout/2]
-                            c_half = f_cutout / 2
-                            # Verifichiamo se il segmento attraversa il centro o sta sulle spalle
-                            
-                            # Spalla Sinistra: x < -c_half
-                            seg_L_end = min(x_end, -c_half - 5.0) # Margine 5mm anche qui
-                            if x_start < seg_L_end:
-                                valid_segments.append([(x_start, y_val), (seg_L_end, y_val)])
-                                
-                            # Spalla Destra: x > c_half
-                            seg_R_start = max(x_start, c_half + 5.0)
-                            if seg_R_start < x_end:
-                                valid_segments.append([(seg_R_start, y_val), (x_end, y_val)])
-                        else:
-                            # Caso Standard (Testate, Lembi, o Fianchi Rettangolari)
-                            valid_segments.append([(x_start, y_val), (x_end, y_val)])
-                            
-                return valid_segments
-
-            # --- CALCOLO POSIZIONI Y (Priorità Esterno, Cascata) ---
-            def calculate_positions(limit_inner, limit_fianco, limit_reinf, limit_flap):
-                direction = 1 if limit_inner > limit_fianco else -1
-                candidates = []
-                
-                # GRUPPO 1: RADDOPPI/FIANCATA (Priorità 1)
-                l_outer = limit_reinf if limit_reinf is not None else limit_fianco
-                t1 = l_outer + (5 * direction)
-                t2 = t1 + (15 * direction)
-                candidates.append(t1)
-                candidates.append(t2)
-                
-                # GRUPPO 2: LEMBI PLATFORM (Priorità 2)
-                if limit_flap is not None:
-                    t3 = limit_flap + (5 * direction)
-                    t4 = t3 + (15 * direction)
-                    candidates.append(t3)
-                    candidates.append(t4)
-                
-                while len(candidates) < 4:
-                     candidates.append(candidates[-1] + (15 * direction))
-
-                # Sort Outer->Inner
-                if direction == 1: candidates.sort()
-                else: candidates.sort(reverse=True)
-                
-                # Merge
-                merged = []
-                if candidates:
-                    merged.append(candidates[0])
-                    for c in candidates[1:]:
-                        if abs(c - merged[-1]) > 2.0: merged.append(c)
-                
-                final_y = merged[:4]
-                while len(final_y) < 4: final_y.append(final_y[-1] + (15 * direction))
-
-                # Spaziatura 10mm
-                for i in range(1, 4):
-                    prev, curr = final_y[i-1], final_y[i]
-                    if abs(curr - prev) < 10.0: final_y[i] = prev + (10 * direction)
-                
-                # Vincolo Fondo (Min 15mm)
-                limit_safe = limit_inner - (15 * direction)
-                if (final_y[3] - limit_safe) * direction > 0:
-                    final_y[3] = limit_safe
-                    if abs(final_y[3] - final_y[2]) < 10.0:
-                         final_y[2] = final_y[3] - (10 * direction)
-                         if abs(final_y[2] - final_y[1]) < 10.0:
-                              final_y[1] = final_y[2] - (10 * direction)
-
-                return final_y
-
             # --- ESECUZIONE ---
             # Lato ALTO
             y_top_inner = -W/2
@@ -472,7 +1109,7 @@ class BoxManager:
             y_top_fianco = -(W/2 + HF) 
             y_top_flap = -(W/2 + plat_flap_w) if plat_active else None
             
-            Ys_top = calculate_positions(y_top_inner, y_top_fianco, y_top_reinf, y_top_flap)
+            Ys_top, clamp_top = glue_positions(y_top_inner, y_top_fianco, y_top_reinf, y_top_flap)
             
             # Lato BASSO
             y_btm_inner = W/2
@@ -480,24 +1117,146 @@ class BoxManager:
             y_btm_fianco = W/2 + HF
             y_btm_flap = (W/2 + plat_flap_w) if plat_active else None
             
-            Ys_btm = calculate_positions(y_btm_inner, y_btm_fianco, y_btm_reinf, y_btm_flap)
+            Ys_btm, clamp_btm = glue_positions(y_btm_inner, y_btm_fianco, y_btm_reinf, y_btm_flap)
+            clamped = clamp_top or clamp_btm
+            
+            # Tabella dei lati costruita una volta per layout, poi un solo sweep per le 8 quote
+            if self._glue_table is None or self._glue_table[0] != self.revision:
+                self._glue_table = (self.revision, glue_edge_table(polys))
+            split_half = f_cutout / 2 if p.get('fianchi_shape') == 'ferro' else None
+            segs = glue_sweep(self._glue_table[1], polys, Ys_top + Ys_btm, split_half)
             
             for i in range(4):
-                segs_top = generate_valid_segments(Ys_top[i], polys)
-                for s in segs_top: glue_lines.append((s, i))
-                
-                segs_btm = generate_valid_segments(Ys_btm[i], polys)
-                for s in segs_btm: glue_lines.append((s, i))
+                for s in segs[i]: glue_lines.append((s, i))
+                for s in segs[4 + i]: glue_lines.append((s, i))
+        return glue_lines, clamped
 
-        return polys, cut_lines, creases, glue_lines
+    def metrics(self, p=None):
+        """Metrics della fustella per i parametri p (default: quelli dell'ultima build), in cache per build.
+        In forma chiusa dai pannelli: area, perimetro e tratti sulle cordonature per nodo (in cache per forma),
+        cordonatura = larghezza del lato di aggancio, riquadro dai riquadri locali. Niente linee di taglio
+        ne' altri dati di disegno; la colla si calcola sul layout come nel diagramma.
+        Da diagram_metrics differisce solo se un lato libero cade per caso su una cordonatura di un altro ramo
+        (raddoppio a filo della fascia, scasso piu' largo del pannello): qui quel tratto resta taglio."""
+        if not self.root: return EMPTY_METRICS
+        p = self.params if p is None else p
+        key = (self.revision, tuple(sorted(p.items())) if p else None)
+        if self._metrics and self._metrics[0] == key: return self._metrics[1]
+
+        polys, _ = self.root.get_layout_2d() # Piazzamenti in cache per nodo
+        area = perimeter = overlap = crease = 0.0
+        x0 = y0 = math.inf; x1 = y1 = -math.inf
+        for n in self.index.nodes:
+            a, per, (lo, hi), ov = n.shape_stats()
+            area += a; perimeter += per; overlap += ov
+            if n.parent: crease += abs(n.width)
+            (px, py), rot = n._layout[1]
+            rad = math.radians(rot)
+            c, s = math.cos(rad), math.sin(rad)
+            # Rotazioni a multipli di 90 gradi: bastano gli angoli del riquadro locale
+            pts = ((lo[0], lo[1]), (hi[0], lo[1]), (hi[0], hi[1]), (lo[0], hi[1])) if rot % 90 == 0 else n.polygon
+            for x, y in pts:
+                gx, gy = x*c - y*s + px, x*s + y*c + py
+                if gx < x0: x0 = gx
+                if gx > x1: x1 = gx
+                if gy < y0: y0 = gy
+                if gy > y1: y1 = gy
+
+        glue, clamped = self.glue_lines(polys, p)
+        total, per_nozzle = glue_totals(glue)
+        m = Metrics(x1 - x0, y1 - y0, area, perimeter - overlap, crease, total, per_nozzle, clamped)
+        self._metrics = (key, m)
+        return m
 
     def set_angles(self, angles):
-        def visit(n):
-            if "Reinf" in n.name: n.fold_angle = angles.get('reinf', 0)
-            elif n.label == 'fasce': n.fold_angle = angles.get('fasce', 0)
-            elif n.label == 'ext': n.fold_angle = angles.get('ext', 0)
-            elif n.label == 'lembi': n.fold_angle = angles.get('lembi', 0)
-            elif n.label == 'testate': n.fold_angle = angles.get('testate', 0)
-            elif n.label == 'fianchi': n.fold_angle = angles.get('fianchi', 0)
-            for c in n.children: visit(c)
-        if self.root: visit(self.root)
\ No newline at end of file
+        """Angoli per gruppo di piega (mancanti = 0), scritti sui nodi dall'indice dei ruoli in un passaggio."""
+        self.angles = dict(angles)
+        for role, nodes in self.index.by_role.items():
+            a = angles.get(role, 0)
+            for n in nodes: n.fold_angle = a
+
+    def update_angles(self, changes):
+        """Cambia solo i gruppi indicati, lasciando gli altri come sono."""
+        self.angles.update(changes)
+        by_role = self.index.by_role
+        for role, a in changes.items():
+            for n in by_role.get(role, ()): n.fold_angle = a
+
+# --- PROGRAMMI DI PIEGA E POSE PRECALCOLATE ---
+FOLD_STEPS = ('lembi', 'testate', 'fianchi', 'fasce', 'ext', 'reinf') # Ordine di anim_step
+FOLD_ALL_DT, FOLD_ALL_END = 0.015, 3.0 # Passo e durata di anim_all
+FOLD_STEP_DT = 0.05
+
+def fold_all_angles(t):
+    """Angoli di anim_all al tempo t e se i lembi sono spinti dai fianchi (tracce di sfregamento)."""
+    def lerp(t, s, e, max_a=90): return 0 if t<s else (max_a if t>e else (t-s)/(e-s)*max_a)
+    ang = {}
+    target_lembi   = lerp(t, 0.0, 1.0)
+    target_testate = lerp(t, 0.0, 1.0) 
+    target_fianchi = lerp(t, 0.5, 1.0)
+    
+    ang['testate'] = target_testate
+    ang['fianchi'] = target_fianchi
+    ang['fasce']   = lerp(t, 1.0, 1.5)
+    ang['ext']     = lerp(t, 1.5, 2.5)
+    ang['reinf']   = lerp(t, 2.0, 3.0, 180)
+
+    # Il lembo non puo' compenetrare il fianco: angolo minimo imposto dalla piega del fianco
+    rad_t = math.radians(target_testate)
+    rad_f = math.radians(target_fianchi)
+    if rad_t > 1.55: rad_t = 1.55
+    min_lembo_deg = math.degrees(math.atan(math.tan(rad_f) / math.cos(rad_t)))
+    ang['lembi'] = max(target_lembi, min_lembo_deg)
+    return ang, min_lembo_deg > target_lembi + 0.2
+
+def fold_all_schedule():
+    """Fotogrammi di anim_all (0 = scatola aperta) e flag di spinta, con la stessa progressione del timer."""
+    frames, pushing = [fold_all_angles(0.0)[0]], [False]
+    t = 0.0
+    while t < FOLD_ALL_END:
+        t += FOLD_ALL_DT
+        ang, push = fold_all_angles(t)
+        frames.append(ang); pushing.append(push)
+    return frames, pushing
+
+def fold_step_schedule(key, base):
+    """Fotogrammi di un passo di anim_step: il gruppo key va da 0 al massimo, gli altri restano come in base."""
+    target = 180 if key == 'reinf' else 90
+    frames = [dict(base)]
+    prog = 0.0
+    while prog < 1.0:
+        prog += FOLD_STEP_DT
+        if prog >= 1.0: prog = 1.0
+        frames.append(dict(base, **{key: prog * target}))
+    return frames
+
+class PoseCache:
+    """Matrici mondo di ogni nodo per ogni fotogramma di un programma di piega.
+    Riproduzione, scorrimento e riproduzione all'indietro diventano letture di array;
+    vale finche' il manager non ricostruisce la geometria (revision)."""
+
+    def __init__(self, manager, frames):
+        self.manager, self.revision, self.frames = manager, manager.revision, frames
+        self.nodes = list(manager.index.nodes)
+        pos = {n: i for i, n in enumerate(self.nodes)}
+        parents = [pos.get(n.parent, -1) for n in self.nodes]
+        
+        F, N = len(frames), len(self.nodes)
+        self.angles = np.empty((F, N))
+        self.worlds = np.empty((F, N, 4, 4))
+        for i, (n, pi) in enumerate(zip(self.nodes, parents)):
+            g = n.role
+            self.angles[:, i] = [f.get(g, 0) for f in frames] if g else n.fold_angle
+            m = n._local_matrices(self.angles[:, i])
+            self.worlds[:, i] = m if pi < 0 else self.worlds[:, pi] @ m # Il padre precede sempre il figlio
+
+    def __len__(self): return len(self.frames)
+
+    def valid(self, manager):
+        return manager is self.manager and manager.revision == self.revision
+
+    def apply(self, f):
+        """Porta l'albero al fotogramma f: angoli e matrici mondo scritti direttamente, senza ricalcoli."""
+        for n, a, w in zip(self.nodes, self.angles[f].tolist(), self.worlds[f]):
+            n._fold_angle = a; n._world = w
+        self.manager.angles = dict(self.frames[f])
@@ -1,25 +1,48 @@
 import sys
 import math
-import traceback
+from concurrent.futures import ThreadPoolExecutor
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                                QHBoxLayout, QScrollArea, QPushButton, QLabel, 
-                               QLineEdit, QCheckBox, QTabWidget)
-from PySide6.QtCore import Qt, QTimer
+                               QLineEdit, QCheckBox, QTabWidget, QFileDialog, QMessageBox,
+                               QSlider)
+from PySide6.QtCore import Qt, QTimer, Signal
 
 from config import THEME
 from ui_utils import CollapsibleSection
 from widgets_2d import DrawingArea2D
-from widgets_3d import Viewer3D
-from geometry_oop import BoxManager
+from geometry_oop import BoxManager, PoseCache, FOLD_STEPS, fold_all_schedule, fold_step_schedule
+from contacts import TraceEngine, TRACE_MIN_STEP
+from geocache import GeometryCache
+import profiler
 
 class PackagingApp(QMainWindow):
+    geometry_ready = Signal(object) # Emesso dal worker, consegnato nel thread della GUI
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Packaging CAD Pro (Final Sequence)")
         self.resize(1400, 950)
         self.setStyleSheet(f"QMainWindow {{ background-color: {THEME['bg_ui']}; }}")
 
-        self.box_manager = BoxManager()
+        self.box_manager = BoxManager() # Copia mostrata dalla GUI (animazione, tracce)
+        self.box_params = None
+        
+        # Pipeline di aggiornamento: la geometria si calcola in un worker con un manager proprio.
+        # Un solo job alla volta; le richieste arrivate nel frattempo si riducono all'ultima.
+        self.build_manager = BoxManager()
+        self.geo_cache = GeometryCache() # Geometria gia' calcolata, anche in sessioni precedenti
+        self.cached_mesh = None # Mesh 3D di base dalla cache, mostrata finche' non serve l'albero dei nodi
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.job_seq = 0
+        self.job_running = False
+        self.pending_params = None
+        self.geometry_ready.connect(self.apply_geometry)
+        
+        # Debounce della digitazione ("4" -> "40" -> "400" produce una sola build)
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(120)
+        self.refresh_timer.timeout.connect(self.refresh)
 
         main_w = QWidget()
         self.setCentralWidget(main_w)
@@ -36,29 +59,55 @@ class PackagingApp(QMainWindow):
         scroll.setWidget(self.scroll_content)
         layout.addWidget(scroll)
 
+        # La vista 3D (PyOpenGL e contesto GL) si crea alla prima apertura della sua scheda
         self.tabs = QTabWidget()
         self.canvas_2d = DrawingArea2D()
-        self.viewer_3d = Viewer3D()
+        self.viewer_3d = None
+        self.tab_3d = QWidget()
+        QVBoxLayout(self.tab_3d).setContentsMargins(0, 0, 0, 0)
         self.tabs.addTab(self.canvas_2d, "Progetto 2D")
-        self.tabs.addTab(self.viewer_3d, "Animazione 3D")
+        self.tabs.addTab(self.tab_3d, "Animazione 3D")
+        self.tabs.currentChanged.connect(self.tab_changed)
         layout.addWidget(self.tabs)
         
         self.chk_transp = QCheckBox("Trasparenza 3D")
         self.chk_transp.setStyleSheet(f"color: {THEME['fg_text']}; margin-bottom: 10px;")
-        self.chk_transp.toggled.connect(self.viewer_3d.set_transparency)
+        self.chk_transp.toggled.connect(self.set_transparency)
         self.panel_layout.addWidget(self.chk_transp)
-
-        self.inputs = {}
-        self.build_ui()
         
-        # Setup Animazione
-        self.anim_vars = {'idx': 0, 'prog': 0.0, 'angles': {}, 'key': '', 'active': False, 'comb': False}
+        self.chk_smooth = QCheckBox("Angoli arrotondati lisci 3D")
+        self.chk_smooth.setStyleSheet(f"color: {THEME['fg_text']}; margin-bottom: 10px;")
+        self.chk_smooth.setChecked(True)
+        self.chk_smooth.toggled.connect(self.set_smooth_normals)
+        self.panel_layout.addWidget(self.chk_smooth)
+        
+        self.chk_sweep = QCheckBox("Tracce continue (moto tra fotogrammi)")
+        self.chk_sweep.setStyleSheet(f"color: {THEME['fg_text']}; margin-bottom: 10px;")
+        self.panel_layout.addWidget(self.chk_sweep)
+
+        self.chk_profile = QCheckBox("Profilo prestazioni (overlay)")
+        self.chk_profile.setStyleSheet(f"color: {THEME['fg_text']}; margin-bottom: 10px;")
+        self.chk_profile.setChecked(profiler.enabled)
+        self.chk_profile.toggled.connect(self.set_profiling)
+        self.panel_layout.addWidget(self.chk_profile)
+
+        # Setup Animazione: i programmi sono deterministici, le pose si precalcolano (PoseCache)
+        self.all_frames, self.all_pushing = fold_all_schedule()
+        self.all_poses = None # Pose di anim_all preparate dal worker dopo ogni build
+        self.poses, self.pushing = None, [] # Programma corrente (anim_all o un passo di anim_step)
+        self.anim_vars = {'idx': 0, 'frame': 0, 'dir': 1, 'angles': {}, 'key': '', 'active': False, 'comb': False}
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
         
-        # Traccia dello sfregamento
+        self.inputs = {}
+        self.build_ui()
+        
+        # Traccia dello sfregamento (trace_log: (fotogramma, chiave) per ogni punto, per tornare indietro)
         self.traces = {} 
+        self.trace_log = []
+        self.contacts = None # TraceEngine della geometria mostrata
         
+        self.set_profiling(profiler.enabled)
         self.refresh()
 
     def build_ui(self):
@@ -99,6 +148,23 @@ class PackagingApp(QMainWindow):
         btn_all = QPushButton("▶ ALL"); btn_all.clicked.connect(self.anim_all)
         btn_all.setStyleSheet("background: #FF9800; padding: 10px;")
         self.panel_layout.addWidget(btn_all)
+        
+        btn_rev = QPushButton("◀ INDIETRO"); btn_rev.clicked.connect(self.anim_reverse)
+        btn_rev.setStyleSheet("background: #9E9E9E; padding: 10px;")
+        self.panel_layout.addWidget(btn_rev)
+        
+        self.timeline = QSlider(Qt.Horizontal)
+        self.timeline.setRange(0, len(self.all_frames) - 1)
+        self.timeline.valueChanged.connect(self.scrub)
+        self.panel_layout.addWidget(self.timeline)
+        
+        btn_exp = QPushButton("💾 ESPORTA DXF/SVG"); btn_exp.clicked.connect(self.export_dieline)
+        btn_exp.setStyleSheet(f"background: {THEME['highlight']}; padding: 10px;")
+        self.panel_layout.addWidget(btn_exp)
+
+        btn_trace = QPushButton("⏱ SALVA TRACCIA PROFILO"); btn_trace.clicked.connect(self.save_profile_trace)
+        btn_trace.setStyleSheet("background: #9E9E9E; padding: 10px;")
+        self.panel_layout.addWidget(btn_trace)
         self.panel_layout.addStretch()
 
     def add_sec(self, title, fields):
@@ -111,7 +177,7 @@ class PackagingApp(QMainWindow):
             w = QWidget(); h = QHBoxLayout(w); h.setContentsMargins(0,2,0,2)
             lb = QLabel(l); lb.setFixedWidth(100); lb.setStyleSheet(f"color:{THEME['fg_text']}")
             i = QLineEdit(str(v)); i.setStyleSheet("background:#555; color:white; border:none;")
-            i.textChanged.connect(self.refresh)
+            i.textChanged.connect(self.schedule_refresh)
             h.addWidget(lb); h.addWidget(i); sec.add_widget(w)
             self.inputs[k] = i
 
@@ -119,204 +185,282 @@ class PackagingApp(QMainWindow):
         try: return float(self.inputs[k].text())
         except: return 0.0
 
-    def refresh(self):
+    def collect_params(self):
         p = {k: self.get_val(k) for k in self.inputs}
         p['fianchi_shape'] = 'ferro' if self.cb_f_shape.isChecked() else 'rect'
         p['fianchi_r_active'] = self.cb_f_reinf.isChecked() 
         p['testate_shape'] = 'ferro' if self.cb_t_shape.isChecked() else 'rect'
         p['testate_r_active'] = self.cb_t_reinf.isChecked() 
         p['platform_active'] = self.cb_plat.isChecked()
-        
+        return p
+
+    def schedule_refresh(self):
+        self.refresh_timer.start()
+
+    def refresh(self):
+        self.refresh_timer.stop()
+        self.pending_params = self.collect_params()
+        self.job_seq += 1
+        if not self.job_running: self.start_job()
+
+    def start_job(self):
+        p, self.pending_params = self.pending_params, None
+        self.job_running = True
+        self.executor.submit(self.compute_geometry, p, self.job_seq)
+
+    def compute_geometry(self, p, seq):
+        """Eseguito nel worker: geometria per p. Finche' manca l'albero dei nodi si legge prima la cache
+        su disco, e un colpo non costruisce nulla (vedi GeometryCache)."""
+        result = None
         try:
-            self.box_manager.build(p)
-            self.viewer_3d.set_scene(self.box_manager)
-            self.viewer_3d.update_angles(self.anim_vars.get('angles', {}))
-            
-            polys, cuts, creases, glues = self.box_manager.get_2d_diagram(p)
-            
-            ox, oy = p['L']/2 + 50, p['W']/2 + 50
-            off_p = [{'coords':[(x+ox, y+oy) for x,y in poly['coords']], 'type': poly['type']} for poly in polys]
-            off_c = [[(p1[0]+ox, p1[1]+oy), (p2[0]+ox, p2[1]+oy)] for p1,p2 in cuts]
-            off_cr = [[(p1[0]+ox, p1[1]+oy), (p2[0]+ox, p2[1]+oy)] for p1,p2 in creases]
-            
-            # Gestione offset per coppie (Coordinate, Indice)
-            off_gl = []
-            for lines, idx in glues:
-                p1, p2 = lines
-                p1_off = (p1[0]+ox, p1[1]+oy)
-                p2_off = (p2[0]+ox, p2[1]+oy)
-                off_gl.append( ([p1_off, p2_off], idx) )
-            
-            self.canvas_2d.set_data(off_p, off_c, off_cr, off_gl, p['L'], p['W'], 0,0,0)
-        except Exception: traceback.print_exc()
+            cached = None
+            if self.build_manager.root is None:
+                with profiler.stage('geocache'): cached = self.geo_cache.get(p)
+                if cached and cached.mesh is None: cached = None # Voce di batch/sweep: alla GUI serve anche la mesh
+            if cached: result = (None, None, cached.diagram, cached.mesh)
+            else: result = self.build_geometry(p, store=self.build_manager.root is None)
+        except Exception:
+            profiler.report_error('build')
+            self.build_manager = BoxManager() # Stato incerto: la prossima build riparte da zero
+        self.geometry_ready.emit((seq, p, result))
+
+    def build_geometry(self, p, store=False):
+        """Eseguito nel worker: build, diagramma 2D e cache delle pose; con store la voce va anche su disco."""
+        with profiler.stage('build'): self.build_manager.build(p)
+        with profiler.stage('diagram_2d'): layers = self.build_manager.get_2d_diagram(p) # La tela lavora in coordinate modello
+        if store:
+            try: self.geo_cache.put(p, self.build_manager, mesh=True)
+            except OSError: pass # Cache non scrivibile: si lavora comunque
+        snap = self.build_manager.snapshot()
+        with profiler.stage('pose_cache'): poses = PoseCache(snap, self.all_frames)
+        return snap, poses, layers, None
+
+    def apply_geometry(self, job):
+        """Nel thread della GUI: avvia la richiesta piu' recente e mostra solo il risultato non superato."""
+        seq, p, result = job
+        self.job_running = False
+        if self.pending_params is not None: self.start_job()
+        if result is None or seq != self.job_seq: return
+        self.show_geometry(p, result)
+
+    def show_geometry(self, p, result):
+        manager, poses, layers, mesh = result
+        self.box_params = p
+        self.canvas_2d.set_data(*layers, p['L'], p['W'], 0,0,0)
+        if manager is None:
+            # Dalla cache: diagramma e scatola aperta, l'albero arriva con ensure_tree
+            self.box_manager, self.all_poses, self.cached_mesh = BoxManager(), None, mesh
+            if self.viewer_3d: self.viewer_3d.set_mesh(mesh)
+            return
+        self.box_manager, self.all_poses, self.cached_mesh = manager, poses, None
+        manager.set_angles(self.anim_vars.get('angles', {}))
+        if self.viewer_3d: self.viewer_3d.set_scene(manager)
+
+    def ensure_tree(self):
+        """Albero dei nodi della geometria mostrata, per animazione, tracce ed esportazione. Dopo un colpo
+        della cache non c'e': si costruisce nel worker (dopo l'eventuale job in corso) e lo si attende."""
+        if self.box_manager.root or self.box_params is None: return self.box_manager.root is not None
+        p = self.box_params
+        def job():
+            try: return self.build_geometry(p)
+            except Exception:
+                profiler.report_error('build')
+                self.build_manager = BoxManager()
+        result = self.executor.submit(job).result()
+        if result: self.show_geometry(p, result)
+        return self.box_manager.root is not None
+
+    def export_dieline(self):
+        """Salva la fustella corrente (taglio, cordonature, colla per ugello) in DXF o SVG."""
+        if not self.ensure_tree(): return
+        path, flt = QFileDialog.getSaveFileName(self, "Esporta fustella", "fustella.dxf", "DXF (*.dxf);;SVG (*.svg)")
+        if not path: return
+        from exporter import export_diagram
+        fmt = 'svg' if 'svg' in flt.lower() else 'dxf'
+        if not path.lower().endswith('.' + fmt): path += '.' + fmt
+        try: export_diagram(path, self.box_manager.get_2d_diagram(self.box_params), fmt)
+        except OSError as e: QMessageBox.warning(self, "Esporta fustella", str(e))
+
+    def tab_changed(self, index):
+        if index == 1: self.ensure_viewer()
+
+    def ensure_viewer(self):
+        """Crea la vista 3D se non esiste ancora, allineata allo stato corrente (scena, posa, opzioni, tracce)."""
+        if self.viewer_3d is None:
+            from widgets_3d import Viewer3D
+            v = self.viewer_3d = Viewer3D()
+            v.set_transparency(self.chk_transp.isChecked())
+            v.set_smooth_normals(self.chk_smooth.isChecked())
+            v.overlay.set_active(profiler.enabled)
+            if self.box_manager.root: v.set_scene(self.box_manager)
+            elif self.cached_mesh is not None: v.set_mesh(self.cached_mesh)
+            self.tab_3d.layout().addWidget(v)
+            self.draw_traces()
+        return self.viewer_3d
+
+    def set_transparency(self, on):
+        if self.viewer_3d: self.viewer_3d.set_transparency(on)
+
+    def set_smooth_normals(self, on):
+        if self.viewer_3d: self.viewer_3d.set_smooth_normals(on)
+
+    def set_extra_lines(self, lines):
+        if self.viewer_3d: self.viewer_3d.set_extra_lines(lines)
+
+    def set_profiling(self, on):
+        """Accende le misure (con il registro della sessione) e gli overlay delle due viste."""
+        profiler.enable(on, trace=on)
+        self.canvas_2d.overlay.set_active(on)
+        if self.viewer_3d: self.viewer_3d.overlay.set_active(on)
+
+    def save_profile_trace(self):
+        """Salva la sessione misurata in formato Chrome Trace, per l'analisi in chrome://tracing o Perfetto."""
+        path, _ = QFileDialog.getSaveFileName(self, "Salva traccia profilo", "boxcreator_trace.json", "JSON (*.json)")
+        if not path: return
+        try: profiler.dump_trace(path)
+        except OSError as e: QMessageBox.warning(self, "Salva traccia profilo", str(e))
+
+    def closeEvent(self, event):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        super().closeEvent(event)
 
     def reset_traces(self):
         self.traces = {}
-        self.viewer_3d.set_extra_lines([])
+        self.trace_log = []
+        self.set_extra_lines([])
+
+    def truncate_traces(self, frame):
+        """Scarta i punti di traccia registrati dopo il fotogramma dato."""
+        while self.trace_log and self.trace_log[-1][0] > frame:
+            _, key = self.trace_log.pop()
+            self.traces[key].pop()
+            if not self.traces[key]: del self.traces[key]
+        if not self.traces: self.set_extra_lines([])
+
+    def pose_cache(self, frames):
+        """Pose del programma per la geometria mostrata; quelle di anim_all arrivano gia' pronte dal worker."""
+        if frames is self.all_frames and self.all_poses and self.all_poses.valid(self.box_manager): return self.all_poses
+        return PoseCache(self.box_manager, frames)
+
+    def set_schedule(self, frames, pushing=None):
+        self.poses = self.pose_cache(frames)
+        self.pushing = pushing or [False] * len(frames)
+        self.anim_vars['frame'] = 0
+        self.timeline.blockSignals(True)
+        self.timeline.setRange(0, len(frames) - 1); self.timeline.setValue(0)
+        self.timeline.blockSignals(False)
+
+    def seek(self, f):
+        """Mostra il fotogramma f del programma corrente: riproduzione, scorrimento e ritorno sono letture di array.
+        Le tracce seguono la timeline: in avanti si registrano i fotogrammi di spinta, indietro si tagliano."""
+        v = self.anim_vars
+        if not self.poses.valid(self.box_manager): self.poses = self.pose_cache(self.poses.frames) # Geometria cambiata
+        last = v['frame']
+        if f < last: self.truncate_traces(f)
+        elif self.box_manager.root:
+            # Come nel timer originale la traccia del fotogramma g si rileva con la posa di g-1;
+            # in modalita' continua si segue il moto da g-1 a g
+            sweep = self.chk_sweep.isChecked()
+            for g in range(last + 1, f + 1):
+                if sweep:
+                    if self.pushing[g] or self.pushing[g-1]: self.record_traces(g, (self.poses.frames[g-1], self.poses.frames[g]))
+                elif self.pushing[g]: self.poses.apply(g - 1); self.record_traces(g)
+        self.poses.apply(f)
+        v['frame'] = f
+        v['angles'] = dict(self.poses.frames[f])
+        
+        self.timeline.blockSignals(True); self.timeline.setValue(f); self.timeline.blockSignals(False)
+        if self.viewer_3d: self.viewer_3d.update()
+        self.draw_traces()
 
     def anim_step(self):
-        if self.anim_vars['active']: return
+        if self.anim_vars['active'] or not self.ensure_tree(): return
         self.reset_traces()
         self.tabs.setCurrentIndex(1)
-        st = ['lembi', 'testate', 'fianchi', 'fasce', 'ext', 'reinf']
-        if self.anim_vars['idx'] >= len(st):
+        if self.anim_vars['idx'] >= len(FOLD_STEPS):
             self.anim_vars['idx'] = 0
             self.anim_vars['angles'] = {}
             self.refresh(); return
         
-        self.anim_vars.update({'key': st[self.anim_vars['idx']], 'prog': 0.0, 'active': True, 'comb': False})
+        key = FOLD_STEPS[self.anim_vars['idx']]
+        self.set_schedule(fold_step_schedule(key, self.anim_vars['angles']))
+        self.anim_vars.update({'key': key, 'active': True, 'comb': False, 'dir': 1})
         self.timer.start(20)
 
     def anim_all(self):
-        if self.anim_vars['active']: return
+        if self.anim_vars['active'] or not self.ensure_tree(): return
         self.reset_traces()
         self.tabs.setCurrentIndex(1)
-        self.anim_vars.update({'angles': {}, 'prog': 0.0, 'active': True, 'comb': True})
+        self.set_schedule(self.all_frames, self.all_pushing)
+        self.anim_vars.update({'active': True, 'comb': True, 'dir': 1})
+        self.seek(0)
         self.timer.start(20)
 
+    def anim_reverse(self):
+        """Riproduce all'indietro il programma corrente (anim_all se nessuno): dalla fine se si e' all'inizio."""
+        if self.anim_vars['active'] or not self.ensure_tree(): return
+        self.tabs.setCurrentIndex(1)
+        if self.poses is None:
+            self.reset_traces()
+            self.set_schedule(self.all_frames, self.all_pushing)
+            self.anim_vars['comb'] = True
+        if self.anim_vars['frame'] == 0: self.seek(len(self.poses) - 1)
+        self.anim_vars.update({'active': True, 'dir': -1})
+        self.timer.start(20)
+
+    def scrub(self, f):
+        """Timeline: ferma la riproduzione e mostra il fotogramma scelto."""
+        if not self.ensure_tree(): return
+        if self.poses is None:
+            self.reset_traces()
+            self.set_schedule(self.all_frames, self.all_pushing)
+            self.anim_vars['comb'] = True
+        self.timer.stop(); self.anim_vars['active'] = False
+        self.tabs.setCurrentIndex(1)
+        self.seek(f)
+
+    @profiler.timed('anim_tick')
     def update_frame(self):
         v = self.anim_vars
-        if v['comb']:
-            v['prog'] += 0.015
-            t = v['prog']
-            ang = v['angles']
-            def lerp(t, s, e, max_a=90): return 0 if t<s else (max_a if t>e else (t-s)/(e-s)*max_a)
-            
-            target_lembi   = lerp(t, 0.0, 1.0)
-            target_testate = lerp(t, 0.0, 1.0) 
-            target_fianchi = lerp(t, 0.5, 1.0)
-            
-            ang['testate'] = target_testate
-            ang['fianchi'] = target_fianchi
-            ang['fasce']   = lerp(t, 1.0, 1.5)
-            ang['ext']     = lerp(t, 1.5, 2.5)
-            ang['reinf']   = lerp(t, 2.0, 3.0, 180)
-
-            rad_t = math.radians(target_testate)
-            rad_f = math.radians(target_fianchi)
-            if rad_t > 1.55: rad_t = 1.55
-            
-            min_lembo_rad = math.atan(math.tan(rad_f) / math.cos(rad_t))
-            min_lembo_deg = math.degrees(min_lembo_rad)
-            
-            actual_lembo_deg = max(target_lembi, min_lembo_deg)
-            ang['lembi'] = actual_lembo_deg
-            
-            is_pushing = (min_lembo_deg > target_lembi + 0.2)
-            
-            if is_pushing and self.box_manager.root:
-                self.record_traces()
-
-            if t >= 3.0: 
-                self.timer.stop(); v['active'] = False
-        else:
-            v['prog'] += 0.05
-            if v['prog'] >= 1.0:
-                v['prog'] = 1.0; self.timer.stop(); v['active'] = False; v['idx'] += 1
-            target = 180 if v['key'] == 'reinf' else 90
-            v['angles'][v['key']] = v['prog'] * target
-            
-        self.viewer_3d.update_angles(v['angles'])
-        self.draw_traces()
+        f = min(max(v['frame'] + v['dir'], 0), len(self.poses) - 1)
+        self.seek(f)
+        if 0 < f < len(self.poses) - 1: return
+        self.timer.stop(); v['active'] = False
+        if not v['comb']:
+            # Un passo completato avanza al gruppo successivo; riportato a zero torna a essere il prossimo
+            v['idx'] = FOLD_STEPS.index(v['key']) + (1 if f else 0)
 
-    def get_absolute_transform(self, comp):
-        chain = []
-        curr = comp
-        while curr:
-            chain.append(curr)
-            curr = curr.parent
-        chain.reverse() 
-        
-        tm = None 
-        for c in chain:
-            tm = c.get_world_transform_3d(parent_tm=tm)
-        return tm
-
-    def record_traces(self):
-        parts = {}
-        def traverse(node):
-            parts[node.name] = node
-            for c in node.children: traverse(c)
-        traverse(self.box_manager.root)
-
-        lembi = [n for n in parts.values() if getattr(n, 'label', '') == 'lembi']
-        fianchi = [n for n in parts.values() if getattr(n, 'label', '') == 'fianchi' or n.name.startswith('Fianco')]
-        
-        for lembo in lembi:
-            tm_l = self.get_absolute_transform(lembo)
-            tips_local = [
-                ((lembo.width/2, -lembo.height, 0), 0),
-                ((-lembo.width/2, -lembo.height, 0), 1)
-            ]
-            
-            for pt_local, tip_idx in tips_local:
-                tip_world = tm_l(pt_local)
-                
-                for fianco in fianchi:
-                    p_loc = self.world_to_local(fianco, tip_world)
-                    
-                    if abs(p_loc[2]) < 10.0 or abs(p_loc[2] + fianco.thickness) < 10.0:
-                        if (-fianco.width/2 <= p_loc[0] <= fianco.width/2) and \
-                           (-fianco.height <= p_loc[1] <= 10.0):
-                            
-                            trace_key = (fianco.name, lembo.name, tip_idx)
-                            
-                            if trace_key not in self.traces: self.traces[trace_key] = []
-                            
-                            add_point = True
-                            if self.traces[trace_key]:
-                                last = self.traces[trace_key][-1]
-                                dist = math.sqrt((last[0]-p_loc[0])**2 + (last[1]-p_loc[1])**2)
-                                if dist < 2.0: add_point = False
-                            
-                            if add_point:
-                                self.traces[trace_key].append(p_loc)
-
-    def world_to_local(self, comp, p_world):
-        px, py, pz = comp.pivot_3d
-        vx, vy, vz = p_world[0] - px, p_world[1] - py, p_world[2] - pz
-        
-        rad_f = math.radians(comp.fold_angle * comp.fold_multiplier)
-        cf, sf = math.cos(rad_f), math.sin(rad_f)
-        
-        if comp.fold_axis == 'x':
-            lx = vx
-            ly = vy * cf + vz * sf
-            lz = -vy * sf + vz * cf
-        else: # y axis
-            lx = vx * cf - vz * sf
-            ly = vy
-            lz = vx * sf + vz * cf
-            
-        rad_p = math.radians(comp.pre_rot_z)
-        cp, sp = math.cos(rad_p), math.sin(rad_p)
-        
-        final_x = lx * cp + ly * sp
-        final_y = -lx * sp + ly * cp
-        final_z = lz
-        
-        return (final_x, final_y, final_z)
+    def trace_engine(self):
+        if self.contacts is None or not self.contacts.valid(self.box_manager): self.contacts = TraceEngine(self.box_manager)
+        return self.contacts
+
+    @profiler.timed('record_traces')
+    def record_traces(self, frame=0, sweep=None):
+        """Aggiunge alle tracce i contatti della posa corrente, o del moto tra due pose se sweep=(angoli0, angoli1)."""
+        engine = self.trace_engine()
+        found = engine.sweep(*sweep) if sweep else engine.contacts()
+        for trace_key, p_loc in found:
+            pts = self.traces.setdefault(trace_key, [])
+            if pts:
+                last = pts[-1]
+                if math.sqrt((last[0]-p_loc[0])**2 + (last[1]-p_loc[1])**2) < TRACE_MIN_STEP: continue
+            pts.append(p_loc)
+            self.trace_log.append((frame, trace_key))
 
+    @profiler.timed('draw_traces')
     def draw_traces(self):
-        if not self.traces: return
+        if not self.traces or not self.viewer_3d: return
         
         lines = []
-        parts = {}
-        def traverse(node):
-            parts[node.name] = node
-            for c in node.children: traverse(c)
-        traverse(self.box_manager.root)
+        parts = self.trace_engine().parts
         
         for (fname, lname, tidx), points in self.traces.items():
             if fname in parts:
-                fianco = parts[fname]
-                tm = self.get_absolute_transform(fianco)
-                
-                world_pts = [tm(p) for p in points]
+                world_pts = parts[fname].to_world(points).tolist()
                 for i in range(len(world_pts) - 1):
                     lines.append((world_pts[i], world_pts[i+1]))
                     
-        self.viewer_3d.set_extra_lines(lines)
+        self.set_extra_lines(lines)
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
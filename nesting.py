@@ -0,0 +1,292 @@
+import sys
+import os
+import json
+import math
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS
+
+ROTATIONS = (0, 90, 180, 270)
+ORDERS = ('rows', 'cols') # Riempimento: righe dal bordo alto, oppure colonne da sinistra
+DEFAULT_GUTTER = 5.0      # Distanza minima tra due fustelle sul foglio (mm)
+DEFAULT_RESOLUTION = 2.0  # Lato della cella del raster di ingombro (mm)
+
+# Problema del worker: impostato da init_worker, con le cache di raster e no-fit per processo
+_problem = None
+
+def init_worker(problem):
+    global _problem
+    _problem = problem
+
+def poly_area(pts):
+    p = np.asarray(pts, float)
+    return abs(float(np.dot(p[:, 0], np.roll(p[:, 1], -1)) - np.dot(p[:, 1], np.roll(p[:, 0], -1)))) / 2
+
+def rotate(pts, rot):
+    """Rotazione di multipli di 90 gradi attorno all'origine."""
+    p = np.asarray(pts, float).reshape(-1, 2)
+    if rot == 90: return np.stack([-p[:, 1], p[:, 0]], axis=1)
+    if rot == 180: return -p
+    if rot == 270: return np.stack([p[:, 1], -p[:, 0]], axis=1)
+    return p
+
+def rasterize(polys, res, shape):
+    """Celle (righe = y, colonne = x) toccate dai poligoni: interno per centro cella piu' le celle attraversate
+    dai bordi, cosi' il raster contiene sempre tutto il contorno reale."""
+    grid = np.zeros(shape, bool)
+    ys = (np.arange(shape[0]) + 0.5) * res
+    for p in polys:
+        q = np.roll(p, -1, axis=0)
+        y0, y1 = p[:, 1:2], q[:, 1:2]
+        cross = (np.minimum(y0, y1) <= ys) & (ys < np.maximum(y0, y1)) # (E, righe), semiaperto sui vertici
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xs = np.where(cross, p[:, 0:1] + (ys - y0) * (q[:, 0:1] - p[:, 0:1]) / (y1 - y0), np.inf)
+        xs.sort(axis=0)
+        for r in np.nonzero(cross.any(axis=0))[0].tolist():
+            row = xs[:, r]; row = row[np.isfinite(row)]
+            for a, b in zip(row[0::2].tolist(), row[1::2].tolist()):
+                grid[r, max(0, math.ceil(a/res - 0.5)):math.floor(b/res - 0.5) + 1] = True
+        # Bordi campionati a passo res/4
+        pts = edge_points(p, res / 4)
+        i = np.clip((pts[:, 1] / res).astype(int), 0, shape[0] - 1); j = np.clip((pts[:, 0] / res).astype(int), 0, shape[1] - 1)
+        grid[i, j] = True
+    return grid
+
+def edge_points(p, step):
+    """Punti lungo i lati del poligono chiuso p, a distanza massima step."""
+    q = np.roll(p, -1, axis=0); d = q - p
+    n = np.maximum(1, np.ceil(np.hypot(d[:, 0], d[:, 1]) / step)).astype(int)
+    t = np.concatenate([np.arange(k + 1) / k for k in n.tolist()])
+    e = np.repeat(np.arange(len(p)), n + 1)
+    return p[e] + d[e] * t[:, None]
+
+def buffer_mask(polys, mask, res, dist):
+    """Ingombro con la distanza di rispetto: il raster piu' le celle a meno di dist dal contorno.
+    La maschera cresce di r celle per lato; ritorna (maschera, r)."""
+    step = res / 4
+    dist += step / 2 # Tra due campioni il contorno reale dista al piu' mezzo passo
+    r = math.ceil(dist / res) if dist > step / 2 else 0
+    h, w = mask.shape
+    out = np.zeros((h + 2*r, w + 2*r), bool); out[r:r+h, r:r+w] = mask
+    if not r: return out, r
+    pts = np.concatenate([edge_points(p, step) for p in polys])
+    x, y = pts[:, 0], pts[:, 1]
+    ci = np.clip((y / res).astype(int), 0, h - 1); cj = np.clip((x / res).astype(int), 0, w - 1)
+    for di in range(-r, r + 1):
+        i = ci + di
+        dy = np.maximum(np.maximum(i*res - y, y - (i+1)*res), 0)
+        for dj in range(-r, r + 1):
+            j = cj + dj
+            dx = np.maximum(np.maximum(j*res - x, x - (j+1)*res), 0)
+            hit = dx*dx + dy*dy < dist*dist
+            out[i[hit] + r, j[hit] + r] = True
+    return out, r
+
+def correlate(a, b):
+    """Sovrapposizione di b traslato su a per ogni offset intero (correlazione piena via FFT) > 0."""
+    s = (a.shape[0] + b.shape[0] - 1, a.shape[1] + b.shape[1] - 1)
+    c = np.fft.irfft2(np.fft.rfft2(a, s) * np.fft.rfft2(b[::-1, ::-1], s), s)
+    return c > 0.5
+
+class Blank:
+    """Una fustella da disporre: contorni dei pannelli (mm) e area reale."""
+
+    def __init__(self, diagram, name=None):
+        self.diagram = diagram
+        self.name = name
+        self.polys = [np.asarray(q['coords'], float) for q in diagram[0]]
+        self.area = sum(poly_area(p) for p in self.polys)
+
+    def outline(self, rot):
+        """Poligoni ruotati e riportati con l'angolo del riquadro in (0, 0), piu' l'offset usato."""
+        polys = [rotate(p, rot) for p in self.polys]
+        lo = np.min([p.min(axis=0) for p in polys], axis=0)
+        return [p - lo for p in polys], lo
+
+class NestProblem:
+    """Dati condivisi con i worker: fustelle, foglio, distanza, raster. Raster e no-fit si calcolano una volta per processo."""
+
+    def __init__(self, blanks, sheet, gutter=DEFAULT_GUTTER, resolution=DEFAULT_RESOLUTION, counts=None):
+        self.blanks = blanks
+        self.sheet = tuple(map(float, sheet))
+        self.gutter, self.resolution = float(gutter), float(resolution)
+        self.counts = list(counts) if counts else [None] * len(blanks)
+        if len(self.counts) != len(blanks): raise ValueError(f"{len(self.counts)} limiti di copie per {len(blanks)} fustelle")
+        self.grid = (int(self.sheet[1] // resolution), int(self.sheet[0] // resolution))
+        self.masks, self.nfps = {}, {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__); state['masks'], state['nfps'] = {}, {}
+        return state
+
+    def mask(self, c):
+        """(maschera, maschera dilatata della distanza) per (fustella, rotazione)."""
+        m = self.masks.get(c)
+        if m is None:
+            t, rot = c
+            polys, _ = self.blanks[t].outline(rot)
+            ext = np.max([p.max(axis=0) for p in polys], axis=0)
+            shape = (max(1, math.ceil(ext[1] / self.resolution)), max(1, math.ceil(ext[0] / self.resolution)))
+            mask = rasterize(polys, self.resolution, shape)
+            m = self.masks[c] = (mask, buffer_mask(polys, mask, self.resolution, self.gutter)[0])
+        return m
+
+    def nfp(self, placed, cand):
+        """Offset (righe, colonne) della cella d'origine di cand, relativi a placed, in cui i due si toccano.
+        Ritorna (mappa booleana, offset della sua cella [0, 0])."""
+        key = (placed, cand)
+        v = self.nfps.get(key)
+        if v is None:
+            a = self.mask(placed)[0]; m, d = self.mask(cand)
+            g = (d.shape[0] - m.shape[0]) // 2
+            v = self.nfps[key] = (correlate(a, d), (g + 1 - d.shape[0], g + 1 - d.shape[1]))
+        return v
+
+    def run(self, rotations, order):
+        """Disposizione golosa: a ogni passo la (fustella, rotazione) con la prima cella libera
+        nell'ordine di riempimento, a parita' la piu' grande. Ritorna [(fustella, rotazione, riga, colonna)]."""
+        H, W = self.grid
+        cands = [(t, r) for t in range(len(self.blanks)) for r in rotations]
+        free = {}
+        for c in cands:
+            h, w = self.mask(c)[0].shape
+            if h <= H and w <= W: free[c] = np.ones((H - h + 1, W - w + 1), bool)
+        left = list(self.counts)
+        placed = []
+        while True:
+            best = None
+            for c, f in free.items():
+                if left[c[0]] == 0: continue
+                g = f if order == 'rows' else f.T
+                k = int(np.argmax(g))
+                if not g.flat[k]: continue
+                a, b = divmod(k, g.shape[1])
+                key = (a, b, -self.blanks[c[0]].area)
+                if best is None or key < best[0]: best = (key, c, (a, b) if order == 'rows' else (b, a))
+            if best is None: break
+            _, c, (i, j) = best
+            placed.append((c[0], c[1], i, j))
+            if left[c[0]] is not None: left[c[0]] -= 1
+            # Le celle in cui ogni candidato toccherebbe il nuovo pezzo non sono piu' libere
+            for c2, f in free.items():
+                nfp, (oi, oj) = self.nfp(c, c2)
+                r0, c0 = i + oi, j + oj
+                r1, c1 = r0 + nfp.shape[0], c0 + nfp.shape[1]
+                R0, C0 = max(r0, 0), max(c0, 0); R1, C1 = min(r1, f.shape[0]), min(c1, f.shape[1])
+                if R0 < R1 and C0 < C1: f[R0:R1, C0:C1] &= ~nfp[R0-r0:R1-r0, C0-c0:C1-c0]
+        return placed
+
+def run_strategy(strategy):
+    """Eseguito nel worker: (rotazioni, ordine) -> (strategia, disposizioni)."""
+    rotations, order = strategy
+    return strategy, _problem.run(rotations, order)
+
+def strategies(rotations=ROTATIONS):
+    """Candidati valutati: ogni rotazione da sola, le coppie opposte (testa-piede) e tutte insieme, in entrambi gli ordini."""
+    rotations = tuple(r for r in ROTATIONS if r in rotations)
+    sets = [(r,) for r in rotations] + [s for s in ((0, 180), (90, 270)) if set(s) <= set(rotations)]
+    if len(rotations) > 2 or (len(rotations) == 2 and rotations not in sets): sets.append(rotations)
+    return [(s, o) for s in sets for o in ORDERS]
+
+class SheetLayout:
+    """Risultato della disposizione: posizioni in mm e resa del foglio."""
+
+    def __init__(self, problem, placements, strategy):
+        self.blanks, self.sheet, self.gutter = problem.blanks, problem.sheet, problem.gutter
+        self.strategy = strategy
+        res = problem.resolution
+        self.placements = [(t, rot, j * res, i * res) for t, rot, i, j in placements] # (fustella, rotazione, x, y)
+        self.counts = [sum(1 for p in self.placements if p[0] == t) for t in range(len(self.blanks))]
+        self.sheet_area = self.sheet[0] * self.sheet[1]
+        self.used_area = sum(self.blanks[t].area for t, *_ in self.placements)
+        self.waste_area = self.sheet_area - self.used_area
+        self.utilisation = self.used_area / self.sheet_area if self.sheet_area else 0.0
+
+    def transform(self, placement):
+        """Funzione punto -> punto (mm, coordinate del foglio) per una disposizione."""
+        t, rot, x, y = placement
+        _, lo = self.blanks[t].outline(rot)
+        c, s = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}[rot]
+        dx, dy = x - lo[0], y - lo[1]
+        return lambda p: (c*p[0] - s*p[1] + dx, s*p[0] + c*p[1] + dy)
+
+    def diagram(self):
+        """Tutte le copie in un unico diagramma (polys, cut_lines, creases, glue_lines) per tela ed esportazione."""
+        polys, cuts, creases, glues = [], [], [], []
+        for k, pl in enumerate(self.placements):
+            f = self.transform(pl)
+            src_polys, src_cuts, src_creases, src_glues = self.blanks[pl[0]].diagram
+            polys += [{'id': f"{k}:{q['id']}", 'type': q['type'], 'coords': [f(c) for c in q['coords']]} for q in src_polys]
+            cuts += [[f(a), f(b)] for a, b in src_cuts]
+            creases += [[f(a), f(b)] for a, b in src_creases]
+            glues += [((f(a), f(b)), idx) for (a, b), idx in src_glues]
+        return polys, cuts, creases, glues
+
+    def record(self):
+        """Riepilogo JSON-serializzabile per preventivi."""
+        return {
+            'sheet': list(self.sheet), 'gutter': self.gutter,
+            'strategy': {'rotations': list(self.strategy[0]), 'order': self.strategy[1]},
+            'blanks': [{'name': b.name, 'area_mm2': round(b.area, 2), 'count': n} for b, n in zip(self.blanks, self.counts)],
+            'placements': [{'blank': t, 'rotation': rot, 'x': x, 'y': y} for t, rot, x, y in self.placements],
+            'sheet_area_mm2': round(self.sheet_area, 2), 'used_area_mm2': round(self.used_area, 2),
+            'waste_area_mm2': round(self.waste_area, 2), 'utilisation': round(self.utilisation, 4),
+        }
+
+def nest(layouts, sheet, gutter=DEFAULT_GUTTER, rotations=ROTATIONS, counts=None, resolution=DEFAULT_RESOLUTION, jobs=None):
+    """Dispone sul foglio (larghezza, altezza in mm) quante piu' copie possibile dei layout dati
+    (uscite di get_2d_diagram o Blank). counts limita le copie per layout (None = senza limite).
+    Le strategie candidate girano in parallelo su un pool di processi (jobs=1: nel processo corrente)."""
+    blanks = [l if isinstance(l, Blank) else Blank(l) for l in layouts]
+    problem = NestProblem(blanks, sheet, gutter, resolution, counts)
+    cands = strategies(rotations)
+    if jobs == 1 or len(cands) == 1:
+        init_worker(problem)
+        results = [run_strategy(s) for s in cands]
+    else:
+        with Pool(min(jobs or os.cpu_count(), len(cands)), init_worker, (problem,)) as pool:
+            results = list(pool.imap_unordered(run_strategy, cands))
+    # Piu' area coperta; a parita' l'ordine dei candidati (risultato indipendente dai tempi dei worker)
+    order = {s: k for k, s in enumerate(cands)}
+    strategy, placed = max(results, key=lambda r: (sum(blanks[t].area for t, *_ in r[1]), -order[r[0]]))
+    return SheetLayout(problem, placed, strategy)
+
+def parse_sheet(text):
+    w, h = text.lower().split('x')
+    return float(w), float(h)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Disposizione di piu' fustelle su un foglio (senza GUI).")
+    ap.add_argument('sheet', type=parse_sheet, help="foglio LARGHEZZAxALTEZZA in mm, es. 1600x1200")
+    ap.add_argument('-p', '--params', action='append', default=[], help="file JSON dei parametri di una fustella (ripetibile; nessuno = default)")
+    ap.add_argument('-n', '--count', type=int, action='append', help="copie massime per fustella, nell'ordine di -p")
+    ap.add_argument('-g', '--gutter', type=float, default=DEFAULT_GUTTER, help=f"distanza minima tra fustelle in mm (default: {DEFAULT_GUTTER})")
+    ap.add_argument('-r', '--resolution', type=float, default=DEFAULT_RESOLUTION, help=f"cella del raster in mm (default: {DEFAULT_RESOLUTION})")
+    ap.add_argument('--rotations', default='0,90,180,270', help="rotazioni ammesse in gradi (default: 0,90,180,270)")
+    ap.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="processi worker (default: numero di core)")
+    ap.add_argument('-o', '--output', help="esporta il foglio in .dxf o .svg")
+    args = ap.parse_args(argv)
+
+    from batch import parse_params
+    layouts = []
+    for path in args.params or [None]:
+        p = dict(DEFAULT_PARAMS)
+        if path:
+            with open(path, encoding='utf-8') as f: p = parse_params(json.load(f))
+        m = BoxManager(); m.build(p)
+        layouts.append(Blank(m.get_2d_diagram(p), path or 'default'))
+    if args.count and len(args.count) != len(layouts): ap.error(f"-n va ripetuto una volta per fustella ({len(layouts)})")
+    rotations = tuple(int(r) for r in args.rotations.split(','))
+    if not set(rotations) <= set(ROTATIONS): ap.error("rotazioni ammesse: 0, 90, 180, 270")
+    result = nest(layouts, args.sheet, args.gutter, rotations, args.count, args.resolution, args.jobs)
+    if args.output:
+        from exporter import export_diagram
+        export_diagram(args.output, result.diagram())
+    json.dump(result.record(), sys.stdout, indent=1); print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import traceback
+from collections import deque
+from functools import wraps
+
+import numpy as np
+
+# Strumentazione degli stadi caldi (build, diagramma 2D, mesh, render, animazione, tracce).
+# Spenta: stage() restituisce un contesto vuoto condiviso e timed() un solo test di flag, nessuna misura.
+# Accesa: per stadio un buffer circolare delle ultime durate (istogramma mobile) e, su richiesta,
+# il registro degli eventi della sessione, salvabile nel formato Chrome Trace (chrome://tracing, Perfetto).
+
+HISTORY = 256 # Campioni per stadio nel buffer circolare
+HIST_EDGES = 0.01 * 2.0 ** np.arange(18) # Classi dell'istogramma in ms: 0.01 .. ~1300, raddoppiando
+TRACE_LIMIT = 1_000_000 # Eventi massimi nel registro della sessione (i piu' vecchi si scartano)
+FRAME = 'frame' # Stadi 'frame...': intervallo tra due fotogrammi presentati (FPS), uno per vista
+SPARK = ' ▁▂▃▄▅▆▇█'
+
+enabled = False
+_stages = {}
+_trace = None # deque di eventi (nome, inizio s, durata s, thread, argomenti) o None
+_errors = 0
+_lock = threading.Lock()
+_t0 = time.perf_counter()
+_last_frame = {}
+
+class Stage:
+    """Durate recenti di uno stadio (ms)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.samples = np.zeros(HISTORY)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, ms):
+        self.samples[self.count % HISTORY] = ms
+        self.count += 1; self.total += ms
+
+    def recent(self):
+        return self.samples[:min(self.count, HISTORY)]
+
+    @property
+    def last(self): return float(self.samples[(self.count - 1) % HISTORY]) if self.count else 0.0
+
+    def histogram(self):
+        """Conteggi delle durate recenti nelle classi HIST_EDGES (le estreme raccolgono anche i valori fuori scala)."""
+        idx = np.clip(np.searchsorted(HIST_EDGES, self.recent(), side='right') - 1, 0, len(HIST_EDGES) - 1)
+        return np.bincount(idx, minlength=len(HIST_EDGES))
+
+    def summary(self):
+        r = self.recent()
+        if not len(r): return {'count': 0}
+        p50, p90, p99 = np.percentile(r, (50, 90, 99)).tolist()
+        return {'count': self.count, 'last_ms': self.last, 'mean_ms': float(r.mean()), 'p50_ms': p50,
+                'p90_ms': p90, 'p99_ms': p99, 'max_ms': float(r.max()), 'total_ms': self.total,
+                'histogram': self.histogram().tolist()}
+
+class _Span:
+    __slots__ = ('name', 't')
+    def __init__(self, name): self.name = name
+    def __enter__(self):
+        self.t = time.perf_counter(); return self
+    def __exit__(self, *exc):
+        record(self.name, self.t, time.perf_counter()); return False
+
+class _NullSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL = _NullSpan()
+
+def stage(name):
+    """Contesto che misura un blocco: with profiler.stage('build'): ..."""
+    return _Span(name) if enabled else _NULL
+
+def timed(name):
+    """Decoratore: misura ogni chiamata come lo stadio name."""
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled: return fn(*args, **kwargs)
+            t = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            finally: record(name, t, time.perf_counter())
+        return wrapper
+    return deco
+
+def record(name, t0, t1, args=None):
+    with _lock:
+        s = _stages.get(name)
+        if s is None: s = _stages[name] = Stage(name)
+        s.add((t1 - t0) * 1000.0)
+        if _trace is not None: _trace.append((name, t0, t1 - t0, threading.get_ident(), args))
+
+def frame(name=FRAME):
+    """Segna un fotogramma presentato dalla vista name (per gli FPS)."""
+    if not enabled: return
+    t = time.perf_counter()
+    last = _last_frame.get(name)
+    if last is not None and t - last < 1.0: record(name, last, t) # Pause lunghe: non sono fotogrammi
+    _last_frame[name] = t
+
+def fps(name=FRAME):
+    s = _stages.get(name)
+    if s is None or not s.count: return 0.0
+    mean = s.recent().mean()
+    return 1000.0 / mean if mean > 0 else 0.0
+
+def report_error(where):
+    """Da chiamare in un except: stampa la traccia dell'eccezione su stderr e la registra (anche a profilo spento)."""
+    global _errors
+    _errors += 1
+    exc = sys.exc_info()[1]
+    traceback.print_exc()
+    if _trace is not None:
+        t = time.perf_counter()
+        with _lock: _trace.append((f'error:{where}', t, 0.0, threading.get_ident(), {'error': f'{type(exc).__name__}: {exc}'}))
+
+def enable(on=True, trace=False):
+    """Accende/spegne la strumentazione; trace=True tiene anche il registro degli eventi della sessione."""
+    global enabled, _trace
+    enabled = on
+    _last_frame.clear()
+    if on and trace and _trace is None: _trace = deque(maxlen=TRACE_LIMIT)
+    elif not trace: _trace = None
+
+def reset():
+    global _errors
+    with _lock:
+        _stages.clear(); _errors = 0
+        if _trace is not None: _trace.clear()
+
+def summary():
+    """{stadio: statistiche} piu' FPS ed errori."""
+    with _lock: stages = {k: s.summary() for k, s in _stages.items()}
+    return {'fps': {k: fps(k) for k in stages if k.startswith(FRAME)}, 'errors': _errors, 'stages': stages}
+
+def sparkline(counts):
+    """Istogramma in una riga di caratteri, dalla prima all'ultima classe non vuota."""
+    nz = np.nonzero(counts)[0]
+    if not len(nz): return ''
+    c = counts[nz[0]:nz[-1] + 1]
+    return ''.join(SPARK[int(np.ceil(v * (len(SPARK) - 1) / c.max()))] for v in c.tolist())
+
+def overlay_lines(stages=None, frame_name=FRAME):
+    """Righe di testo per l'overlay: FPS della vista, poi ultima durata, p90 e istogramma mobile per stadio."""
+    lines = [f"FPS {fps(frame_name):5.1f}" + (f"   errori {_errors}" if _errors else '')]
+    with _lock:
+        items = [(k, _stages[k]) for k in (stages or sorted(_stages)) if k in _stages and not k.startswith(FRAME)]
+        for name, s in items:
+            r = s.recent()
+            lines.append(f"{name:<14}{s.last:8.2f} ms  p90 {np.percentile(r, 90):7.2f}  {sparkline(s.histogram())}")
+    return lines
+
+def dump_trace(path):
+    """Salva la sessione in formato Chrome Trace (JSON): eventi se registrati, statistiche in otherData."""
+    pid = os.getpid()
+    events = []
+    with _lock: trace = list(_trace) if _trace is not None else []
+    for name, t, dur, tid, args in trace:
+        ev = {'name': name, 'cat': 'boxcreator', 'pid': pid, 'tid': tid, 'ts': (t - _t0) * 1e6}
+        if dur or not args: ev.update(ph='X', dur=dur * 1e6)
+        else: ev.update(ph='i', s='t')
+        if args: ev['args'] = args
+        events.append(ev)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'summary': summary()}}, f)
+
+# Avvio da ambiente: BOXCREATOR_PROFILE=1 accende le misure, BOXCREATOR_TRACE=file anche il registro
+# della sessione, salvato all'uscita
+if os.environ.get('BOXCREATOR_PROFILE', '').strip() not in ('', '0') or os.environ.get('BOXCREATOR_TRACE'):
+    enable(True, trace=bool(os.environ.get('BOXCREATOR_TRACE')))
+    if os.environ.get('BOXCREATOR_TRACE'): atexit.register(lambda: dump_trace(os.environ['BOXCREATOR_TRACE']))
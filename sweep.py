@@ -0,0 +1,188 @@
+import sys
+import os
+import csv
+import time
+import argparse
+import traceback
+from multiprocessing import Pool
+
+import numpy as np
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS, GLUE_NOZZLES
+from batch import parse_params
+from geocache import GeometryCache, default_root
+
+# Colonne dei risultati, oltre ai parametri variati: esito, vincolo colla, misure (mm, mm^2)
+FLAGS = ('ok', 'glue_clamped')
+MEASURES = ('bbox_w', 'bbox_h', 'board_area', 'cut_length', 'crease_length', 'glue_length')
+GLUE_COLUMNS = tuple(f'glue_length_{i+1}' for i in range(GLUE_NOZZLES))
+COLUMNS = FLAGS + MEASURES + GLUE_COLUMNS
+FORMATS = ('npz', 'csv', 'parquet')
+
+# Manager del processo worker: combinazioni consecutive differiscono in un solo parametro (build incrementale)
+_manager = None
+# Griglia del worker e cache su disco (o None), impostate da init_worker
+_sweep = None
+_cache = None
+
+def init_worker(sweep, cache_dir=None):
+    global _sweep, _cache
+    _sweep = sweep
+    _cache = GeometryCache(cache_dir) if cache_dir else None
+
+def axis_values(key, spec):
+    """Valori di un asse: sequenza, scalare o testo 'inizio:fine:passo' (estremi inclusi) / 'v1,v2,...'."""
+    if isinstance(spec, str):
+        if ':' in spec:
+            parts = spec.split(':')
+            if len(parts) != 3: raise ValueError(f"{key}: intervallo atteso come inizio:fine:passo, non '{spec}'")
+            a, b, step = map(float, parts)
+            if step <= 0 or b < a: raise ValueError(f"{key}: intervallo vuoto '{spec}'")
+            spec = np.round(np.arange(a, b + step / 2, step), 9).tolist()
+        else: spec = spec.split(',')
+    elif np.isscalar(spec): spec = [spec]
+    values = [parse_params({key: v})[key] for v in spec]
+    if not values: raise ValueError(f"{key}: nessun valore")
+    return values
+
+class Sweep:
+    """Prodotto cartesiano degli assi sopra i parametri base. La combinazione i si ricava dall'indice
+    in base mista (l'ultimo asse varia piu' in fretta): ai worker arrivano solo intervalli di indici."""
+
+    def __init__(self, axes, base=None):
+        self.base = dict(DEFAULT_PARAMS, **(base or {}))
+        self.keys = list(axes)
+        self.values = [axis_values(k, axes[k]) for k in self.keys]
+        self.shape = tuple(len(v) for v in self.values)
+        self.size = int(np.prod(self.shape, dtype=np.int64))
+
+    def __len__(self): return self.size
+
+    def params(self, index):
+        p = dict(self.base)
+        for k, vals, i in zip(self.keys, self.values, np.unravel_index(index, self.shape)): p[k] = vals[i]
+        return p
+
+    def columns(self):
+        """Un array per parametro variato, allineato alle righe dei risultati."""
+        out = {}
+        for axis, (k, vals) in enumerate(zip(self.keys, self.values)):
+            stride = int(np.prod(self.shape[axis+1:], dtype=np.int64))
+            idx = np.arange(self.size, dtype=np.int64) // stride % self.shape[axis]
+            out[k] = np.asarray(vals)[idx]
+        return out
+
+def run_chunk(bounds):
+    """Eseguito nel worker: intervallo di indici -> (inizio, blocco (n, len(COLUMNS)) di float64)."""
+    global _manager
+    start, stop = bounds
+    block = np.full((stop - start, len(COLUMNS)), np.nan)
+    for row, index in enumerate(range(start, stop)):
+        try:
+            p = _sweep.params(index)
+            if _manager is None: _manager = BoxManager()
+            if _cache: m = _cache.fetch(p, _manager).metrics
+            else:
+                _manager.build(p)
+                m = _manager.metrics(p) # Forma chiusa: nessun diagramma da costruire
+        except Exception:
+            _manager = None # Stato incerto: la prossima combinazione riparte da zero
+            block[row, 0] = 0
+            continue
+        block[row, 0], block[row, 1] = 1, m.glue_clamped
+        block[row, 2:] = [getattr(m, k) for k in MEASURES] + list(m.glue_lengths)
+    return start, block
+
+def run_sweep(sweep, jobs=None, chunksize=256, on_progress=None, cache_dir=None):
+    """Valuta tutte le combinazioni su un pool di processi (jobs=1: nel processo corrente),
+    con la cache geometrica su disco in cache_dir se data.
+    Risultato colonnare {nome: array}: parametri variati, poi COLUMNS. In memoria restano solo gli array
+    numerici (qualche decina di byte per combinazione), nessun diagramma o dizionario per riga."""
+    res = np.empty((sweep.size, len(COLUMNS)))
+    chunks = ((a, min(a + chunksize, sweep.size)) for a in range(0, sweep.size, chunksize))
+    done = 0
+    if jobs == 1:
+        init_worker(sweep, cache_dir)
+        blocks, pool = map(run_chunk, chunks), None
+    else:
+        pool = Pool(jobs, init_worker, (sweep, cache_dir))
+        blocks = pool.imap_unordered(run_chunk, chunks)
+    try:
+        for start, block in blocks:
+            res[start:start + len(block)] = block
+            done += len(block)
+            if on_progress: on_progress(done, sweep.size)
+    finally:
+        if pool: pool.close(); pool.join()
+
+    cols = sweep.columns()
+    cols['ok'] = res[:, 0] == 1
+    cols['glue_clamped'] = res[:, 1] == 1
+    for k, col in zip(MEASURES + GLUE_COLUMNS, res[:, 2:].T): cols[k] = np.ascontiguousarray(col)
+    return cols
+
+def write_results(path, cols, fmt=None):
+    """Salva le colonne in .npz (NumPy), .csv o .parquet (richiede pyarrow)."""
+    fmt = (fmt or path.rsplit('.', 1)[-1]).lower()
+    if fmt == 'npz':
+        np.savez(path, **cols)
+    elif fmt == 'csv':
+        names = list(cols)
+        out = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+        try:
+            w = csv.writer(out)
+            w.writerow(names)
+            n = len(next(iter(cols.values()))) if cols else 0
+            for a in range(0, n, 10000): # A blocchi: niente liste Python grandi quanto il risultato
+                w.writerows(zip(*(cols[k][a:a+10000].tolist() for k in names)))
+        finally:
+            if out is not sys.stdout: out.close()
+    elif fmt == 'parquet':
+        try:
+            import pyarrow
+            import pyarrow.parquet as pq
+        except ImportError: raise ValueError("il formato parquet richiede pyarrow") from None
+        pq.write_table(pyarrow.table(cols), path)
+    else: raise ValueError(f"formato sconosciuto '{fmt}' (ammessi: {', '.join(FORMATS)})")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Esplorazione parametrica delle fustelle (senza GUI).")
+    ap.add_argument('axes', nargs='+', metavar='CHIAVE=VALORI',
+                    help="asse della griglia: L=380:420:5 (estremi inclusi), fianchi_shape=rect,ferro, F=120")
+    ap.add_argument('-p', '--params', help="file JSON con i parametri base (le chiavi mancanti prendono i default)")
+    ap.add_argument('-o', '--output', default='-', help="file dei risultati .npz, .csv o .parquet ('-' = CSV su stdout)")
+    ap.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="processi worker (default: numero di core)")
+    ap.add_argument('--chunksize', type=int, default=256, help="combinazioni per invio al worker")
+    ap.add_argument('--cache', action='store_true', help="usa la cache geometrica su disco (utile per ripetere griglie)")
+    ap.add_argument('--cache-dir', help="cartella della cache (default: $BOXCREATOR_CACHE o la cache utente); implica --cache")
+    args = ap.parse_args(argv)
+
+    try:
+        base = None
+        if args.params:
+            import json
+            with open(args.params, encoding='utf-8') as f: base = parse_params(json.load(f))
+        axes = {}
+        for a in args.axes:
+            key, sep, spec = a.partition('=')
+            if not sep: ap.error(f"asse atteso come CHIAVE=VALORI, non '{a}'")
+            axes[key] = spec
+        sweep = Sweep(axes, base)
+    except ValueError as e: ap.error(str(e))
+    if args.output != '-' and args.output.rsplit('.', 1)[-1].lower() not in FORMATS:
+        ap.error(f"formato dei risultati non riconosciuto: {args.output}")
+
+    t = time.perf_counter()
+    try:
+        cache_dir = args.cache_dir or (default_root() if args.cache else None)
+        cols = run_sweep(sweep, args.jobs, args.chunksize, cache_dir=cache_dir)
+        write_results(args.output, cols, 'csv' if args.output == '-' else None)
+    except Exception:
+        traceback.print_exc(); return 2
+    n_err = int((~cols['ok']).sum())
+    print(f"{sweep.size} combinazioni in {time.perf_counter() - t:.1f} s, {n_err} errori, "
+          f"{int(cols['glue_clamped'].sum())} con colla spostata dal vincolo dei 15 mm", file=sys.stderr)
+    return 1 if n_err else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
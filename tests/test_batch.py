@@ -0,0 +1,22 @@
+import io
+import json
+import os
+
+import pytest
+
+from batch import run_batch
+from exporter import DielineWriter, DxfWriter
+
+def test_writer_base_is_abstract():
+    with pytest.raises(TypeError): DielineWriter(io.StringIO())
+    DxfWriter(io.StringIO()).close()
+
+def test_repeated_ids_do_not_overwrite(tmp_path):
+    designs = [{'id': 'a', 'L': 400}, {'id': 'b', 'L': 420}, {'id': 'a', 'L': 440}, {'name': 'A'}]
+    out = io.StringIO()
+    n_ok, n_err = run_batch(designs, out, jobs=1, export=(str(tmp_path), 'svg'))
+    recs = sorted((json.loads(l) for l in out.getvalue().splitlines()), key=lambda r: r['index'])
+    assert (n_ok, n_err) == (2, 2)
+    assert [('error' in r) for r in recs] == [False, False, True, True]
+    assert sorted(os.listdir(tmp_path)) == ['a.svg', 'b.svg']
+    assert recs[0]['params']['L'] == 400.0 # Il primo design con l'id resta quello esportato
@@ -0,0 +1,90 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from contacts import TraceEngine, TRACE_MIN_STEP
+from geometry_oop import BoxManager, DEFAULT_PARAMS, fold_all_schedule
+from test_glue import random_params
+
+# --- Riferimento: visita dell'albero e test punta per punta, pannello per pannello, come prima dell'indice AABB ---
+
+def world_to_local(comp, p_world):
+    px, py, pz = comp.pivot_3d
+    vx, vy, vz = p_world[0] - px, p_world[1] - py, p_world[2] - pz
+    rad_f = math.radians(comp.fold_angle * comp.fold_multiplier)
+    cf, sf = math.cos(rad_f), math.sin(rad_f)
+    if comp.fold_axis == 'x': lx, ly, lz = vx, vy * cf + vz * sf, -vy * sf + vz * cf
+    else: lx, ly, lz = vx * cf - vz * sf, vy, vx * sf + vz * cf
+    rad_p = math.radians(comp.pre_rot_z)
+    cp, sp = math.cos(rad_p), math.sin(rad_p)
+    return (lx * cp + ly * sp, -lx * sp + ly * cp, lz)
+
+def reference_contacts(m, tol=0.0):
+    """Contatti con la regione allargata di tol mm (negativo: ristretta)."""
+    parts = {}
+    def traverse(node):
+        parts[node.name] = node
+        for c in node.children: traverse(c)
+    traverse(m.root)
+    lembi = [n for n in parts.values() if getattr(n, 'label', '') == 'lembi']
+    fianchi = [n for n in parts.values() if getattr(n, 'label', '') == 'fianchi' or n.name.startswith('Fianco')]
+    out = []
+    for lembo in lembi:
+        tips = lembo.to_world([(lembo.width/2, -lembo.height, 0), (-lembo.width/2, -lembo.height, 0)]).tolist()
+        for tip_idx, tip in enumerate(tips):
+            for fianco in fianchi:
+                p = world_to_local(fianco, tip)
+                if abs(p[2]) < 10.0 + tol or abs(p[2] + fianco.thickness) < 10.0 + tol:
+                    if -fianco.width/2 - tol <= p[0] <= fianco.width/2 + tol and -fianco.height - tol <= p[1] <= 10.0 + tol:
+                        out.append(((fianco.name, lembo.name, tip_idx), p))
+    return out
+
+def assert_same(got, m):
+    """Stessi contatti del riferimento nella posa di m, nello stesso ordine. Le punte esattamente sul bordo
+    della regione (es. il raddoppio, largo quanto il fianco) possono cadere da una parte o dall'altra per
+    arrotondamento: si accettano entrambi gli esiti."""
+    inner, outer = reference_contacts(m, -1e-6), reference_contacts(m, 1e-6)
+    keys = [k for k, _ in got]
+    assert {k for k, _ in inner} <= set(keys)
+    expected = [(k, p) for k, p in outer if k in set(keys)]
+    assert keys == [k for k, _ in expected]
+    if got: np.testing.assert_allclose([p for _, p in got], [p for _, p in expected], atol=1e-9)
+
+DESIGNS = [DEFAULT_PARAMS, dict(DEFAULT_PARAMS, fianchi_shape='rect', testate_shape='rect', platform_active=False)]
+rng = random.Random(0)
+DESIGNS += [random_params(rng, 0) for _ in range(6)]
+
+@pytest.mark.parametrize('i', range(len(DESIGNS)))
+def test_contacts_match_reference(i):
+    m = BoxManager(); m.build(DESIGNS[i])
+    engine = TraceEngine(m)
+    found = 0
+    for angles in fold_all_schedule()[0]:
+        m.set_angles(angles)
+        assert_same(engine.contacts(), m)
+        found += len(reference_contacts(m))
+    if i < 2: assert found > 0 # I design di base sfregano davvero durante la chiusura
+
+def test_sweep_covers_the_sampled_poses():
+    """Modalita' continua: a pose ferme coincide con il campionamento; in moto ogni contatto di una posa
+    intermedia campionata fitta ha vicino (entro la risoluzione delle tracce, TRACE_MIN_STEP per
+    coordinata) un contatto dello stesso lembo, dal moto o dalla posa di partenza (coperta dal moto prima)."""
+    m = BoxManager(); m.build(DEFAULT_PARAMS)
+    engine = TraceEngine(m)
+    frames = fold_all_schedule()[0]
+    checked = 0
+    for a0, a1 in zip(frames, frames[1:]):
+        m.set_angles(a0)
+        start = engine.contacts()
+        assert_same(engine.sweep(a0, a0), m)
+        near = {}
+        for k, p in start + engine.sweep(a0, a1): near.setdefault(k, []).append(p)
+        for t in np.linspace(0, 1, 17)[1:]:
+            m.set_angles({k: a0.get(k, 0) + (a1.get(k, 0) - a0.get(k, 0)) * t for k in set(a0) | set(a1)})
+            for k, p in reference_contacts(m, -1e-6):
+                assert k in near, (k, t)
+                assert np.abs(np.subtract(near[k], p)).max(axis=1).min() <= TRACE_MIN_STEP + 1e-6, (k, t)
+                checked += 1
+    assert checked > 0
@@ -0,0 +1,115 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+import geocache
+from geocache import GeometryCache, pack, unpack, encode, params_key
+from geometry_oop import BoxManager, DEFAULT_PARAMS
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeometryCache(str(tmp_path))
+
+def built(p=DEFAULT_PARAMS):
+    m = BoxManager(); m.build(p)
+    return m
+
+def test_pack_unpack_roundtrip():
+    arrays, meta = encode(built(), DEFAULT_PARAMS)
+    out, out_meta = unpack(pack(arrays, meta))
+    assert out_meta == json.loads(json.dumps(meta)) # Metadati in JSON: tuple -> liste
+    assert set(out) == set(arrays)
+    for k, a in arrays.items():
+        assert out[k].dtype == a.dtype and out[k].shape == a.shape
+        np.testing.assert_array_equal(out[k], a)
+
+def test_entry_matches_build(cache):
+    m = built()
+    cache.put(DEFAULT_PARAMS, m, mesh=True)
+    entry = cache.get(DEFAULT_PARAMS)
+    assert entry.diagram == tuple(m.get_2d_diagram(DEFAULT_PARAMS))
+    assert entry.metrics == m.metrics(DEFAULT_PARAMS)
+    mesh = m.get_mesh()
+    np.testing.assert_array_equal(entry.mesh.vertices, mesh.vertices)
+    np.testing.assert_array_equal(entry.mesh.indices, mesh.indices)
+    assert entry.mesh.panels == [n.name for n in mesh.panels]
+
+def test_hit_skips_build(cache, monkeypatch):
+    expected = tuple(built().get_2d_diagram(DEFAULT_PARAMS))
+    cache.fetch(DEFAULT_PARAMS, BoxManager())
+    assert (cache.hits, cache.misses) == (0, 1)
+    def fail(self, p): raise AssertionError("build su una voce in cache")
+    monkeypatch.setattr(BoxManager, 'build', fail)
+    entry = cache.fetch(DEFAULT_PARAMS, BoxManager())
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert entry.diagram == expected
+    assert entry.mesh is None # batch e sweep non scrivono la mesh
+
+def test_code_version_changes_key(cache, monkeypatch):
+    cache.put(DEFAULT_PARAMS, built())
+    key = params_key(DEFAULT_PARAMS)
+    monkeypatch.setattr(geocache, '_code_version', '0' * 16)
+    assert params_key(DEFAULT_PARAMS) != key
+    assert cache.get(DEFAULT_PARAMS) is None
+
+def test_numbers_are_canonical():
+    p = dict(DEFAULT_PARAMS, L=400)
+    assert params_key(p) == params_key(dict(DEFAULT_PARAMS, L=400.0))
+    assert params_key(dict(DEFAULT_PARAMS, L=401.0)) != params_key(p)
+
+@pytest.mark.parametrize('damage', ['truncate', 'garbage'])
+def test_corrupt_entry_is_a_miss(cache, damage):
+    data = cache.put(DEFAULT_PARAMS, built())
+    path = cache.path(params_key(DEFAULT_PARAMS))
+    with open(path, 'wb') as f: f.write(data[:len(data) // 2] if damage == 'truncate' else b'\0' * 64)
+    assert cache.get(DEFAULT_PARAMS) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert not os.path.exists(path)
+
+def test_lru_eviction(tmp_path):
+    size = len(pack(*encode(built(), DEFAULT_PARAMS)))
+    cache = GeometryCache(str(tmp_path), max_bytes=int(size * 3.5))
+    designs = [dict(DEFAULT_PARAMS, L=300.0 + 10 * i) for i in range(3)]
+    m = BoxManager()
+    for i, p in enumerate(designs):
+        m.build(p); cache.put(p, m)
+        os.utime(cache.path(params_key(p)), (1000 + i, 1000 + i))
+    assert len(cache.entries()) == 3
+    assert cache.get(designs[0]) is not None # Piu' recente: ora la meno usata e' designs[1]
+    
+    extra = dict(DEFAULT_PARAMS, L=600.0)
+    m.build(extra); cache.put(extra, m)
+    assert cache.size() <= cache.max_bytes
+    assert cache.get(designs[1]) is None
+    assert cache.get(designs[0]) is not None and cache.get(extra) is not None
+
+def test_gui_hit_builds_only_on_demand(tmp_path, monkeypatch):
+    """Avvio con la voce gia' in cache: diagramma e mesh senza build, l'albero solo con ensure_tree."""
+    pytest.importorskip('PySide6')
+    monkeypatch.setenv('BOXCREATOR_CACHE', str(tmp_path))
+    monkeypatch.setenv('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    import main
+
+    def start():
+        w = main.PackagingApp()
+        w.executor.submit(lambda: None).result(); app.processEvents() # Risultato del job iniziale
+        return w
+    first = start() # Mancata: build e voce con la mesh
+    p = first.box_params
+    assert first.box_manager.root is not None and first.geo_cache.get(p).mesh is not None
+    first.executor.shutdown()
+    n_indices = len(built(p).get_mesh().indices)
+
+    builds = []
+    real = BoxManager.build
+    monkeypatch.setattr(BoxManager, 'build', lambda self, p: builds.append(p) or real(self, p))
+    w = start()
+    assert builds == [] and w.box_params == p and w.box_manager.root is None
+    assert w.cached_mesh is not None and len(w.cached_mesh.indices) == n_indices
+    assert w.ensure_tree() and builds == [p]
+    assert w.box_manager.get_2d_diagram(p) == first.box_manager.get_2d_diagram(p)
+    w.executor.shutdown()
@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS
+
+def random_params(rng, step):
+    """Design casuale nei limiti d'uso: scassi piu' stretti dei pannelli, raddoppi sotto l'altezza.
+    Misure a multipli di step mm (0 = continue): con misure intere le quote colla cadono anche sui vertici."""
+    L, W = rng.uniform(150, 800), rng.uniform(120, 600)
+    hf, ht = rng.uniform(40, 250), rng.uniform(40, 250)
+    p = dict(DEFAULT_PARAMS,
+             L=L, W=W, thickness=rng.choice((2.0, 3.0, 5.0, 7.5)), F=rng.uniform(30, 200),
+             h_fianchi=hf, fianchi_shape=rng.choice(('ferro', 'rect')), fianchi_h_low=hf * rng.uniform(0.2, 0.9),
+             fianchi_cutout_w=L * rng.uniform(0.2, 0.8), fianchi_r_active=rng.random() < 0.6,
+             fianchi_r_h=hf * rng.uniform(0.1, 0.6),
+             h_testate=ht, testate_shape=rng.choice(('ferro', 'rect')), testate_h_low=ht * rng.uniform(0.2, 0.9),
+             testate_cutout_w=W * rng.uniform(0.2, 0.8), testate_r_active=rng.random() < 0.6,
+             testate_r_h=ht * rng.uniform(0.1, 0.6),
+             platform_active=rng.random() < 0.5, fascia_h=rng.uniform(15, 80), plat_flap_w=rng.uniform(10, 120))
+    if step:
+        for k, v in p.items():
+            if isinstance(v, float) and k != 'thickness': p[k] = max(step, round(v / step) * step)
+    return p
+
+# --- Riferimento: ricerca a coppie (ogni quota contro ogni lato di ogni poligono), come prima dello sweep ---
+
+def reference_segments(y_val, polys, p):
+    out = []
+    for poly in polys:
+        if not (poly['type'] in ('fianchi', 'testate', 'ext') or 'Reinf' in poly['id']): continue
+        pts = poly['coords']
+        xs = []
+        for i in range(len(pts)):
+            p1, p2 = pts[i], pts[(i+1) % len(pts)]
+            if ((p1[1] < y_val <= p2[1]) or (p2[1] < y_val <= p1[1])) and abs(p2[1] - p1[1]) > 1e-5:
+                xs.append(p1[0] + (y_val - p1[1]) / (p2[1] - p1[1]) * (p2[0] - p1[0]))
+        xs.sort()
+        for k in range(0, len(xs) - 1, 2):
+            x_start, x_end = xs[k] + 5.0, xs[k+1] - 5.0
+            if x_start >= x_end: continue
+            if poly['type'] == 'fianchi' and p.get('fianchi_shape') == 'ferro':
+                c_half = p.get('fianchi_cutout_w', 0) / 2
+                seg_L_end = min(x_end, -c_half - 5.0)
+                if x_start < seg_L_end: out.append([(x_start, y_val), (seg_L_end, y_val)])
+                seg_R_start = max(x_start, c_half + 5.0)
+                if seg_R_start < x_end: out.append([(seg_R_start, y_val), (x_end, y_val)])
+            else:
+                out.append([(x_start, y_val), (x_end, y_val)])
+    return out
+
+def reference_positions(limit_inner, limit_fianco, limit_reinf, limit_flap):
+    d = 1 if limit_inner > limit_fianco else -1
+    cand = [(limit_reinf if limit_reinf is not None else limit_fianco) + 5 * d]
+    cand.append(cand[0] + 15 * d)
+    if limit_flap is not None: cand += [limit_flap + 5 * d, limit_flap + 20 * d]
+    while len(cand) < 4: cand.append(cand[-1] + 15 * d)
+    cand.sort(reverse=d < 0)
+    merged = [cand[0]]
+    for c in cand[1:]:
+        if abs(c - merged[-1]) > 2.0: merged.append(c)
+    ys = merged[:4]
+    while len(ys) < 4: ys.append(ys[-1] + 15 * d)
+    for i in range(1, 4):
+        if abs(ys[i] - ys[i-1]) < 10.0: ys[i] = ys[i-1] + 10 * d
+    safe = limit_inner - 15 * d
+    clamped = (ys[3] - safe) * d > 0
+    if clamped:
+        ys[3] = safe
+        if abs(ys[3] - ys[2]) < 10.0:
+            ys[2] = ys[3] - 10 * d
+            if abs(ys[2] - ys[1]) < 10.0: ys[1] = ys[2] - 10 * d
+    return ys, clamped
+
+def reference_glue(polys, p):
+    W, HF = p['W'], p['h_fianchi']
+    h_low, r_h = p['fianchi_h_low'], p['fianchi_r_h']
+    sides = []
+    for s in (-1, 1):
+        reinf = s * (W/2 + h_low + r_h) if p['fianchi_r_active'] else None
+        flap = s * (W/2 + p['plat_flap_w']) if p['platform_active'] else None
+        sides.append(reference_positions(s * W/2, s * (W/2 + HF), reinf, flap))
+    (top, clamp_top), (btm, clamp_btm) = sides
+    lines = []
+    for i in range(4):
+        lines += [(seg, i) for seg in reference_segments(top[i], polys, p)]
+        lines += [(seg, i) for seg in reference_segments(btm[i], polys, p)]
+    return lines, clamp_top or clamp_btm
+
+@pytest.mark.parametrize('step', (0, 1.0, 5.0))
+@pytest.mark.parametrize('seed', range(4))
+def test_sweep_matches_pairwise_search(seed, step):
+    rng = random.Random(seed)
+    m = BoxManager() # Un solo manager: anche la tabella dei lati in cache tra build incrementali
+    clamped_seen = set()
+    for _ in range(100):
+        p = random_params(rng, step)
+        m.build(p)
+        polys, _, _, glue = m.get_2d_diagram(p)
+        expected, clamped = reference_glue(polys, p)
+        assert glue == expected, p
+        assert m.glue_clamped == clamped, p
+        clamped_seen.add(clamped)
+    assert clamped_seen == {False, True} # Il campione copre entrambi i casi del vincolo dal fondo
@@ -0,0 +1,140 @@
+import os
+import ctypes
+
+import numpy as np
+import pytest
+
+from geometry_oop import (BoxManager, DEFAULT_PARAMS, FOLD_ROLES, fold_all_schedule, fold_table,
+                          hinge_local, hinge_mesh)
+
+SIZE = 320
+DESIGNS = {
+    'ferro': DEFAULT_PARAMS,
+    'rect': dict(DEFAULT_PARAMS, fianchi_shape='rect', testate_shape='rect', fianchi_r_active=False,
+                 testate_r_active=False, platform_active=False),
+}
+
+@pytest.fixture(scope='module')
+def GL():
+    """Contesto Mesa senza display (EGL surfaceless) con un FBO; salta solo se non si puo' creare."""
+    pytest.importorskip('OpenGL')
+    pytest.importorskip('PySide6')
+    import bench
+    try: bench.egl_context(SIZE, SIZE)
+    except Exception as e: pytest.skip(f"nessun contesto OpenGL: {e}")
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6.QtWidgets import QApplication
+    QApplication.instance() or QApplication([]) # Per creare Viewer3D (QOpenGLWidget)
+    from OpenGL import GL
+    return GL
+
+def folded(p, t):
+    """Manager costruito con p e piegato alla frazione t del programma di anim_all."""
+    frames = fold_all_schedule()[0]
+    m = BoxManager(); m.build(p)
+    m.set_angles(frames[int(t * (len(frames) - 1))])
+    return m
+
+def feedback_program(GL):
+    """Il programma della piega di Viewer3D con gl_Position catturata (transform feedback)."""
+    from OpenGL.GL import shaders
+    from widgets_3d import FOLD_VS, FOLD_FS
+    prog = GL.glCreateProgram()
+    for src, kind in ((FOLD_VS, GL.GL_VERTEX_SHADER), (FOLD_FS, GL.GL_FRAGMENT_SHADER)):
+        GL.glAttachShader(prog, shaders.compileShader(src, kind))
+    names = (ctypes.c_char_p * 1)(b'gl_Position')
+    GL.glTransformFeedbackVaryings(prog, 1, ctypes.cast(names, ctypes.POINTER(ctypes.POINTER(ctypes.c_char))), GL.GL_INTERLEAVED_ATTRIBS)
+    GL.glLinkProgram(prog)
+    assert GL.glGetProgramiv(prog, GL.GL_LINK_STATUS) == GL.GL_TRUE, GL.glGetProgramInfoLog(prog)
+    return prog
+
+def gpu_positions(GL, m):
+    """Scena aperta come la carica Viewer3D (pannelli locali, poi cerniere) piegata dallo shader:
+    con matrici identita' gl_Position e' la posizione in mondo. Restituisce anche (nodo, frazione) per vertice."""
+    nodes = m.index.nodes
+    verts = [n.local_mesh().vertices for n in nodes]
+    pf = [np.broadcast_to(np.float32((i, 1)), (len(v), 2)) for i, v in enumerate(verts)]
+    hv, hn, hi, hpf = hinge_local(nodes)
+    verts = np.ascontiguousarray(np.concatenate(verts + [hv]), np.float32)
+    pf = np.ascontiguousarray(np.concatenate(pf + [hpf]), np.float32)
+    n = len(verts)
+
+    prog = feedback_program(GL)
+    GL.glUseProgram(prog)
+    for k, table in zip(('pivot', 'frame', 'fold'), fold_table(nodes)):
+        GL.glUniform4fv(GL.glGetUniformLocation(prog, k), len(table), table)
+    GL.glUniform1fv(GL.glGetUniformLocation(prog, 'angles'), len(FOLD_ROLES), [m.angles.get(r, 0) for r in FOLD_ROLES])
+    GL.glMatrixMode(GL.GL_PROJECTION); GL.glLoadIdentity()
+    GL.glMatrixMode(GL.GL_MODELVIEW); GL.glLoadIdentity()
+
+    tfb = GL.glGenBuffers(1)
+    GL.glBindBuffer(GL.GL_TRANSFORM_FEEDBACK_BUFFER, tfb)
+    GL.glBufferData(GL.GL_TRANSFORM_FEEDBACK_BUFFER, n * 16, None, GL.GL_STATIC_READ)
+    GL.glBindBufferBase(GL.GL_TRANSFORM_FEEDBACK_BUFFER, 0, tfb)
+    loc = GL.glGetAttribLocation(prog, 'panel_fold')
+    normals = np.zeros_like(verts); normals[:, 2] = 1
+    GL.glEnableClientState(GL.GL_VERTEX_ARRAY); GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+    GL.glEnableVertexAttribArray(loc)
+    GL.glVertexPointer(3, GL.GL_FLOAT, 0, verts)
+    GL.glNormalPointer(GL.GL_FLOAT, 0, normals)
+    GL.glVertexAttribPointer(loc, 2, GL.GL_FLOAT, GL.GL_FALSE, 0, pf)
+    GL.glEnable(GL.GL_RASTERIZER_DISCARD)
+    GL.glBeginTransformFeedback(GL.GL_POINTS)
+    GL.glDrawArrays(GL.GL_POINTS, 0, n)
+    GL.glEndTransformFeedback()
+    GL.glDisable(GL.GL_RASTERIZER_DISCARD)
+    GL.glDisableVertexAttribArray(loc)
+    GL.glDisableClientState(GL.GL_NORMAL_ARRAY); GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+    GL.glUseProgram(0)
+    out = np.frombuffer(GL.glGetBufferSubData(GL.GL_TRANSFORM_FEEDBACK_BUFFER, 0, n * 16), np.float32).reshape(-1, 4)
+    GL.glBindBuffer(GL.GL_TRANSFORM_FEEDBACK_BUFFER, 0)
+    GL.glDeleteBuffers(1, [tfb]); GL.glDeleteProgram(prog)
+    return out[:, :3].astype(float), verts.astype(float), pf, len(verts) - len(hv)
+
+@pytest.mark.parametrize('design', sorted(DESIGNS))
+@pytest.mark.parametrize('t', (0.0, 0.3, 0.6, 1.0))
+def test_shader_positions_match_cpu(GL, design, t):
+    m = folded(DESIGNS[design], t)
+    gpu, local, pf, n_panels = gpu_positions(GL, m)
+    nodes = m.index.nodes
+
+    # Pannelli: matrici mondo della CPU (catena di _local_matrix)
+    expected = np.empty_like(gpu)
+    for i, n in enumerate(nodes):
+        sel = np.flatnonzero(pf[:n_panels, 0] == i)
+        expected[sel] = n.to_world(local[sel])
+    # Cerniere: piega parziale s dell'angolo del nodo nel riferimento del padre
+    for k in range(n_panels, len(gpu)):
+        n, s = nodes[int(pf[k, 0])], float(pf[k, 1])
+        w = n.parent.world_matrix() @ n._local_matrix(n.fold_angle * s)
+        expected[k] = w[:3, :3] @ local[k] + w[:3, 3]
+    np.testing.assert_allclose(gpu, expected, atol=0.05) # mm, precisione float32 dello shader
+
+    # Le cerniere piegate sullo shader sono le stesse strisce di hinge_mesh
+    cpu_hinges = np.unique(np.round(hinge_mesh(nodes[1:]).vertices, 1), axis=0)
+    gpu_hinges = np.unique(np.round(gpu[n_panels:], 1), axis=0)
+    assert len(cpu_hinges) == len(gpu_hinges)
+    np.testing.assert_allclose(gpu_hinges, cpu_hinges, atol=0.15)
+
+def render(GL, v, gpu):
+    v.set_gpu_fold(gpu)
+    v.paintGL(); GL.glFinish()
+    assert v.fold_scene == gpu
+    buf = GL.glReadPixels(0, 0, SIZE, SIZE, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE)
+    return np.frombuffer(buf, np.uint8).reshape(SIZE, SIZE, 4)[..., :3].astype(int)
+
+@pytest.mark.parametrize('design', sorted(DESIGNS))
+def test_viewer_gpu_and_cpu_images_match(GL, design):
+    from widgets_3d import Viewer3D
+    v = Viewer3D()
+    v.update = lambda *a: None # paintGL a mano sul FBO EGL
+    v.initializeGL(); v.resizeGL(SIZE, SIZE)
+    assert v.program is not None, "il programma della piega non compila"
+    v.set_scene(folded(DESIGNS[design], 0.6))
+    gpu, cpu = render(GL, v, True), render(GL, v, False)
+    bg = (gpu == gpu[0, 0]).all(axis=-1)
+    assert 0.02 < 1 - bg.mean() < 0.98 # La scatola e' nell'inquadratura
+    diff = np.abs(gpu - cpu).max(axis=-1)
+    # Bordi dei triangoli (antialiasing) e normali delle cerniere (radiali sullo shader, piatte sulla CPU)
+    assert (diff > 24).mean() < 0.01
+    assert diff.mean() < 2.0
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS, PARAM_DEPS
+
+BASES = {
+    'ferro': DEFAULT_PARAMS,
+    'rect': dict(DEFAULT_PARAMS, fianchi_shape='rect', testate_shape='rect', fianchi_r_active=False,
+                 testate_r_active=False, platform_active=False),
+}
+ANGLES = {'fianchi': 40, 'testate': 70, 'lembi': 80, 'fasce': 30, 'ext': 20, 'reinf': 100}
+
+def edited(p, key):
+    """p con la sola chiave key cambiata (numeri +10% e 3 mm, booleani e forme invertiti)."""
+    v = p[key]
+    if isinstance(v, bool): v = not v
+    elif isinstance(v, str): v = 'rect' if v == 'ferro' else 'ferro'
+    else: v = v * 1.1 + 3
+    return dict(p, **{key: v})
+
+def test_every_param_has_a_group():
+    assert set().union(*PARAM_DEPS.values()) == set(DEFAULT_PARAMS)
+
+def state(m, p):
+    return m.get_2d_diagram(p), [(n.name, n.world_matrix()) for n in m.index.nodes]
+
+@pytest.mark.parametrize('base', sorted(BASES))
+@pytest.mark.parametrize('key', sorted(DEFAULT_PARAMS))
+def test_single_key_edit_matches_fresh_build(base, key):
+    p0 = BASES[base]
+    p1 = edited(p0, key)
+    inc = BoxManager(); inc.build(p0); inc.set_angles(ANGLES)
+    inc.get_2d_diagram(p0) # Diagramma e tabella colla in cache dalla build precedente
+    inc.build(p1)
+    fresh = BoxManager(); fresh.build(p1); fresh.set_angles(ANGLES)
+
+    (diagram, worlds), (ref_diagram, ref_worlds) = state(inc, p1), state(fresh, p1)
+    assert diagram == ref_diagram
+    assert inc.glue_clamped == fresh.glue_clamped
+    assert [name for name, _ in worlds] == [name for name, _ in ref_worlds]
+    for (name, w), (_, ref) in zip(worlds, ref_worlds):
+        np.testing.assert_allclose(w, ref, atol=1e-9, err_msg=name)
+
+    # E ritorno: la build incrementale verso p0 ridà la geometria iniziale
+    inc.build(p0)
+    back = BoxManager(); back.build(p0); back.set_angles(ANGLES)
+    assert state(inc, p0)[0] == state(back, p0)[0]
+
+@pytest.mark.parametrize('key', ('L', 'W', 'thickness', 'h_testate'))
+def test_failed_build_keeps_no_stale_reference(key, monkeypatch):
+    """Una build che fallisce a meta' (i rami da rigenerare saltano) non diventa il riferimento: dopo, sia
+    ripetere la modifica sia tornare ai parametri di prima ridanno la geometria di una build da zero."""
+    p0 = BASES['ferro']
+    p1 = edited(p0, key)
+    m = BoxManager(); m.build(p0)
+    def fail(self, *args): raise RuntimeError("build interrotta")
+    for name in ('_build_fianchi', '_build_testate', '_build_lembi', '_build_fasce'): monkeypatch.setattr(BoxManager, name, fail)
+    with pytest.raises(RuntimeError): m.build(p1)
+    assert m.params is None
+    monkeypatch.undo()
+    for p in (p1, p0):
+        m.build(p)
+        ref = BoxManager(); ref.build(p)
+        assert state(m, p)[0] == state(ref, p)[0]
+        assert m.params == p
@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS, diagram_metrics
+from test_glue import random_params
+from test_incremental_build import BASES, edited
+
+def assert_same(m, ref):
+    for k in ('bbox_w', 'bbox_h', 'board_area', 'cut_length', 'crease_length', 'glue_length'):
+        assert getattr(m, k) == pytest.approx(getattr(ref, k), rel=1e-9, abs=1e-9), k
+    assert m.glue_lengths == pytest.approx(ref.glue_lengths, rel=1e-9, abs=1e-9)
+    assert m.glue_clamped == ref.glue_clamped
+
+def from_diagram(m, p):
+    return diagram_metrics(m.get_2d_diagram(p), m.glue_clamped)
+
+def test_closed_form_matches_diagram():
+    """Forma chiusa contro misure dalle coordinate del diagramma, su design casuali nei limiti d'uso (scassi
+    piu' stretti dei pannelli, risvolti della piattaforma entro il fianco). Misure continue: nessun lato cade
+    per caso su una cordonatura d'altri (vedi BoxManager.metrics). Un solo manager: anche le misure per nodo
+    in cache tra build."""
+    rng = random.Random(0)
+    m = BoxManager()
+    checked = 0
+    while checked < 300:
+        p = random_params(rng, 0)
+        if p['platform_active'] and p['plat_flap_w'] + p['thickness'] / 2 >= p['h_fianchi']: continue
+        checked += 1
+        m.build(p)
+        first = m.metrics(p)
+        assert m.metrics(p) is first # In cache per build e parametri
+        assert_same(first, from_diagram(m, p))
+
+@pytest.mark.parametrize('base', sorted(BASES))
+@pytest.mark.parametrize('key', sorted(DEFAULT_PARAMS))
+def test_single_key_edit_updates_metrics(base, key):
+    p0 = BASES[base]
+    p1 = edited(p0, key)
+    m = BoxManager(); m.build(p0); m.metrics(p0)
+    m.build(p1)
+    assert_same(m.metrics(p1), from_diagram(m, p1))
+    fresh = BoxManager(); fresh.build(p1)
+    assert m.metrics(p1) == fresh.metrics(p1)
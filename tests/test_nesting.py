@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS
+from nesting import nest, main
+
+SMALL = dict(DEFAULT_PARAMS, L=160.0, W=110.0, h_fianchi=50.0, fianchi_h_low=30.0, fianchi_cutout_w=80.0,
+             fianchi_r_h=15.0, h_testate=50.0, testate_h_low=30.0, testate_cutout_w=60.0, testate_r_h=15.0,
+             fascia_h=20.0, plat_flap_w=25.0, F=40.0)
+RECT = dict(SMALL, fianchi_shape='rect', testate_shape='rect', fianchi_r_active=False,
+            testate_r_active=False, platform_active=False)
+
+def diagram(p):
+    m = BoxManager(); m.build(p)
+    return m.get_2d_diagram(p)
+
+def copies(layout):
+    """Lati (E, 2, 2) e contorni di ogni copia disposta, dal diagramma del foglio."""
+    out = {}
+    for q in layout.diagram()[0]:
+        pts = np.asarray(q['coords'], float)
+        out.setdefault(q['id'].split(':')[0], []).append(pts)
+    return [(np.concatenate([np.stack([p, np.roll(p, -1, axis=0)], axis=1) for p in polys]), polys)
+            for polys in out.values()]
+
+def point_segment(p, a, b):
+    """Distanze (P, S) dei punti p (P, 2) dai segmenti a-b (S, 2)."""
+    d = b - a
+    t = np.clip(((p[:, None] - a) * d).sum(-1) / np.maximum((d * d).sum(-1), 1e-12), 0, 1)
+    return np.hypot(*(p[:, None] - (a + t[..., None] * d)).transpose(2, 0, 1))
+
+def segments_cross(e1, e2):
+    """Qualche lato di e1 attraversa propriamente un lato di e2 (i contatti li misura point_segment)."""
+    def orient(a, b, c): return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1]) - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+    a, b = e1[:, None, 0], e1[:, None, 1]
+    c, d = e2[None, :, 0], e2[None, :, 1]
+    return ((orient(a, b, c) * orient(a, b, d) < 0) & (orient(c, d, a) * orient(c, d, b) < 0)).any()
+
+def inside(pt, polys):
+    """Punto dentro uno dei poligoni (pari/dispari)."""
+    x, y = pt
+    for p in polys:
+        q = np.roll(p, -1, axis=0)
+        cross = (p[:, 1] > y) != (q[:, 1] > y)
+        xs = p[cross, 0] + (y - p[cross, 1]) * (q[cross, 0] - p[cross, 0]) / (q[cross, 1] - p[cross, 1])
+        if (xs > x).sum() % 2: return True
+    return False
+
+def min_distance(c1, c2):
+    (e1, polys1), (e2, polys2) = c1, c2
+    if segments_cross(e1, e2) or inside(e2[0, 0], polys1) or inside(e1[0, 0], polys2): return 0.0
+    return min(point_segment(e1[:, 0], e2[:, 0], e2[:, 1]).min(), point_segment(e2[:, 0], e1[:, 0], e1[:, 1]).min())
+
+@pytest.mark.parametrize('gutter', (5.0, 12.0))
+def test_copies_respect_gutter_and_sheet(gutter):
+    sheet = (900.0, 700.0)
+    layout = nest([diagram(SMALL), diagram(RECT)], sheet, gutter=gutter, jobs=1)
+    placed = copies(layout)
+    assert len(placed) == len(layout.placements) >= 4
+
+    for edges, _ in placed:
+        pts = edges.reshape(-1, 2)
+        assert pts.min() >= -1e-9
+        assert pts[:, 0].max() <= sheet[0] + 1e-9 and pts[:, 1].max() <= sheet[1] + 1e-9
+
+    nearest = min(min_distance(placed[i], placed[j]) for i in range(len(placed)) for j in range(i + 1, len(placed)))
+    assert nearest >= gutter - 1e-6
+
+def test_sheet_too_small_places_nothing():
+    layout = nest([diagram(SMALL)], (100.0, 100.0), jobs=1)
+    assert layout.placements == [] and layout.utilisation == 0.0
+
+def test_counts_must_match_blanks(capsys):
+    with pytest.raises(ValueError): nest([diagram(SMALL), diagram(RECT)], (900.0, 700.0), counts=[1], jobs=1)
+    with pytest.raises(SystemExit) as e: main(['900x700', '-n', '1', '-n', '2', '-j', '1']) # Una fustella (default), due -n
+    assert e.value.code == 2 and '-n' in capsys.readouterr().err
+    layout = nest([diagram(SMALL), diagram(RECT)], (900.0, 700.0), counts=[1, None], jobs=1)
+    assert layout.counts[0] == 1 and layout.counts[1] > 0
@@ -0,0 +1,77 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+import geometry_oop
+from geometry_oop import BoxManager, round_poly, round_polys
+from test_glue import random_params
+
+def reference_round(points, radius=2.0, steps=3):
+    """Raccordo un vertice alla volta, come prima del calcolo vettoriale."""
+    if len(points) < 3: return points
+    out = []
+    n = len(points)
+    for i in range(n):
+        pp, pc, pn = points[i-1], points[i], points[(i+1) % n]
+        d1, d2 = math.hypot(pp[0]-pc[0], pp[1]-pc[1]), math.hypot(pn[0]-pc[0], pn[1]-pc[1])
+        r = min(radius, d1/2, d2/2)
+        if r < 0.1 or d1 == 0 or d2 == 0:
+            out.append(pc); continue
+        ps = (pc[0] + (pp[0]-pc[0])/d1*r, pc[1] + (pp[1]-pc[1])/d1*r)
+        pe = (pc[0] + (pn[0]-pc[0])/d2*r, pc[1] + (pn[1]-pc[1])/d2*r)
+        out.append(ps)
+        for s in range(1, steps + 1):
+            t = s / steps; inv = 1.0 - t
+            out.append(tuple(inv**2 * ps[k] + 2*inv*t * pc[k] + t**2 * pe[k] for k in (0, 1)))
+    return out
+
+def assert_same(got, expected):
+    assert len(got) == len(expected)
+    np.testing.assert_allclose(np.asarray(got, float).reshape(-1, 2), np.asarray(expected, float).reshape(-1, 2), atol=1e-9)
+
+def random_polygon(rng):
+    """Contorno a stella (anche con lati cortissimi, attorno alla soglia di 0.1 mm di raggio, e nulli)
+    o degenere, sotto i 3 vertici."""
+    n = rng.choice((1, 2, 3, 4, 7, 20))
+    pts = []
+    for k in range(n):
+        a, r = 2 * math.pi * k / n, rng.uniform(0.05, 200)
+        pts.append((r * math.cos(a), r * math.sin(a)))
+    if n > 3 and rng.random() < 0.5:
+        d = rng.choice((0.0, rng.uniform(0.1, 0.5)))
+        pts.insert(2, (pts[1][0] + d, pts[1][1]))
+    return pts
+
+@pytest.mark.parametrize('radius', (0.5, 2.0, 15.0))
+def test_batch_matches_reference(radius):
+    rng = random.Random(int(radius * 10))
+    geometry_oop._round_cache.clear()
+    polys = [random_polygon(rng) for _ in range(300)]
+    polys += polys[:50] # Ripetuti nello stesso blocco
+    for _ in range(2): # Prima dal calcolo, poi dalla cache
+        out = round_polys(polys, radius, steps=4)
+        for p, got in zip(polys, out): assert_same(got, reference_round(p, radius, 4))
+    for p in polys[:20]: assert_same(round_poly(p, radius, 4), reference_round(p, radius, 4))
+
+def test_cached_results_are_independent_lists():
+    pts = [(0, 0), (100, 0), (100, 50), (0, 50)]
+    first = round_poly(pts)
+    first.clear()
+    assert_same(round_poly(pts), reference_round(pts))
+
+def test_lru_is_bounded(monkeypatch):
+    monkeypatch.setattr(geometry_oop, 'ROUND_CACHE_SIZE', 8)
+    geometry_oop._round_cache.clear()
+    round_polys([[(0, 0), (10 + i, 0), (0, 10)] for i in range(20)])
+    assert len(geometry_oop._round_cache) == 8
+
+def test_build_outlines_match_reference():
+    """Forme arrotondate in blocco a fine build: uguali al raccordo del contorno vivo pannello per pannello."""
+    rng = random.Random(0)
+    m = BoxManager()
+    for _ in range(30):
+        m.build(random_params(rng, 0))
+        for n in m.index.nodes:
+            assert_same(n.polygon, reference_round(n.outline, n.corner_radius))
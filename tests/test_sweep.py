@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from geometry_oop import BoxManager
+from sweep import Sweep, run_sweep, write_results, COLUMNS, MEASURES, GLUE_COLUMNS
+
+AXES = {'L': '380:420:20', 'fianchi_shape': 'rect,ferro', 'F': [80, 150], 'platform_active': 'true,false'}
+
+def reference(sweep):
+    """Una build da zero per combinazione, nell'ordine degli indici."""
+    rows = []
+    for i in range(len(sweep)):
+        p = sweep.params(i)
+        m = BoxManager(); m.build(p)
+        rows.append(m.metrics(p))
+    return rows
+
+def assert_matches(cols, sweep, rows):
+    assert set(cols) == set(sweep.keys) | set(COLUMNS)
+    assert all(len(c) == len(sweep) for c in cols.values())
+    for i, m in enumerate(rows):
+        p = sweep.params(i)
+        assert all(cols[k][i] == p[k] for k in sweep.keys) # Colonne dei parametri allineate alle righe
+        assert cols['ok'][i] and cols['glue_clamped'][i] == m.glue_clamped
+        for k in MEASURES: assert cols[k][i] == pytest.approx(getattr(m, k), rel=1e-12, abs=1e-9), (i, k)
+        np.testing.assert_allclose([cols[k][i] for k in GLUE_COLUMNS], m.glue_lengths, rtol=1e-12, atol=1e-9)
+
+@pytest.fixture(scope='module')
+def sweep(): return Sweep(AXES)
+
+@pytest.fixture(scope='module')
+def expected(sweep): return reference(sweep)
+
+def test_grid_shape(sweep):
+    assert sweep.shape == (3, 2, 2, 2) and len(sweep) == 24
+    assert sweep.params(0)['platform_active'] is True and sweep.params(1)['platform_active'] is False
+
+@pytest.mark.parametrize('jobs', (1, 2))
+def test_results_match_fresh_builds(sweep, expected, jobs):
+    # Blocchi piccoli e non multipli della griglia: piu' intervalli per worker, arrivo fuori ordine
+    assert_matches(run_sweep(sweep, jobs=jobs, chunksize=5), sweep, expected)
+
+def test_cache_gives_same_results(sweep, expected, tmp_path):
+    for _ in range(2): # Prima scrive, poi legge soltanto
+        assert_matches(run_sweep(sweep, jobs=1, chunksize=7, cache_dir=str(tmp_path)), sweep, expected)
+
+def test_failed_combination_is_flagged(monkeypatch):
+    sweep = Sweep({'L': [380, 400, 420]})
+    build = BoxManager.build
+    def fragile(self, p):
+        if p['L'] == 400: raise RuntimeError("build fallita")
+        return build(self, p)
+    monkeypatch.setattr(BoxManager, 'build', fragile)
+    cols = run_sweep(sweep, jobs=1)
+    assert cols['ok'].tolist() == [True, False, True]
+    assert np.isnan(cols['board_area'][1]) and cols['board_area'][2] > 0
+
+@pytest.mark.parametrize('fmt', ('npz', 'csv'))
+def test_written_results_roundtrip(sweep, tmp_path, fmt):
+    cols = run_sweep(sweep, jobs=1)
+    path = str(tmp_path / f'out.{fmt}')
+    write_results(path, cols)
+    if fmt == 'npz':
+        back = dict(np.load(path))
+    else:
+        import csv
+        with open(path, newline='', encoding='utf-8') as f: rows = list(csv.reader(f))
+        back = {k: [r[i] for r in rows[1:]] for i, k in enumerate(rows[0])}
+    assert list(back) == list(cols)
+    for k, col in cols.items(): assert [str(v) for v in np.asarray(back[k]).tolist()] == [str(v) for v in col.tolist()], k
@@ -0,0 +1,80 @@
+import random
+
+import numpy as np
+import pytest
+
+from geometry_oop import BoxManager, DEFAULT_PARAMS
+from test_glue import random_params
+
+def signed_areas(P, tris):
+    t = np.asarray(tris, int).reshape(-1, 3)
+    a, b, c = P[t[:, 0]], P[t[:, 1]], P[t[:, 2]]
+    return 0.5 * ((b - a)[:, 0] * (c - a)[:, 1] - (b - a)[:, 1] * (c - a)[:, 0])
+
+def polygon_area(P):
+    """Area con segno (positiva in senso antiorario)."""
+    return 0.5 * np.sum(P[:, 0] * np.roll(P[:, 1], -1) - np.roll(P[:, 0], -1) * P[:, 1])
+
+def is_simple(P):
+    """Nessuna coppia di lati non adiacenti si attraversa."""
+    a, b = P, np.roll(P, -1, axis=0)
+    def orient(p, q, r): return np.sign((q[..., 0] - p[..., 0]) * (r[..., 1] - p[..., 1]) - (q[..., 1] - p[..., 1]) * (r[..., 0] - p[..., 0]))
+    A, B, C, D = a[:, None], b[:, None], a[None], b[None]
+    cross = (orient(A, B, C) * orient(A, B, D) < 0) & (orient(C, D, A) * orient(C, D, B) < 0)
+    return not cross.any()
+
+def winding(P, q):
+    """Numero di avvolgimento del contorno P attorno ai punti q (Q, 2)."""
+    a, b = P[None] - q[:, None], np.roll(P, -1, axis=0)[None] - q[:, None]
+    turn = np.arctan2(a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0], (a * b).sum(-1))
+    return np.rint(turn.sum(1) / (2 * np.pi)).astype(int)
+
+def covered(P, tris, q):
+    out = np.zeros(len(q), bool)
+    for t in np.asarray(tris, int).reshape(-1, 3):
+        d = [(P[j, 0] - P[i, 0]) * (q[:, 1] - P[i, 1]) - (P[j, 1] - P[i, 1]) * (q[:, 0] - P[i, 0])
+             for i, j in ((t[0], t[1]), (t[1], t[2]), (t[2], t[0]))]
+        out |= ((d[0] >= 0) & (d[1] >= 0) & (d[2] >= 0)) | ((d[0] <= 0) & (d[1] <= 0) & (d[2] <= 0))
+    return out
+
+def edge_distance(P, q):
+    a, b = P, np.roll(P, -1, axis=0)
+    d = b - a
+    t = np.clip(((q[:, None] - a) * d).sum(-1) / np.maximum((d * d).sum(-1), 1e-12), 0, 1)
+    return np.hypot(*(q[:, None] - (a + t[..., None] * d)).transpose(2, 0, 1)).min(1)
+
+def outlines(p):
+    m = BoxManager(); m.build(p)
+    return [(n.name, np.asarray(n.polygon, float)[:, :2], n.triangles) for n in m.index.nodes]
+
+def test_simple_outlines_are_filled_exactly():
+    rng = random.Random(0)
+    checked = 0
+    for _ in range(400):
+        for name, P, tris in outlines(random_params(rng, 0)):
+            if not is_simple(P): continue # Raddoppi sovrapposti al pannello: li copre il test sotto
+            area, parts = polygon_area(P), signed_areas(P, tris)
+            assert (parts * np.sign(area) > 0).all(), name # Stesso verso del contorno
+            assert parts.sum() == pytest.approx(area, rel=1e-9, abs=1e-6), name
+            checked += 1
+    assert checked > 2000
+
+# Il primo dalla segnalazione: senza ripiego l'ear clipping si fermava e i fianchi restavano in parte scoperti
+WIDE = [dict(DEFAULT_PARAMS, L=194.0, fianchi_shape='rect', fianchi_cutout_w=232.0)]
+rng = random.Random(1)
+for _ in range(40):
+    p = random_params(rng, 0)
+    WIDE.append(dict(p, fianchi_cutout_w=p['L'] * rng.uniform(1.0, 1.4), testate_cutout_w=p['W'] * rng.uniform(1.0, 1.4)))
+
+@pytest.mark.parametrize('i', range(len(WIDE)))
+def test_self_intersecting_outlines_are_filled(i):
+    """Scasso piu' largo del pannello: contorno che si interseca, l'ear clipping resta senza orecchi.
+    Tutto l'interno (avvolgimento non nullo, lontano dai lati) resta coperto dai triangoli."""
+    qr = np.random.default_rng(i)
+    for name, P, tris in outlines(WIDE[i]):
+        area, parts = polygon_area(P), signed_areas(P, tris)
+        assert (parts * np.sign(area) >= 0).all(), name
+        assert np.abs(parts).sum() >= abs(area) * (1 - 1e-9), name
+        q = qr.uniform(P.min(0), P.max(0), (1500, 2))
+        q = q[(winding(P, q) != 0) & (edge_distance(P, q) > 0.5)]
+        assert covered(P, tris, q).all(), name
@@ -1,5 +1,7 @@
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel
+from PySide6.QtCore import Qt, QTimer
 from config import THEME
+import profiler
 
 class CollapsibleSection(QWidget):
     def __init__(self, title, parent=None, expanded=False):
@@ -39,4 +41,26 @@ class CollapsibleSection(QWidget):
         self.content_area.setVisible(self.expanded)
 
     def add_widget(self, widget):
-        self.content_layout.addWidget(widget)
\ No newline at end of file
+        self.content_layout.addWidget(widget)
+
+class ProfileOverlay(QLabel):
+    """Riquadro sopra una vista con FPS e millisecondi per stadio del profiler, aggiornato 4 volte al secondo."""
+    def __init__(self, parent, stages=None, frame_name=profiler.FRAME):
+        super().__init__(parent)
+        self.stages, self.frame_name = stages, frame_name
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setStyleSheet(f"background: rgba(0, 0, 0, 170); color: {THEME['fg_text']}; "
+                           "font-family: monospace; font-size: 11px; padding: 6px;")
+        self.timer = QTimer(self)
+        self.timer.setInterval(250)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def set_active(self, on):
+        self.setVisible(on)
+        if on: self.refresh(); self.timer.start()
+        else: self.timer.stop()
+
+    def refresh(self):
+        self.setText('\n'.join(profiler.overlay_lines(self.stages, self.frame_name)))
+        self.adjustSize(); self.move(8, 8)
@@ -1,11 +1,58 @@
 from PySide6.QtWidgets import (QWidget, QVBoxLayout, QGroupBox, QFormLayout, 
                                QDoubleSpinBox, QComboBox, QCheckBox, QLabel, QScrollArea)
-from PySide6.QtGui import QPainter, QPen, QColor, QPolygonF
-from PySide6.QtCore import Signal, Qt, QPointF
+from PySide6.QtGui import QPainter, QPen, QColor, QPolygonF, QPainterPath, QTransform
+from PySide6.QtCore import Signal, Qt, QPointF, QRectF
+import math
+import numpy as np
 from config import THEME
+from ui_utils import ProfileOverlay
+import profiler
 
 # --- CLASSE DISEGNO 2D ---
+GLUE_PALETTE = ["line_glue_1", "line_glue_2", "line_glue_3", "line_glue_4"]
+GRID_CELLS = 32     # Celle della griglia spaziale sul lato lungo della fustella
+LOD_PX = 0.5        # Vertici consecutivi piu' vicini di cosi' sullo schermo (pixel) si fondono
+LOD_BASE = 0.25     # Tolleranza del primo livello di semplificazione (mm), i successivi raddoppiano
+ZOOM_RANGE = (0.5, 200.0)
+ZOOM_STEP = 1.15    # Fattore di zoom per scatto della rotella
+
+def chain_segments(segments):
+    """Segmenti consecutivi che si toccano -> polilinee (i tagli tornano i contorni chiusi dei pannelli)."""
+    chains, last = [], None
+    for p1, p2 in segments:
+        p1, p2 = tuple(p1), tuple(p2)
+        if p1 == last: chains[-1].append(p2)
+        else: chains.append([p1, p2])
+        last = p2
+    return chains
+
+def simplify(points, tol):
+    """Scarta i vertici a meno di tol dall'ultimo tenuto (raccordi sotto il pixel); gli estremi restano."""
+    if not tol or len(points) < 3: return points
+    tol2 = tol * tol
+    out = [points[0]]; lx, ly = points[0]
+    for x, y in points[1:-1]:
+        if (x-lx)**2 + (y-ly)**2 >= tol2: out.append((x, y)); lx, ly = x, y
+    out.append(points[-1])
+    return out
+
+def items_path(items, closed, tol):
+    path = QPainterPath()
+    if closed: path.setFillRule(Qt.WindingFill)
+    for pts in items:
+        pts = simplify(pts, tol)
+        if closed: path.addPolygon(QPolygonF([QPointF(x, y) for x, y in pts[:-1]]))
+        else:
+            # Un sotto-percorso per segmento: le spezzate antialiasate passerebbero dallo stroker generico, molto piu' lento
+            for p1, p2 in zip(pts, pts[1:]): path.moveTo(*p1); path.lineTo(*p2)
+    return path
+
 class DrawingArea2D(QWidget):
+    """Fustella 2D con zoom (rotella), spostamento (trascinamento) e doppio clic per riadattare.
+    set_data divide le primitive per layer e le indicizza in una griglia in coordinate modello (mm);
+    i QPainterPath si costruiscono una volta per cella e livello di dettaglio, il disegno imposta solo
+    la trasformazione di vista e traccia le celle visibili."""
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.bg_color = QColor(THEME["bg_draw"])
@@ -15,7 +62,25 @@ class DrawingArea2D(QWidget):
         self.glue_lines = [] 
         self.L = 100
         self.W = 100
+        self.bounds = QRectF()
+        self.layers = []    # [(penna, pennello, chiuso, polilinee)] nell'ordine di disegno
+        self.cells = []     # Per cella occupata: indici delle polilinee per layer
+        self.cell_boxes = np.zeros((0, 4)) # Estensione delle primitive di ogni cella: x0, y0, x1, y1
+        self.paths = {}     # (livello, cella) -> [QPainterPath o None per layer]
+        self.zoom, self.center, self.drag = 1.0, None, None
+
+        # Penne cosmetiche: spessore in pixel qualunque sia la scala
+        self.pen_cut = QPen(QColor(THEME["line_cut"]), 2); self.pen_cut.setCosmetic(True)
+        self.pen_crease = QPen(QColor(THEME["line_crease"]), 2, Qt.DashLine); self.pen_crease.setCosmetic(True)
+        self.pen_glue = []
+        for key in GLUE_PALETTE:
+            pen = QPen(QColor(THEME[key]), 3, Qt.SolidLine, Qt.FlatCap); pen.setCosmetic(True)
+            self.pen_glue.append(pen)
 
+        # Overlay del profiler: FPS della tela e stadi che portano al diagramma
+        self.overlay = ProfileOverlay(self, ('build', 'diagram_2d', 'layers_2d', 'paint_2d'), 'frame_2d')
+
+    @profiler.timed('layers_2d')
     def set_data(self, polygons, cut_lines, crease_lines, glue_lines, L, W, h_f, h_t, F):
         self.polygons = polygons
         self.cut_lines = cut_lines
@@ -23,66 +88,145 @@ class DrawingArea2D(QWidget):
         self.glue_lines = glue_lines 
         self.L = L
         self.W = W
+        self.build_layers()
+        self.update()
+
+    def build_layers(self):
+        # Riempimenti: un layer per tipo di pannello (fondo piu' scuro, lembi piu' chiari), anelli chiusi
+        fills = {}
+        for p in self.polygons:
+            pts = [tuple(c) for c in p['coords']]
+            fills.setdefault(p['type'], []).append(pts + pts[:1])
+        layers = []
+        for kind, items in fills.items():
+            col = QColor(THEME["cardboard"])
+            if kind == 'fondo': col = col.darker(110)
+            elif kind == 'lembi': col = col.lighter(110)
+            layers.append((Qt.NoPen, col, True, items))
+
+        # Colla: un layer per ugello, poi tagli e cordonature
+        glue = {}
+        for seg, idx in self.glue_lines: glue.setdefault(idx, []).append(seg)
+        for idx, segs in glue.items(): layers.append((self.pen_glue[idx % len(self.pen_glue)], Qt.NoBrush, False, chain_segments(segs)))
+        layers.append((self.pen_cut, Qt.NoBrush, False, chain_segments(self.cut_lines)))
+        layers.append((self.pen_crease, Qt.NoBrush, False, chain_segments(self.crease_lines)))
+        self.layers, self.paths = layers, {}
+
+        # Riquadro di ogni polilinea (riduzione per blocchi sui vertici concatenati); la fustella e' il riquadro dei riempimenti
+        boxes = []
+        for _, _, _, items in layers:
+            flat = np.array([p for pts in items for p in pts], dtype=float).reshape(-1, 2)
+            starts = np.cumsum([0] + [len(pts) for pts in items[:-1]]) if items else []
+            boxes.append(np.hstack([np.minimum.reduceat(flat, starts), np.maximum.reduceat(flat, starts)]) if items else np.zeros((0, 4)))
+        fill_boxes = np.concatenate([b for b, l in zip(boxes, layers) if l[2]] or [np.zeros((0, 4))])
+        if not len(fill_boxes):
+            self.bounds, self.cells, self.cell_boxes = QRectF(), [], np.zeros((0, 4))
+            return
+        x0, y0 = fill_boxes[:, :2].min(axis=0); x1, y1 = fill_boxes[:, 2:].max(axis=0)
+        self.bounds = QRectF(x0, y0, x1 - x0, y1 - y0)
+
+        # Griglia: ogni polilinea va nella cella del centro del suo riquadro, la cella si estende a coprirla
+        size = max(x1 - x0, y1 - y0, 1e-9) / GRID_CELLS
+        all_boxes = np.concatenate(boxes)
+        keys = np.floor((all_boxes[:, :2] + all_boxes[:, 2:]) / 2 / size).astype(np.int64)
+        _, cell = np.unique(keys, axis=0, return_inverse=True)
+        cell = cell.ravel()
+        cell_boxes = np.full((cell.max() + 1, 4), np.inf); cell_boxes[:, 2:] = -np.inf
+        np.minimum.at(cell_boxes[:, :2], cell, all_boxes[:, :2]); np.maximum.at(cell_boxes[:, 2:], cell, all_boxes[:, 2:])
+        cells = [[[] for _ in layers] for _ in range(len(cell_boxes))]
+        layer_of = np.repeat(np.arange(len(layers)), [len(b) for b in boxes]).tolist()
+        item_of = np.concatenate([np.arange(len(b)) for b in boxes]).tolist()
+        for c, li, i in zip(cell.tolist(), layer_of, item_of): cells[c][li].append(i)
+        self.cells, self.cell_boxes = cells, cell_boxes
+
+    def layer_paths(self, level, cell):
+        """Percorsi per layer di una cella al livello di dettaglio dato (in cache)."""
+        key = (level, cell)
+        paths = self.paths.get(key)
+        if paths is None:
+            tol = LOD_BASE * 2**level if level is not None else None
+            paths = self.paths[key] = [items_path([items[i] for i in idx], closed, tol) if idx else None
+                                       for idx, (_, _, closed, items) in zip(self.cells[cell], self.layers)]
+        return paths
+
+    def fit_scale(self):
+        b = self.bounds
+        return min((self.width()-60)/b.width(), (self.height()-60)/b.height()) if b.width()>0 else 1
+
+    def view_center(self):
+        return self.center if self.center is not None else self.bounds.center()
+
+    def view_transform(self):
+        """Modello -> schermo: la fustella adattata alla finestra con 30 px di margine, poi zoom attorno al centro di vista."""
+        scale = self.fit_scale() * self.zoom
+        c = self.view_center()
+        t = QTransform()
+        t.translate(self.width()/2, self.height()/2)
+        t.scale(scale, scale)
+        t.translate(-c.x(), -c.y())
+        return t
+
+    def reset_view(self):
+        self.zoom, self.center = 1.0, None
         self.update()
 
+    @profiler.timed('paint_2d')
     def paintEvent(self, event):
+        profiler.frame('frame_2d')
         painter = QPainter(self)
         painter.setRenderHint(QPainter.Antialiasing)
         painter.fillRect(self.rect(), self.bg_color)
-        
-        all_coords = []
-        for p in self.polygons: all_coords.extend(p['coords'])
-        if not all_coords: return
-
-        xs = [c[0] for c in all_coords]
-        ys = [c[1] for c in all_coords]
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-        
-        w_bb, h_bb = max_x - min_x, max_y - min_y
-        scale = min((self.width()-60)/w_bb, (self.height()-60)/h_bb) if w_bb>0 else 1
-        cx, cy = (min_x+max_x)/2, (min_y+max_y)/2
-        
-        def to_s(x, y):
-            return QPointF((x-cx)*scale + self.width()/2, (y-cy)*scale + self.height()/2)
+        if self.bounds.isNull(): return
 
-        for p in self.polygons:
-            pts = [to_s(x,y) for x,y in p['coords']]
-            col = QColor(THEME["cardboard"])
-            if p['type'] == 'fondo': col = col.darker(110)
-            elif p['type'] == 'lembi': col = col.lighter(110)
-            painter.setBrush(col)
-            painter.setPen(Qt.NoPen)
-            painter.drawPolygon(QPolygonF(pts))
-
-        # --- Disegno Linee Colla (Multicolore) ---
-        glue_colors = [
-            QColor(THEME["line_glue_1"]),
-            QColor(THEME["line_glue_2"]),
-            QColor(THEME["line_glue_3"]),
-            QColor(THEME["line_glue_4"])
-        ]
-        
-        pen_glue = QPen()
-        pen_glue.setWidth(3)
-        pen_glue.setStyle(Qt.SolidLine)
-        pen_glue.setCapStyle(Qt.FlatCap)
-        
-        for (p1, p2), idx in self.glue_lines:
-            col = glue_colors[idx % 4]
-            pen_glue.setColor(col)
-            painter.setPen(pen_glue)
-            painter.drawLine(to_s(*p1), to_s(*p2))
-
-        # --- Disegno Tagli ---
-        painter.setPen(QPen(QColor(THEME["line_cut"]), 2))
-        for p1, p2 in self.cut_lines: painter.drawLine(to_s(*p1), to_s(*p2))
-            
-        # --- Disegno Cordonature ---
-        pen_cr = QPen(QColor(THEME["line_crease"]), 2)
-        pen_cr.setStyle(Qt.DashLine)
-        painter.setPen(pen_cr)
-        for p1, p2 in self.crease_lines: painter.drawLine(to_s(*p1), to_s(*p2))
+        t = self.view_transform()
+        scale = self.fit_scale() * self.zoom
+        # Livello di dettaglio: il piu' grossolano la cui tolleranza resta sotto LOD_PX sullo schermo
+        tol = LOD_PX / scale
+        level = int(math.floor(math.log2(tol / LOD_BASE))) if tol >= LOD_BASE else None
+        # Solo le celle visibili (margine per lo spessore delle penne). Anche a fustella tutta in vista si disegna
+        # per cella: il rasterizzatore antialiasato di Qt rallenta molto su un unico percorso esteso quanto il foglio
+        m = 4 / scale
+        view = t.inverted()[0].mapRect(QRectF(event.rect())).adjusted(-m, -m, m, m)
+        b = self.cell_boxes
+        vis = (b[:, 0] <= view.right()) & (b[:, 2] >= view.left()) & (b[:, 1] <= view.bottom()) & (b[:, 3] >= view.top())
+        parts = [self.layer_paths(level, c) for c in np.nonzero(vis)[0].tolist()]
+
+        painter.setTransform(t)
+        for li, (pen, brush, _, _) in enumerate(self.layers):
+            painter.setPen(pen); painter.setBrush(brush)
+            for paths in parts:
+                if paths[li] is not None: painter.drawPath(paths[li])
+
+    def wheelEvent(self, event):
+        if self.bounds.isNull(): return
+        pos = event.position()
+        anchor = self.view_transform().inverted()[0].map(pos)
+        zoom = min(max(self.zoom * ZOOM_STEP ** (event.angleDelta().y() / 120), ZOOM_RANGE[0]), ZOOM_RANGE[1])
+        if zoom == self.zoom: return
+        # Il punto sotto il cursore resta fermo
+        self.zoom = zoom; scale = self.fit_scale() * zoom
+        self.center = QPointF(anchor.x() - (pos.x() - self.width()/2) / scale, anchor.y() - (pos.y() - self.height()/2) / scale)
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() != Qt.LeftButton or self.bounds.isNull(): return
+        self.drag = event.position()
+        self.setCursor(Qt.ClosedHandCursor)
+
+    def mouseMoveEvent(self, event):
+        if self.drag is None: return
+        pos, scale, c = event.position(), self.fit_scale() * self.zoom, self.view_center()
+        self.center = QPointF(c.x() - (pos.x() - self.drag.x()) / scale, c.y() - (pos.y() - self.drag.y()) / scale)
+        self.drag = pos
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() != Qt.LeftButton: return
+        self.drag = None
+        self.unsetCursor()
+
+    def mouseDoubleClickEvent(self, event):
+        self.reset_view()
 
 
 # --- CLASSE PARAMETRI (Rimane invariata) ---
@@ -1,41 +1,156 @@
 from PySide6.QtOpenGLWidgets import QOpenGLWidget
 from PySide6.QtCore import Qt, QPoint
 from PySide6.QtGui import QSurfaceFormat
-import math
+import ctypes
+import numpy as np
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from OpenGL.GL import shaders
 from config import THEME
+from ui_utils import ProfileOverlay
+import profiler
+from geometry_oop import BoxComponent, hinge_mesh, hinge_local, fold_table, FOLD_ROLES, COL_CARDBOARD, COL_WHITE, COL_SIDE
+
+# --- PIEGA SUL VERTEX SHADER ---
+# La scena aperta si carica una volta per build; ogni vertice porta l'indice del suo pannello e la frazione
+# dell'angolo di piega (1 per i pannelli, i/segmenti per le cerniere). Lo shader sale la catena dei padri
+# applicando le trasformazioni locali (pre-rotazione Z, piega attorno all'asse, pivot) con gli angoli dei gruppi:
+# per fotogramma bastano len(FOLD_ROLES) uniform. Luci come la pipeline fissa (GLSL 1.20: va anche su Mesa llvmpipe)
+MAX_PANELS = 32 # Pannelli nelle tabelle uniform (oltre si torna alla piega sulla CPU)
+MAX_DEPTH = 8 # Livelli dell'albero percorsi dallo shader
+
+FOLD_VS = """#version 120
+uniform vec4 pivot[%(panels)d]; // pivot, indice del padre (-1 = radice)
+uniform vec4 frame[%(panels)d]; // cos e sin di pre_rot_z, 1 = piega attorno a x, fold_multiplier
+uniform vec4 fold[%(panels)d];  // gruppo di piega (-1 = angolo fisso), angolo fisso
+uniform float angles[%(roles)d];
+attribute vec2 panel_fold;      // indice del pannello, frazione dell'angolo
+
+void main() {
+    vec3 p = gl_Vertex.xyz, n = gl_Normal;
+    int i = int(floor(panel_fold.x + 0.5));
+    float s = panel_fold.y;
+    for (int k = 0; k < %(depth)d; k++) {
+        if (i < 0) break;
+        vec4 fr = frame[i], fd = fold[i];
+        float a = radians((fd.x < 0.0 ? fd.y : angles[int(floor(fd.x + 0.5))]) * fr.w) * s;
+        float c = cos(a), sn = sin(a);
+        mat2 rz = mat2(fr.x, fr.y, -fr.y, fr.x);
+        p.xy = rz * p.xy; n.xy = rz * n.xy;
+        if (fr.z > 0.5) { p.yz = vec2(c*p.y - sn*p.z, sn*p.y + c*p.z); n.yz = vec2(c*n.y - sn*n.z, sn*n.y + c*n.z); }
+        else { p.xz = vec2(c*p.x + sn*p.z, c*p.z - sn*p.x); n.xz = vec2(c*n.x + sn*n.z, c*n.z - sn*n.x); }
+        p += pivot[i].xyz;
+        i = int(floor(pivot[i].w + 0.5)); s = 1.0;
+    }
+    vec4 eye = gl_ModelViewMatrix * vec4(p, 1.0);
+    vec3 N = normalize(gl_NormalMatrix * n);
+    vec4 col = gl_LightModel.ambient * gl_Color;
+    for (int l = 0; l < 2; l++) {
+        vec3 L = normalize(gl_LightSource[l].position.xyz - eye.xyz);
+        col += gl_LightSource[l].ambient * gl_Color + max(dot(N, L), 0.0) * gl_LightSource[l].diffuse * gl_Color;
+    }
+    gl_FrontColor = vec4(clamp(col.rgb, 0.0, 1.0), gl_Color.a);
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+""" % {'panels': MAX_PANELS, 'roles': len(FOLD_ROLES), 'depth': MAX_DEPTH}
+
+FOLD_FS = """#version 120
+void main() { gl_FragColor = gl_Color; }
+"""
+
+def fold_program():
+    """Compila il programma della piega; None se il contesto non lo supporta."""
+    try:
+        prog = glCreateProgram()
+        for src, kind in ((FOLD_VS, GL_VERTEX_SHADER), (FOLD_FS, GL_FRAGMENT_SHADER)):
+            glAttachShader(prog, shaders.compileShader(src, kind))
+        glLinkProgram(prog)
+        if glGetProgramiv(prog, GL_LINK_STATUS) != GL_TRUE: raise RuntimeError(glGetProgramInfoLog(prog))
+    except Exception:
+        profiler.report_error('shader')
+        return None
+    return prog
 
 class Viewer3D(QOpenGLWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.manager = None
+        self.base_mesh = None # Mesh aperta gia' in mondo (dalla cache su disco), mostrata finche' manca il manager
         self.cam_pitch = 45 
         self.cam_yaw = 45   
         self.scale = 1.8  
         self.drag_start = None
         self.transparency_mode = False
+        self.smooth_normals = True # Normali lisce sui raccordi degli angoli (BoxComponent.local_mesh)
         self.camera_dist = 1400 
         self.extra_lines = [] # Linee di debug/visualizzazione (es. sfregamento)
+        
+        # Buffer GPU della scena (caricati una volta per build)
+        self.vbo = None
+        self.ibo = None
+        self.draw_ranges = [] # (componente, offset indici, numero indici)
+        self.hinge_cache = None # (angoli, Mesh) delle cerniere
+        self.hinge_segments = BoxComponent.hinge_segments
+        self.panel_cache = {} # revisione forma -> (vertici, indici) in coordinate locali
+        self.scene_dirty = False
+
+        # Piega sul vertex shader (se il contesto lo compila), altrimenti matrici e cerniere dalla CPU
+        self.gpu_fold = True
+        self.program = None
+        self.fold_scene = False # La scena caricata e' quella per lo shader
+        self.fold_count = 0 # Indici della scena per lo shader (pannelli e cerniere)
 
         # Antialiasing attivo per bordi lisci
         fmt = QSurfaceFormat()
         fmt.setSamples(16)
         self.setFormat(fmt)
 
+        # Overlay del profiler: FPS della vista e stadi dell'animazione
+        self.overlay = ProfileOverlay(self, ('render', 'upload', 'hinge_mesh', 'anim_tick', 'record_traces', 'draw_traces'), 'frame_3d')
+
     def set_scene(self, manager):
+        # Si ricarica solo se la build ha toccato qualche componente
+        if manager is not self.manager or manager.dirty: self.scene_dirty = True
         self.manager = manager
+        self.base_mesh = None
+        self.update()
+
+    def set_mesh(self, mesh):
+        """Mostra una Mesh statica (scatola aperta, o None: niente) al posto della scena, fino al prossimo set_scene."""
+        self.manager = None
+        self.base_mesh = mesh
+        self.scene_dirty = True
         self.update()
 
     def set_transparency(self, enabled):
         self.transparency_mode = enabled
+        self.panel_cache = {} # L'alpha e' nei colori per vertice
+        self.scene_dirty = True
         self.update()
         
+    def set_smooth_normals(self, enabled):
+        self.smooth_normals = enabled
+        self.panel_cache = {}
+        self.scene_dirty = True
+        self.update()
+
     def set_extra_lines(self, lines):
         """Imposta linee extra da disegnare (lista di tuple (p1, p2))"""
         self.extra_lines = lines
         self.update()
 
+    def set_hinge_segments(self, n):
+        """Numero di segmenti delle strisce di cerniera (piu' segmenti = piega piu' morbida)."""
+        self.hinge_segments = max(1, int(n)); self.hinge_cache = None
+        if self.fold_scene: self.scene_dirty = True # Le cerniere sono nella scena caricata
+        self.update()
+
+    def set_gpu_fold(self, enabled):
+        """Piega sul vertex shader (True) o sulla CPU."""
+        self.gpu_fold = enabled
+        self.scene_dirty = True
+        self.update()
+
     def update_angles(self, angles):
         if self.manager: self.manager.set_angles(angles)
         self.update()
@@ -46,7 +161,7 @@ class Viewer3D(QOpenGLWidget):
         
         glEnable(GL_MULTISAMPLE) 
         glEnable(GL_LINE_SMOOTH)
-        glEnable(GL_NORMALIZE)
+        # Niente GL_NORMALIZE: le normali arrivano gia' unitarie e le matrici mondo sono rigide
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         
@@ -65,11 +180,13 @@ class Viewer3D(QOpenGLWidget):
         
         glEnable(GL_COLOR_MATERIAL)
         glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
-
-        self.tess = gluNewTess()
-        gluTessCallback(self.tess, GLU_TESS_BEGIN, glBegin)
-        gluTessCallback(self.tess, GLU_TESS_VERTEX, glVertex3dv)
-        gluTessCallback(self.tess, GLU_TESS_END, glEnd)
+        
+        self.program = fold_program()
+        if self.program:
+            self.u_fold = [glGetUniformLocation(self.program, k) for k in ('pivot', 'frame', 'fold')]
+            self.u_angles = glGetUniformLocation(self.program, 'angles')
+            self.a_panel_fold = glGetAttribLocation(self.program, 'panel_fold')
+        self.scene_dirty = True
 
     def resizeGL(self, w, h):
         glViewport(0, 0, w, h)
@@ -78,21 +195,158 @@ class Viewer3D(QOpenGLWidget):
         gluPerspective(45, w/h if h > 0 else 1, 10, 8000)
         glMatrixMode(GL_MODELVIEW)
 
-    def calc_normal(self, verts):
-        if len(verts) < 3: return (0, 0, 1)
-        p0, p1, p2 = verts[0], verts[1], verts[2]
-        nx = (p1[1]-p0[1])*(p2[2]-p0[2]) - (p1[2]-p0[2])*(p2[1]-p0[1])
-        ny = (p1[2]-p0[2])*(p2[0]-p0[0]) - (p1[0]-p0[0])*(p2[2]-p0[2])
-        nz = (p1[0]-p0[0])*(p2[1]-p0[1]) - (p1[1]-p0[1])*(p2[0]-p0[0])
-        l = math.sqrt(nx*nx + ny*ny + nz*nz)
-        if l == 0: return (0, 0, 1)
-        return (nx/l, ny/l, nz/l)
+    def build_panel(self, comp, palette):
+        """Vertici (posizione, normale, colore) e indici di un pannello, dalla sua mesh locale."""
+        m = comp.local_mesh(self.smooth_normals)
+        col = np.empty((len(m.vertices), 4), np.float32)
+        col[m.indices] = palette[m.face_color][:, None] # Ogni vertice appartiene a un solo tipo di faccia
+        return np.hstack([m.vertices, m.normals, col]), m.indices.ravel()
 
+    @profiler.timed('upload')
+    def upload_scene(self):
+        """Carica su GPU la geometria di ogni pannello in coordinate locali (posizione, normale, colore);
+        per la piega sullo shader anche pannello e frazione d'angolo per vertice, le cerniere e la gerarchia."""
+        if self.vbo is not None: glDeleteBuffers(2, [self.vbo, self.ibo])
+        self.vbo = self.ibo = None
+        self.draw_ranges = []
+        self.hinge_cache = None
+        self.scene_dirty = False
+        self.fold_scene = False
+        alpha = 0.55 if self.transparency_mode else 1.0
+        palette = np.zeros((3, 4), np.float32) # Per Mesh.face_color
+        palette[COL_CARDBOARD] = THEME["gl_brown"][:3] + (alpha,)
+        palette[COL_WHITE] = THEME["gl_white"][:3] + (alpha,)
+        palette[COL_SIDE] = THEME["gl_brown_dark"][:3] + (alpha,)
+        
+        if not self.manager or not self.manager.root:
+            m = self.base_mesh
+            if m is None or not len(m): return
+            # Mesh gia' in mondo: un solo intervallo, senza matrice del pannello
+            col = np.empty((len(m.vertices), 4), np.float32)
+            col[m.indices] = palette[m.face_color][:, None]
+            self.draw_ranges = [(None, 0, m.indices.size)]
+            self.upload_buffers(np.hstack([m.vertices, m.normals, col]), m.indices.ravel())
+            return
+        index = self.manager.index
+        gpu = self.program is not None and self.gpu_fold and len(index) <= MAX_PANELS and len(index.by_depth) <= MAX_DEPTH
+        
+        vdata, idata = [], []
+        base = base_i = 0
+        cache = {}
+        for i, comp in enumerate(index.nodes):
+            entry = self.panel_cache.get(comp.revision)
+            if entry is None: entry = self.build_panel(comp, palette)
+            cache[comp.revision] = entry
+            verts, idx = entry
+            if gpu: verts = np.hstack([verts, np.broadcast_to(np.float32((i, 1)), (len(verts), 2))])
+            
+            self.draw_ranges.append((comp, base_i, len(idx)))
+            vdata.append(verts)
+            idata.append(idx + np.uint32(base))
+            base += len(verts); base_i += len(idx)
+        self.panel_cache = cache
+        
+        if gpu:
+            # Cerniere aperte in coordinate locali, in coda ai pannelli; la gerarchia va negli uniform
+            hv, hn, hi, hpf = hinge_local(index.nodes, self.hinge_segments)
+            col = np.broadcast_to(np.float32(THEME["gl_white"][:3] + (alpha,)), (len(hv), 4))
+            vdata.append(np.hstack([hv, hn, col, hpf])); idata.append(hi.ravel() + np.uint32(base))
+            self.fold_count = base_i + hi.size
+            glUseProgram(self.program)
+            for loc, table in zip(self.u_fold, fold_table(index.nodes)): glUniform4fv(loc, len(table), table)
+            glUseProgram(0)
+            self.fold_scene = True
+        self.upload_buffers(np.concatenate(vdata), np.concatenate(idata))
+
+    def upload_buffers(self, vdata, idata):
+        self.vbo, self.ibo = glGenBuffers(2)
+        varr = np.ascontiguousarray(vdata, dtype=np.float32)
+        iarr = np.ascontiguousarray(idata, dtype=np.uint32)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, varr.nbytes, varr, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, iarr.nbytes, iarr, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw_panels(self):
+        """Una chiamata di disegno per pannello, con la sua matrice mondo corrente."""
+        stride = 10 * 4
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(12))
+        glColorPointer(4, GL_FLOAT, stride, ctypes.c_void_p(24))
+        
+        for comp, offset, count in self.draw_ranges:
+            glPushMatrix()
+            if comp is not None: glMultMatrixd(comp.world_matrix().T) # OpenGL vuole column-major
+            glDrawElements(GL_TRIANGLES, count, GL_UNSIGNED_INT, ctypes.c_void_p(offset * 4))
+            glPopMatrix()
+        
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def draw_folded(self):
+        """Scena aperta piegata dal vertex shader: angoli dei gruppi negli uniform e una sola chiamata di disegno."""
+        stride = 12 * 4
+        angles = self.manager.angles
+        glUseProgram(self.program)
+        glUniform1fv(self.u_angles, len(FOLD_ROLES), [angles.get(r, 0) for r in FOLD_ROLES])
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glEnableVertexAttribArray(self.a_panel_fold)
+        glVertexPointer(3, GL_FLOAT, stride, ctypes.c_void_p(0))
+        glNormalPointer(GL_FLOAT, stride, ctypes.c_void_p(12))
+        glColorPointer(4, GL_FLOAT, stride, ctypes.c_void_p(24))
+        glVertexAttribPointer(self.a_panel_fold, 2, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(40))
+        
+        glDrawElements(GL_TRIANGLES, self.fold_count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        
+        glDisableVertexAttribArray(self.a_panel_fold)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+    def draw_hinges(self):
+        """Le cerniere si deformano con l'angolo: vengono ricalcolate solo quando cambiano gli angoli."""
+        key = tuple(comp.fold_angle for comp, _, _ in self.draw_ranges)
+        if self.hinge_cache is None or self.hinge_cache[0] != key:
+            with profiler.stage('hinge_mesh'):
+                self.hinge_cache = (key, hinge_mesh([comp for comp, _, _ in self.draw_ranges if comp.parent], self.hinge_segments))
+        mesh = self.hinge_cache[1]
+        if not len(mesh): return
+        
+        col = THEME["gl_white"]
+        glColor4f(col[0], col[1], col[2], 0.55 if self.transparency_mode else 1.0)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, mesh.vertices)
+        glNormalPointer(GL_FLOAT, 0, mesh.normals)
+        glDrawElements(GL_TRIANGLES, mesh.indices.size, GL_UNSIGNED_INT, mesh.indices)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+
+    @profiler.timed('render')
     def paintGL(self):
+        profiler.frame('frame_3d')
         glClearColor(0.25, 0.25, 0.25, 1.0)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         
-        if not self.manager: return
+        if not self.manager and self.base_mesh is None: return
+        if self.scene_dirty: self.upload_scene()
         glLoadIdentity()
         
         glLightfv(GL_LIGHT0, GL_POSITION, [800.0, 1200.0, 1200.0, 1.0]) 
@@ -102,36 +356,10 @@ class Viewer3D(QOpenGLWidget):
         glRotatef(self.cam_pitch - 90, 1, 0, 0)
         glRotatef(self.cam_yaw, 0, 0, 1)
 
-        faces = self.manager.get_3d_faces()
-        
-        for face in faces:
-            c_type = face.get('col', 'cardboard')
-            
-            if c_type == 'white': 
-                col = THEME["gl_white"]
-            elif c_type == 'cardboard': 
-                col = THEME["gl_brown"]
-            else: 
-                col = THEME["gl_white"]
-
-            if face['type'] == 'side': col = THEME["gl_brown_dark"]
-            
-            alpha = 0.55 if self.transparency_mode else 1.0
-            glColor4f(col[0], col[1], col[2], alpha)
-            
-            nx, ny, nz = self.calc_normal(face['verts'])
-            glNormal3f(nx, ny, nz)
-            
-            if face['type'] in ['front', 'back']:
-                gluTessBeginPolygon(self.tess, None)
-                gluTessBeginContour(self.tess)
-                for v in face['verts']: gluTessVertex(self.tess, v, v)
-                gluTessEndContour(self.tess)
-                gluTessEndPolygon(self.tess)
-            else:
-                glBegin(GL_POLYGON)
-                for v in face['verts']: glVertex3f(v[0], v[1], v[2])
-                glEnd()
+        if self.fold_scene: self.draw_folded()
+        elif self.draw_ranges:
+            self.draw_panels()
+            if self.manager: self.draw_hinges() # La mesh di base ha gia' le cerniere
 
         # --- DISEGNO LINEE EXTRA (Es. Sfregamento Gessetto) ---
         if self.extra_lines: